@@ -0,0 +1,3 @@
+from .suite import run_benchmarks, compare, measure, \
+    bench_setup, bench_getitem, bench_loader, bench_detach, bench_fsmaml
+from .data import write_mnist, write_omniglot, BenchOmniglot
\ No newline at end of file
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+
+from .suite import run_benchmarks, compare
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pymel.bench",
+        description="Benchmarks the PyMel dataset and training stack on synthetic data"
+    )
+    parser.add_argument("--out", type=str, default="bench.json", help="where the JSON report is written")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument("--root", type=str, default=None, help="folder for the synthetic data (temporary by default)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on the number of synthetic samples")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4], help="DataLoader num_worker settings")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip", type=str, nargs="*", default=[],
+                        choices=["setup", "getitem", "loader", "detach", "fsmaml"])
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with 1 when a regression is found")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        root=args.root, scale=args.scale, num_workers=args.workers,
+        repeat=args.repeat, seed=args.seed, skip=args.skip
+    )
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), tolerance=args.tolerance)
+        regressions = [name for name, cmp in report["comparison"].items() if cmp["regression"]]
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=4)
+
+    for name, res in report["results"].items():
+        line = f"{name:<28} {res['value']:>12.3f} {res['unit']}"
+        if name in report.get("comparison", {}):
+            cmp = report["comparison"][name]
+            line += f"  x{cmp['ratio']:.2f} vs baseline" + ("  REGRESSION" if cmp["regression"] else "")
+        print(line)
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import os
+import io
+import time
+import platform
+import tempfile
+import contextlib
+import itertools
+from typing import *
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import transforms
+
+from pymel.config import DSConfigV2, TrainConfig
+from pymel.base_model import CNN_Mnist
+from pymel.method.gradient_based import FSMAML
+from pymel.dataset import MamlMnist
+from pymel.dataset.utils import single_task_detach, detach, episode_tasks, EpisodeCollate, \
+    BatchCompose, BatchToTensor, BatchNormalize
+
+from .data import write_mnist, write_omniglot, BenchOmniglot
+
+
+def result(value: float, unit: str, higher_is_better: bool = False, **extra: Any) -> Dict[str, Any]:
+    return {"value" : value, "unit" : unit, "higher_is_better" : higher_is_better, **extra}
+
+def measure(fn: Callable[[], Any], repeat: int = 20, warmup: int = 2) -> Dict[str, Any]:
+    """Median wall-clock time of ``fn`` in ms over ``repeat`` samples after ``warmup`` runs.
+
+    Like ``timeit``, calls faster than a millisecond are repeated inside
+    every sample so that timer resolution does not dominate the result.
+    """
+    start = time.perf_counter()
+    for _ in range(max(1, warmup)):
+        fn()
+    per_call = (time.perf_counter() - start) / max(1, warmup)
+    number = max(1, min(1000, int(1e-3 / max(per_call, 1e-9))))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append(1000 * (time.perf_counter() - start) / number)
+
+    times = np.array(times)
+    return result(
+        float(np.median(times)), "ms",
+        mean=float(times.mean()), std=float(times.std()), repeat=repeat, number=number
+    )
+
+def mnist_transforms() -> Tuple[Callable[..., Any]]:
+    return (
+        transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))]),
+        BatchCompose([BatchToTensor(), BatchNormalize((0.1307,), (0.3081,))])
+    )
+
+
+def bench_setup(root: str, k_shot: int = 5, k_query: int = 5, repeat: int = 5) -> Dict[str, Any]:
+    """Construction time of the MAML datasets, i.e. the cost of ``__setup__``."""
+    results = {
+        "setup/mnist" : measure(
+            lambda: MamlMnist(root=root, download=False, k_shot=k_shot, k_query=k_query),
+            repeat=repeat, warmup=1
+        )
+    }
+
+    def _omniglot_cold():
+        for path in BenchOmniglot(root=root, k_shot=k_shot, k_query=k_query, maml=False).__cache_paths__():
+            if os.path.exists(path):
+                os.remove(path)
+        BenchOmniglot(root=root, k_shot=k_shot, k_query=k_query)
+
+    results["setup/omniglot_cold"] = measure(_omniglot_cold, repeat=max(1, repeat // 2), warmup=0)
+    results["setup/omniglot_warm"] = measure(
+        lambda: BenchOmniglot(root=root, k_shot=k_shot, k_query=k_query),
+        repeat=repeat, warmup=1
+    )
+    return results
+
+def bench_getitem(datasets: Dict[str, Any], repeat: int = 200, seed: int = 0) -> Dict[str, Any]:
+    """Latency of a single ``__getitem__`` (one sample per class)."""
+    results = {}
+    for name, ds in datasets.items():
+        indices = itertools.cycle(np.random.default_rng(seed).integers(0, len(ds), repeat).tolist())
+        results[f"getitem/{name}"] = measure(lambda: ds[next(indices)], repeat=repeat, warmup=5)
+    return results
+
+def bench_loader(datasets: Dict[str, Any],
+                 num_workers: List[int] = [0, 2, 4],
+                 n_batch: int = 50) -> Dict[str, Any]:
+    """Meta-batches per second through a ``DataLoader`` for each ``num_worker``, startup included."""
+    results = {}
+    for name, ds in datasets.items():
+        for num_worker in num_workers:
+            train_dl = DataLoader(
+                ds, batch_size=ds.ks + ds.kq, num_workers=num_worker, collate_fn=EpisodeCollate()
+            )
+
+            n = 0
+            start = time.perf_counter()
+            for _ in train_dl:
+                n += 1
+                if n == n_batch:
+                    break
+            elapsed = time.perf_counter() - start
+
+            results[f"loader/{name}/w{num_worker}"] = result(n / elapsed, "batch/s", higher_is_better=True, n_batch=n)
+    return results
+
+def bench_detach(ds, repeat: int = 200) -> Dict[str, Any]:
+    """Cost of splitting a collated meta-batch into support/query sets."""
+    batch = next(iter(DataLoader(ds, batch_size=ds.ks + ds.kq, collate_fn=EpisodeCollate())))
+
+    def _single_task():
+        for task in episode_tasks(batch):
+            single_task_detach(batch_dict=batch, k_shot=ds.ks, k_query=ds.kq, task=task)
+
+    return {
+        "detach/single_task" : measure(_single_task, repeat=repeat, warmup=5),
+        "detach/batched" : measure(lambda: detach(batch_dict=batch, k_shot=ds.ks, k_query=ds.kq), repeat=repeat, warmup=5)
+    }
+
+def bench_fsmaml(train_ds, test_ds, save_dir: str, vmap: bool = False, seed: int = 0) -> Dict[str, Any]:
+    """First-order MAML meta-steps per second on cpu over one epoch, evaluation excluded."""
+    torch.manual_seed(seed)
+
+    ds_cfg = DSConfigV2(train_dataset=train_ds, test_dataset=test_ds, num_worker=0, pin_memory=False)
+    tr_cfg = TrainConfig(checkpoint=False, logging=True, save_dir=save_dir, profile=True)
+    trainer = FSMAML(
+        ds_cfg=ds_cfg, tr_cfg=tr_cfg, model=CNN_Mnist((1, 28, 28), train_ds.nt), gpus=[0],
+        meta_opt="adam", sp_opt="adam", outer_epoch=1, inner_epoch=1, vmap=vmap
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        trainer.single_train()
+
+    meters = trainer.profiler.meters
+    elapsed = sum(meter.sum for meter in meters.values())
+    steps = meters["meta_step"].count
+    return {
+        f"fsmaml/{'vmap' if vmap else 'loop'}" : result(
+            steps / elapsed, "step/s", higher_is_better=True,
+            n_step=steps, phases_ms={name : 1000 * meter.avg for name, meter in meters.items()}
+        )
+    }
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python" : platform.python_version(),
+        "torch" : torch.__version__,
+        "platform" : platform.platform(),
+        "cpu_count" : os.cpu_count(),
+        "num_threads" : torch.get_num_threads(),
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+def run_benchmarks(root: str = None,
+                   scale: float = 1.0,
+                   num_workers: List[int] = [0, 2, 4],
+                   repeat: int = 20,
+                   seed: int = 0,
+                   k_shot: int = 5,
+                   k_query: int = 5,
+                   skip: List[str] = []) -> Dict[str, Any]:
+    """Runs the whole suite on synthetic data and returns the JSON-ready report.
+
+    The data is written under ``root`` (a temporary folder by default).
+    ``scale`` multiplies the number of synthetic samples. A group of
+    benchmarks (``setup``, ``getitem``, ``loader``, ``detach``, ``fsmaml``)
+    can be left out with ``skip``.
+    """
+    with contextlib.ExitStack() as stack:
+        if root is None:
+            root = stack.enter_context(tempfile.TemporaryDirectory())
+
+        torch.manual_seed(seed)
+        write_mnist(root, n_train=int(6000 * scale), n_test=int(1000 * scale), seed=seed)
+        write_omniglot(root, n_alphabet=max(1, int(10 * scale)), seed=seed)
+
+        transform, batch_transform = mnist_transforms()
+        mnist = MamlMnist(root=root, download=False, transform=transform, k_shot=k_shot, k_query=k_query)
+        mnist_batch = MamlMnist(
+            root=root, download=False, batch_transform=batch_transform, k_shot=k_shot, k_query=k_query
+        )
+        mnist_cached = MamlMnist(
+            root=root, download=False, transform=transform, k_shot=k_shot, k_query=k_query, tensor_cache=True
+        )
+        omniglot = BenchOmniglot(
+            root=root, transform=transforms.ToTensor(), k_shot=k_shot, k_query=k_query
+        )
+        datasets = {"mnist" : mnist, "mnist_batch" : mnist_batch, "mnist_cached" : mnist_cached, "omniglot" : omniglot}
+
+        results = {}
+        if "setup" not in skip:
+            results.update(bench_setup(root, k_shot, k_query, repeat=max(1, repeat // 4)))
+        if "getitem" not in skip:
+            results.update(bench_getitem(datasets, repeat=10 * repeat, seed=seed))
+        if "loader" not in skip:
+            results.update(bench_loader(datasets, num_workers=num_workers))
+        if "detach" not in skip:
+            results.update(bench_detach(mnist, repeat=10 * repeat))
+        if "fsmaml" not in skip:
+            test_ds = MamlMnist(root=root, train=False, download=False, transform=transform, maml=False)
+            for vmap in [False, True]:
+                results.update(bench_fsmaml(mnist_batch, test_ds, root, vmap=vmap, seed=seed))
+
+    return {
+        "environment" : environment(),
+        "config" : {
+            "scale" : scale, "num_workers" : list(num_workers), "repeat" : repeat,
+            "seed" : seed, "k_shot" : k_shot, "k_query" : k_query
+        },
+        "results" : results
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1) -> Dict[str, Any]:
+    """Ratio of every shared metric against ``baseline``, flagged when worse by more than ``tolerance``."""
+    comparison = {}
+    for name, current in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+
+        base = baseline["results"][name]["value"]
+        ratio = current["value"] / base if base else float("inf")
+        if current["higher_is_better"]:
+            regression = ratio < 1 - tolerance
+        else:
+            regression = ratio > 1 + tolerance
+
+        comparison[name] = {
+            "value" : current["value"], "baseline" : base,
+            "ratio" : ratio, "regression" : regression
+        }
+    return comparison
@@ -22,6 +22,9 @@ class DSConfig:
                  merge_task:bool = True,
                  num_worker:int = os.cpu_count(),
                  pin_memory:bool = True,
+                 test_batch_size:int = 1000,
+                 batch_transform: Callable[..., Any] = None,
+                 tensor_cache: bool = False,
                  ) -> None:       
         
         if not isinstance(dataset, str):
@@ -41,7 +44,9 @@ class DSConfig:
                 k_query=k_query,
                 n_train_cls=n_train_cls,
                 merge_task=merge_task,
-                maml=True
+                maml=True,
+                batch_transform=batch_transform,
+                tensor_cache=tensor_cache
             )
             self.test_ds = ds_map[dataset](
                 root=root,
@@ -49,7 +54,8 @@ class DSConfig:
                 transform=transform,
                 target_transform=target_transform,
                 download=download,
-                maml=False
+                maml=False,
+                tensor_cache=tensor_cache
             )
         
         if not isinstance(num_worker, int):
@@ -65,6 +71,12 @@ class DSConfig:
         else:
             self.pm = pin_memory
         
+        if not isinstance(test_batch_size, int):
+            raise ValueError(f"test_batch_size must be an integer, \
+                but found {type(test_batch_size)} instead")
+        else:
+            self.test_bs = test_batch_size
+        
         self.config = {
             "dataset" : self.ds_name,
             "data_root_dir" : root,
@@ -73,13 +85,17 @@ class DSConfig:
             "k_query" : k_query,
             "n_way" : n_train_cls,
             "num_worker" : num_worker,
-            "pin_memory" : pin_memory
+            "pin_memory" : pin_memory,
+            "test_batch_size" : test_batch_size,
+            "tensor_cache" : tensor_cache
         }
         
         if transform is not None:
             self.config['transform'] = [x.__class__.__name__ for x in transform.transforms]
         if target_transform is not None:
             self.config['target_transofrm'] = [x.__class__.__name__ for x in target_transform.transforms]
+        if batch_transform is not None:
+            self.config['batch_transform'] = [x.__class__.__name__ for x in batch_transform.transforms]
     
     def config_export(self):
         return self.config
@@ -94,4 +110,7 @@ class DSConfig:
         return self.wk
     
     def get_pin_mem(self):
-        return self.pm
\ No newline at end of file
+        return self.pm
+    
+    def get_test_bs(self):
+        return self.test_bs
\ No newline at end of file
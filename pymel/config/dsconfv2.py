@@ -16,6 +16,7 @@ class DSConfigV2:
                  test_dataset: VisionDataset,
                  num_worker:int = os.cpu_count(),
                  pin_memory:bool = True,
+                 test_batch_size:int = 1000,
                  ) -> None:
         self.train_ds = train_dataset
         self.test_ds = test_dataset
@@ -33,6 +34,12 @@ class DSConfigV2:
         else:
             self.pm = pin_memory
         
+        if not isinstance(test_batch_size, int):
+            raise ValueError(f"test_batch_size must be an integer, \
+                but found {type(test_batch_size)} instead")
+        else:
+            self.test_bs = test_batch_size
+        
         self.config = {
             "dataset" : self.train_ds.__class__.__name__,
             "data_root_dir" : self.test_ds.root,
@@ -40,13 +47,18 @@ class DSConfigV2:
             "k_query" : self.train_ds.kq,
             "n_way" : self.train_ds.nt,
             "num_worker" : num_worker,
-            "pin_memory" : pin_memory
+            "pin_memory" : pin_memory,
+            "test_batch_size" : test_batch_size
         }
         
         if self.train_ds.transform is not None:
             self.config['transform'] = [x.__class__.__name__ for x in self.train_ds.transform.transforms]
         if self.train_ds.target_transform is not None:
             self.config['target_transofrm'] = [x.__class__.__name__ for x in self.train_ds.target_transform.transforms]
+        if getattr(self.train_ds, "batch_transform", None) is not None:
+            self.config['batch_transform'] = [x.__class__.__name__ for x in self.train_ds.batch_transform.transforms]
+        if getattr(self.train_ds, "tensor_cache", None) is not None:
+            self.config['tensor_cache'] = self.train_ds.tensor_cache.signature
         
     def config_export(self):
         return self.config
@@ -61,4 +73,7 @@ class DSConfigV2:
         return self.wk
     
     def get_pin_mem(self):
-        return self.pm
\ No newline at end of file
+        return self.pm
+    
+    def get_test_bs(self):
+        return self.test_bs
\ No newline at end of file
@@ -10,15 +10,25 @@ class TrainConfig:
                  save_dir: str = None,
                  save_best: bool = True,
                  extension:str = "pt",
-                 save_last: bool = False
+                 save_last: bool = False,
+                 async_save: bool = False,
+                 keep_last: int = 1,
+                 resume_every: int = 0,
+                 profile: bool = False,
+                 profile_ranges: bool = False
                  ) -> None:
         
-        for _varn, _var in zip(["checkpoint", "logging"], [checkpoint, logging]):
+        for _varn, _var in zip(
+            ["checkpoint", "logging", "profile", "profile_ranges"],
+            [checkpoint, logging, profile, profile_ranges]
+        ):
             if not isinstance(_var, bool):
                 raise TypeError(f"{_varn} must be a boolean, \
                     but found {type(_var)} instead")
         self.cp = checkpoint
         self.lg = logging
+        self.profile = profile
+        self.profile_ranges = profile_ranges
         
         if self.cp or self.lg:
             if save_dir is None:
@@ -41,6 +51,9 @@ class TrainConfig:
             self.sv_best = save_best
             self.sv_last = save_last
             self.ext = extension
+            self.async_save = async_save
+            self.keep_last = keep_last
+            self.resume_every = resume_every
             
     
     def folder_setup(self, method, dataset, k_shot, k_query):
@@ -73,6 +86,21 @@ class TrainConfig:
     def get_ext(self):
         return self.ext
     
+    def get_async_save(self):
+        return self.async_save
+    
+    def get_keep_last(self):
+        return self.keep_last
+    
+    def get_resume_every(self):
+        return self.resume_every if self.cp else 0
+    
+    def get_profile(self):
+        return self.profile
+    
+    def get_profile_ranges(self):
+        return self.profile_ranges
+    
     def get_sv_dir(self):
         return self.sv_dir
 
@@ -83,5 +111,10 @@ class TrainConfig:
             "save_dir" : self.sv_dir,
             "save_best" : self.sv_best,
             "save_last" : self.sv_last,
-            "extension" : self.ext
+            "extension" : self.ext,
+            "async_save" : self.async_save,
+            "keep_last" : self.keep_last,
+            "resume_every" : self.resume_every,
+            "profile" : self.profile,
+            "profile_ranges" : self.profile_ranges
         }
\ No newline at end of file
@@ -3,4 +3,5 @@ from .core import MAML_DATASET, MUL_PROC_MAML_DATASET, DIS_PROC_MAML_DATASET
 from .mnist import MamlMnist
 from .kmnist import MamlKMnist
 from .fmnist import MamlFMnist
-from .omniglot import MamlOmniglot
\ No newline at end of file
+from .omniglot import MamlOmniglot
+from .synthetic import SyntheticMamlDataset
\ No newline at end of file
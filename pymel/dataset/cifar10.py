@@ -3,9 +3,11 @@ sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
 from typing import Callable, Optional, Any, Tuple
 from torchvision.datasets import CIFAR10
 from PIL import Image
+import torch
 import random
 from torch.utils.data import DataLoader
 from .core import MUL_PROC_MAML_DATASET
+from .utils import TensorCache
 
 class MamlCifar10(CIFAR10, MUL_PROC_MAML_DATASET):
     def __init__(self, 
@@ -18,41 +20,67 @@ class MamlCifar10(CIFAR10, MUL_PROC_MAML_DATASET):
                  k_query: int = 5,
                  n_train_cls:int = -1,
                  merge_task:bool = True,
-                 maml: bool = True) -> None:
+                 maml: bool = True,
+                 batch_transform: Callable[..., Any] = None,
+                 tensor_cache: bool = False,
+                 cache_dtype: torch.dtype = torch.float16) -> None:
         super().__init__(root, train, transform, target_transform, download)
         
         self.check_int_arg(k_shot=k_shot, k_query=k_query, n_train_cls=n_train_cls)
-        self.check_bool_arg(merge_task=merge_task, maml = maml)
+        self.check_bool_arg(merge_task=merge_task, maml = maml, tensor_cache = tensor_cache)
         
         self.ks = k_shot
         self.kq = k_query
         self.nt = len(self.class_to_idx)
         self.mt = merge_task
         self.maml = maml
+        self.batch_transform = batch_transform
+        self.tensor_cache = self.__tensor_cache__(cache_dtype) if tensor_cache else None
         
         if maml:
             self.__setup__() 
     
+    def __tensor_cache__(self, dtype):
+        # one cache per split, next to the extracted batches
+        cache = TensorCache(
+            self.batch_transform if self.batch_transform is not None else self.transform,
+            batched=self.batch_transform is not None, dtype=dtype
+        )
+        split = "train" if self.train else "test"
+        path = os.path.join(self.root, self.base_folder, f"{split}_{cache.signature}.npy")
+        return cache.open(path, len(self.data), self.raw, mode="RGB")
+    
+    def raw(self, rows: torch.Tensor) -> torch.Tensor:
+        """The uint8 images of ``rows`` with shape ``(n, 3, 32, 32)``."""
+        return torch.from_numpy(self.data[rows.numpy()]).permute(0, 3, 1, 2)
+    
     def __setup__(self):
-        self.dict_ds = {
-            int(_cls) : [] for _cls in list(self.class_to_idx.values())
-        }        
-
-        for idx, _cls in enumerate(self.targets):
-            self.dict_ds[_cls].append(
-                Image.fromarray(self.data[idx], mode="RGB")
-            )
+        self.cls_idx, self.cls_off = self.build_cls_index(self.targets)
+        self.cls_tgt = torch.as_tensor(self.targets, dtype=torch.int64)
+        self.build_epoch_index(self.cls_idx, self.cls_off)
+    
+    def __episode__(self, episode: torch.Tensor):
+        # episode is an int64 (n_way, k_shot + k_query) table of row indices
+        classes = self.cls_tgt[episode[:, 0]].tolist()
         
-        self.max_sample = max([len(self.dict_ds[_cls]) for _cls in self.dict_ds])
-        self.sample_cls_cnt = self.max_sample + ((self.ks + self.kq) - self.max_sample % (self.ks + self.kq))
+        if self.tensor_cache is not None:
+            imgs = self.tensor_cache(episode)
+            return {_cls : imgs[idx] for idx, _cls in enumerate(classes)}
         
-        sampled_dict_ds = {
-            _cls : self.dict_ds[_cls] + random.sample(
-                self.dict_ds[_cls], k = self.sample_cls_cnt - len(self.dict_ds[_cls])
-            ) for _cls in list(self.dict_ds.keys())
+        if self.batch_transform is not None:
+            imgs = self.batch_transform(
+                torch.from_numpy(self.data[episode.numpy()]).permute(0, 1, 4, 2, 3)
+            )
+            return {_cls : imgs[idx] for idx, _cls in enumerate(classes)}
+        
+        imgs = [[
+            Image.fromarray(img, mode="RGB") for img in row] for row in self.data[episode.numpy()]
+        ]
+        return {
+            _cls : torch.stack(
+                [self.transform(img) for img in imgs[idx]]
+            ) if self.transform is not None else imgs[idx] for idx, _cls in enumerate(classes)
         }
-                
-        self.dict_ds = sampled_dict_ds
     
     def __len__(self) -> int:
         if self.maml:
@@ -60,20 +88,42 @@ class MamlCifar10(CIFAR10, MUL_PROC_MAML_DATASET):
         else:
             return super().__len__()
     
-    def __getitem__(self, index: int):
+    def __getitem__(self, index: int or torch.Tensor):
         if self.maml:
+            if torch.is_tensor(index) and index.dim() == 2:
+                return self.__episode__(index)
+            
             if index >= len(self):
                 raise ValueError("Data set index of out range")
             elif index == -1:
                 index = len(self) - 1      
             
+            if self.tensor_cache is not None:
+                imgs = self.tensor_cache(self.column(index))
+                return {_cls : imgs[_cls] for _cls in range(self.nt)}
+            
+            if self.batch_transform is not None:
+                # one vectorized call over the uint8 (#class, C, H, W) episode
+                imgs = self.batch_transform(
+                    torch.from_numpy(self.data[self.column(index).numpy()]).permute(0, 3, 1, 2)
+                )
+                return {_cls : imgs[_cls] for _cls in range(self.nt)}
+            
+            imgs = [
+                Image.fromarray(img, mode="RGB") for img in self.data[self.column(index).numpy()]
+            ]
             selected_dict = {
                 _cls : self.transform(
-                    self.dict_ds[_cls][index]
-                ) if self.transform is not None else self.dict_ds[_cls][index] for _cls in range(self.nt)
+                    imgs[_cls]
+                ) if self.transform is not None else imgs[_cls] for _cls in range(self.nt)
             }
             
             return selected_dict
+        elif self.tensor_cache is not None:
+            target = self.targets[index]
+            if self.target_transform is not None:
+                target = self.target_transform(target)
+            return self.tensor_cache(torch.tensor([index]))[0], target
         else:
             return super().__getitem__(index=index)
         
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os, sys
 from typing import *
+import torch
 
 class MAML_DATASET:
     def __init__(self) -> None:
@@ -18,6 +19,66 @@ class MAML_DATASET:
             if not isinstance(kwargs[arg], bool):
                 raise ValueError(f"{arg} must be boolean type but found {type(kwargs[arg])} instead")
     
+    def build_cls_index(self, targets):
+        """Groups sample indices by class without materializing any sample.
+
+        Returns a flat int64 tensor of sample indices sorted by class and an
+        offset tensor such that the samples of class ``c`` are
+        ``cls_idx[cls_off[c]:cls_off[c + 1]]``.
+        """
+        targets = torch.as_tensor(targets, dtype=torch.int64)
+        cls_idx = torch.argsort(targets, stable=True)
+        cls_cnt = torch.bincount(targets)
+        cls_off = torch.zeros(len(cls_cnt) + 1, dtype=torch.int64)
+        torch.cumsum(cls_cnt, dim=0, out=cls_off[1:])
+        return cls_idx, cls_off
+    
+    def build_epoch_index(self, cls_idx, cls_off):
+        """Class balancing by index arithmetic instead of a padded table.
+
+        Every class is virtually padded up to ``sample_cls_cnt`` (the largest
+        class rounded up to a multiple of ``k_shot + k_query``): position
+        ``j`` of class ``c`` is sample ``j mod cls_cnt[c]`` of the class in
+        the current epoch's order. ``set_epoch`` redraws that order, so only
+        one permutation of the real samples is stored and the repeated
+        samples change from epoch to epoch. The permutation seed is drawn
+        from the torch RNG once, so copies of the dataset (DataLoader
+        workers, distributed ranks) agree on every epoch.
+
+        Returns ``(max_sample, sample_cls_cnt)``.
+        """
+        self.cls_cnt = cls_off[1:] - cls_off[:-1]
+        self.max_sample = int(self.cls_cnt.max())
+        self.sample_cls_cnt = self.max_sample + ((self.ks + self.kq) - self.max_sample % (self.ks + self.kq))
+        self.index_seed = int(torch.randint(2**62, ()))
+        self.set_epoch(0)
+        
+        return self.max_sample, self.sample_cls_cnt
+    
+    def set_epoch(self, epoch: int):
+        """Shuffles the samples inside every class with the order of ``epoch``."""
+        generator = torch.Generator().manual_seed(self.index_seed + epoch)
+        segment = torch.repeat_interleave(torch.arange(len(self.cls_cnt), dtype=torch.float64), self.cls_cnt)
+        # a uniform key in [0, 1) on top of the class id keeps classes contiguous
+        order = torch.argsort(segment + torch.rand(len(segment), generator=generator, dtype=torch.float64))
+        self.epoch_idx = self.cls_idx[order]
+        self.epoch = epoch
+    
+    def gather(self, classes, positions):
+        """Sample indices at padded ``positions`` of ``classes`` (broadcast against each other)."""
+        return self.epoch_idx[self.cls_off[classes] + positions % self.cls_cnt[classes]]
+    
+    def column(self, index):
+        """Sample indices at padded position ``index`` of every class, one per class."""
+        return self.gather(torch.arange(len(self.cls_cnt)), index)
+    
+    @property
+    def idx_ds(self):
+        """The ``(#class, sample_cls_cnt)`` index table of the current epoch, materialized on access."""
+        return self.gather(
+            torch.arange(len(self.cls_cnt))[:, None], torch.arange(self.sample_cls_cnt)[None, :]
+        )
+    
     def __len__(self):
         raise NotImplementedError
     
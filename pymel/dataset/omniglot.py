@@ -9,6 +9,7 @@ from PIL import Image
 import random
 from torch.utils.data import DataLoader
 from .core import MUL_PROC_MAML_DATASET
+from .utils import LRUCache, TensorCache
 
 class MamlOmniglot(Omniglot, MUL_PROC_MAML_DATASET):
     def __init__(self, 
@@ -21,29 +22,66 @@ class MamlOmniglot(Omniglot, MUL_PROC_MAML_DATASET):
                  k_query: int = 5,
                  n_train_cls:int = -1,
                  merge_task:bool = True,
-                 maml: bool = True) -> None:
+                 maml: bool = True,
+                 batch_transform: Callable[..., Any] = None,
+                 lazy: bool = False,
+                 cache_bytes: int = 256 * 2**20,
+                 tensor_cache: bool = False,
+                 cache_dtype: torch.dtype = torch.float16) -> None:
         super().__init__(root, background, transform, target_transform, download)
     
         self.check_int_arg(k_shot=k_shot, k_query=k_query, n_train_cls=n_train_cls)
-        self.check_bool_arg(merge_task=merge_task, maml = maml)
+        self.check_bool_arg(merge_task=merge_task, maml = maml, lazy = lazy, tensor_cache = tensor_cache)
+        self.check_int_arg(cache_bytes=cache_bytes)
         
         self.ks = k_shot
         self.kq = k_query
-        self.nt = len(self.class_to_idx)
+        self.nt = len(self._characters)
         self.mt = merge_task
         self.maml = maml
-    
-    def __setup__(self):
+        self.batch_transform = batch_transform
+        self.lazy = lazy
+        self.cache = LRUCache(cache_bytes) if lazy else None
+        self.tensor_cache = self.__tensor_cache__(cache_dtype) if tensor_cache else None
         
-        int_cls = np.unique(
-            np.array(
-                [character_class for _, character_class in self._flat_character_images]
-            )
-        ).tolist()
-        
-        self.dict_ds = {
-            int(character_class) : [] for character_class in int_cls
-        }
+        if maml:
+            self.__setup__()
+    
+    def __tensor_cache__(self, dtype):
+        # one cache per image set, next to the uint8 cache
+        cache = TensorCache(
+            self.batch_transform if self.batch_transform is not None else self.transform,
+            batched=self.batch_transform is not None, dtype=dtype
+        )
+        path = os.path.join(self.root, f"{self._get_target_folder()}_{cache.signature}.npy")
+        return cache.open(path, len(self._flat_character_images), self.raw, mode="L")
+    
+    def raw(self, rows: torch.Tensor) -> torch.Tensor:
+        """The uint8 images of ``rows`` decoded from their pngs, with shape ``(n, 1, 105, 105)``."""
+        imgs = []
+        for row in rows.tolist():
+            image_name, character_class = self._flat_character_images[row]
+            image_path = os.path.join(self.target_folder, self._characters[character_class], image_name)
+            imgs.append(np.asarray(Image.open(image_path, mode="r").convert("L")))
+        return torch.from_numpy(np.stack(imgs)).unsqueeze(1)
+    
+    def __cache_paths__(self):
+        cache_name = self._get_target_folder()
+        return (
+            os.path.join(self.root, f"{cache_name}_cache.npy"),
+            os.path.join(self.root, f"{cache_name}_index.npy")
+        )
+    
+    def __build_cache__(self, data_path, index_path):
+        # decode every png once into a single (N, 105, 105) uint8 array, written
+        # to a temporary file first so that an interrupted run never leaves a
+        # truncated cache behind; the pid keeps concurrent builders (workers,
+        # ranks) off each other's files
+        data_tmp, index_tmp = data_path + f".{os.getpid()}.tmp", index_path + f".{os.getpid()}.tmp"
+        data = np.lib.format.open_memmap(
+            data_tmp, mode="w+", dtype=np.uint8,
+            shape=(len(self._flat_character_images), 105, 105)
+        )
         
         for index in range(len(self._flat_character_images)):
             image_name, character_class = self._flat_character_images[index]
@@ -51,20 +89,103 @@ class MamlOmniglot(Omniglot, MUL_PROC_MAML_DATASET):
             image_path = os.path.join(
                 self.target_folder, self._characters[character_class], image_name
             )
-            image = Image.open(image_path, mode="r").convert("L")
-            
-            self.dict_ds[int(character_class)].append(image)
-            
-        self.max_sample = max([len(self.dict_ds[_cls]) for _cls in self.dict_ds])
-        self.sample_cls_cnt = self.max_sample + ((self.ks + self.kq) - self.max_sample % (self.ks + self.kq))
+            data[index] = np.asarray(Image.open(image_path, mode="r").convert("L"))
         
-        sampled_dict_ds = {
-            _cls : self.dict_ds[_cls] + random.sample(
-                self.dict_ds[_cls], k = self.sample_cls_cnt - len(self.dict_ds[_cls])
-            ) for _cls in list(self.dict_ds.keys())
-        }
+        data.flush()
+        del data
+        
+        cls_cnt = np.array([len(images) for images in self._character_images], dtype=np.int64)
+        cls_off = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(cls_cnt)])
+        with open(index_tmp, "wb") as f:
+            np.save(f, cls_off)
+        
+        os.replace(data_tmp, data_path)
+        os.replace(index_tmp, index_path)
+    
+    def __cache_valid__(self, data, cls_off):
+        # a cache of another image set, size or dtype is rebuilt, not reused
+        n = len(self._flat_character_images)
+        return data.shape == (n, 105, 105) and data.dtype == np.uint8 \
+            and cls_off.shape == (self.nt + 1,) and cls_off[-1] == n
+    
+    def __setup__(self):
+        if self.lazy:
+            return self.__lazy_setup__()
         
-        self.dict_ds = sampled_dict_ds
+        data_path, index_path = self.__cache_paths__()
+        
+        if not (os.path.exists(data_path) and os.path.exists(index_path)):
+            self.__build_cache__(data_path, index_path)
+        
+        self.data = np.load(data_path, mmap_mode="r")
+        cls_off = np.load(index_path)
+        if not self.__cache_valid__(self.data, cls_off):
+            del self.data
+            self.__build_cache__(data_path, index_path)
+            self.data = np.load(data_path, mmap_mode="r")
+            cls_off = np.load(index_path)
+        
+        # _flat_character_images is ordered by class, so the cached rows are
+        # already grouped and the offsets fully describe the class index
+        self.cls_off = torch.from_numpy(cls_off)
+        self.cls_idx = torch.arange(self.data.shape[0], dtype=torch.int64)
+        self.cls_tgt = torch.repeat_interleave(
+            torch.arange(self.nt), self.cls_off[1:] - self.cls_off[:-1]
+        )
+        self.build_epoch_index(self.cls_idx, self.cls_off)
+    
+    def __lazy_setup__(self):
+        # only the image paths (grouped by class) are kept, pngs are decoded
+        # on first access and held in the LRU cache
+        self.data = None
+        self.paths = [
+            os.path.join(self.target_folder, self._characters[character_class], image_name)
+            for image_name, character_class in self._flat_character_images
+        ]
+        
+        cls_cnt = torch.tensor([len(images) for images in self._character_images], dtype=torch.int64)
+        self.cls_off = torch.zeros(len(cls_cnt) + 1, dtype=torch.int64)
+        torch.cumsum(cls_cnt, dim=0, out=self.cls_off[1:])
+        self.cls_idx = torch.arange(len(self.paths), dtype=torch.int64)
+        self.cls_tgt = torch.repeat_interleave(torch.arange(self.nt), cls_cnt)
+        self.build_epoch_index(self.cls_idx, self.cls_off)
+    
+    def decode(self, row: int) -> np.ndarray:
+        img = self.cache.get(row)
+        if img is None:
+            img = self.cache.put(row, np.asarray(Image.open(self.paths[row], mode="r").convert("L")))
+        return img
+    
+    def sample(self, index: torch.Tensor) -> np.ndarray:
+        """Returns the uint8 images of the row indices ``index`` with shape ``index.shape + (105, 105)``."""
+        if not self.lazy:
+            return self.data[index.numpy()]
+        
+        imgs = np.stack([self.decode(row) for row in index.reshape(-1).tolist()])
+        return imgs.reshape(*index.shape, *imgs.shape[1:])
+    
+    def __episode__(self, episode: torch.Tensor):
+        # episode is an int64 (n_way, k_shot + k_query) table of row indices
+        classes = self.cls_tgt[episode[:, 0]].tolist()
+        
+        if self.tensor_cache is not None:
+            imgs = self.tensor_cache(episode)
+            return {_cls : imgs[idx] for idx, _cls in enumerate(classes)}
+        
+        if self.batch_transform is not None:
+            imgs = self.batch_transform(
+                torch.from_numpy(self.sample(episode)).unsqueeze(2)
+            )
+            return {_cls : imgs[idx] for idx, _cls in enumerate(classes)}
+        
+        imgs = [[
+            Image.fromarray(img, mode="L") for img in row] for row in self.sample(episode)
+        ]
+        return {
+            _cls : torch.stack(
+                [self.transform(img) for img in imgs[idx]]
+            ) if self.transform is not None else imgs[idx] for idx, _cls in enumerate(classes)
+        }
     
     def __len__(self) -> int:
         if self.maml:
@@ -72,19 +193,41 @@ class MamlOmniglot(Omniglot, MUL_PROC_MAML_DATASET):
         else:
             return super().__len__()
     
-    def __getitem__(self, index: int):
+    def __getitem__(self, index: int or torch.Tensor):
         if self.maml:
+            if torch.is_tensor(index) and index.dim() == 2:
+                return self.__episode__(index)
+            
             if index >= len(self):
                 raise ValueError("Data set index of out range")
             elif index == -1:
                 index = len(self) - 1      
             
+            if self.tensor_cache is not None:
+                imgs = self.tensor_cache(self.column(index))
+                return {_cls : imgs[_cls] for _cls in range(self.nt)}
+            
+            if self.batch_transform is not None:
+                # one vectorized call over the uint8 (#class, C, H, W) episode
+                imgs = self.batch_transform(
+                    torch.from_numpy(self.sample(self.column(index))).unsqueeze(1)
+                )
+                return {_cls : imgs[_cls] for _cls in range(self.nt)}
+            
+            imgs = [
+                Image.fromarray(img, mode="L") for img in self.sample(self.column(index))
+            ]
             selected_dict = {
                 _cls : self.transform(
-                    self.dict_ds[_cls][index]
-                ) if self.transform is not None else self.dict_ds[_cls][index] for _cls in range(self.nt)
+                    imgs[_cls]
+                ) if self.transform is not None else imgs[_cls] for _cls in range(self.nt)
             }
             
             return selected_dict
+        elif self.tensor_cache is not None:
+            target = self._flat_character_images[index][1]
+            if self.target_transform is not None:
+                target = self.target_transform(target)
+            return self.tensor_cache(torch.tensor([index]))[0], target
         else:
             return super().__getitem__(index=index)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+import numpy as np
+import torch
+from .core import MUL_PROC_MAML_DATASET
+
+class SyntheticMamlDataset(MUL_PROC_MAML_DATASET):
+    """Seeded random images served through the MAML dataset interface, without any file.
+
+    Every class has a random uint8 prototype image and its samples are the
+    prototype plus uniform noise in ``[-noise, noise]``, so classes are
+    learnable. Samples ``c * n_sample ... (c + 1) * n_sample - 1`` belong
+    to class ``c``.
+
+    Sample ``j`` of class ``c`` is drawn from its own offset of the
+    ``PCG64([seed, c])`` stream, so ``lazy=True`` (nothing stored, every
+    sample generated on access) returns exactly the same images as the
+    default eager mode (all samples kept in one uint8 tensor). Use the lazy
+    mode for thousands of classes or large images.
+
+    Like the vision datasets, ``maml=False`` turns it into a plain
+    ``(image, target)`` classification dataset. ``transform`` is applied to
+    every ``(C, H, W)`` uint8 sample, ``batch_transform`` to whole
+    ``(*, C, H, W)`` batches.
+
+    Examples::
+        >>> train_ds = SyntheticMamlDataset(n_class=1000, n_sample=20, img_shape=(1, 28, 28), lazy=True,
+        ...                                 batch_transform=BatchCompose([BatchToTensor()]))
+        >>> test_ds = SyntheticMamlDataset(n_class=1000, n_sample=20, maml=False, seed=1,
+        ...                                batch_transform=BatchCompose([BatchToTensor()]))
+    """
+    def __init__(self,
+                 n_class: int = 10,
+                 n_sample: int = 100,
+                 img_shape: Tuple[int] = (1, 28, 28),
+                 noise: float = 32.0,
+                 seed: int = 0,
+                 lazy: bool = False,
+                 transform: Callable[..., Any] = None,
+                 target_transform: Callable[..., Any] = None,
+                 k_shot: int = 5,
+                 k_query: int = 5,
+                 n_train_cls:int = -1,
+                 merge_task:bool = True,
+                 maml: bool = True,
+                 batch_transform: Callable[..., Any] = None
+                 ) -> None:
+        self.check_int_arg(
+            n_class=n_class, n_sample=n_sample, seed=seed,
+            k_shot=k_shot, k_query=k_query, n_train_cls=n_train_cls
+        )
+        self.check_bool_arg(lazy=lazy, merge_task=merge_task, maml=maml)
+
+        if len(img_shape) == 2:
+            img_shape = (1,) + tuple(img_shape)
+        elif len(img_shape) != 3:
+            raise ValueError(f"img_shape must be (H, W) or (C, H, W), but found {img_shape} instead")
+
+        self.root = None
+        self.img_shape = tuple(img_shape)
+        self.noise = noise
+        self.seed = seed
+        self.lazy = lazy
+        self.n_sample = n_sample
+        self.transform = transform
+        self.target_transform = target_transform
+        self.batch_transform = batch_transform
+
+        self.ks = k_shot
+        self.kq = k_query
+        self.nt = n_class
+        self.mt = merge_task
+        self.maml = maml
+
+        self.targets = torch.arange(n_class).repeat_interleave(n_sample)
+        self.data = None if lazy else torch.cat(
+            [self.generate(_cls, torch.arange(n_sample)) for _cls in range(n_class)]
+        ).share_memory_()
+
+        if maml:
+            self.__setup__()
+
+    def generate(self, _cls: int, samples: torch.Tensor) -> torch.Tensor:
+        """Generates samples ``samples`` (positions inside class ``_cls``) as a uint8 ``(n, C, H, W)`` tensor."""
+        size = int(np.prod(self.img_shape))
+        bit_gen = np.random.PCG64([self.seed, _cls])
+        proto = np.floor(np.random.Generator(bit_gen).random(size) * 256)
+
+        if len(samples) == self.n_sample and bool((samples == torch.arange(self.n_sample)).all()):
+            # whole class at once, the stream continues right after the prototype
+            uni = np.random.Generator(bit_gen).random((self.n_sample, size))
+        else:
+            uni = np.empty((len(samples), size))
+            for row, sample in enumerate(samples.tolist()):
+                sample_gen = np.random.PCG64([self.seed, _cls])
+                sample_gen.advance(size * (1 + sample))
+                uni[row] = np.random.Generator(sample_gen).random(size)
+
+        imgs = np.clip(proto + (2 * uni - 1) * self.noise, 0, 255).astype(np.uint8)
+        return torch.from_numpy(imgs).view(len(samples), *self.img_shape)
+
+    def sample(self, index: torch.Tensor) -> torch.Tensor:
+        """Returns the uint8 images of the flat sample indices ``index`` with shape ``index.shape + (C, H, W)``."""
+        if not self.lazy:
+            return self.data[index]
+
+        flat = index.reshape(-1)
+        imgs = torch.empty((len(flat),) + self.img_shape, dtype=torch.uint8)
+        classes = torch.div(flat, self.n_sample, rounding_mode="floor")
+        for _cls in classes.unique().tolist():
+            mask = classes == _cls
+            imgs[mask] = self.generate(_cls, flat[mask] - _cls * self.n_sample)
+        return imgs.view(*index.shape, *self.img_shape)
+
+    def apply_transform(self, imgs: torch.Tensor) -> torch.Tensor:
+        if self.batch_transform is not None:
+            return self.batch_transform(imgs)
+        if self.transform is not None:
+            out = torch.stack([self.transform(img) for img in imgs.reshape(-1, *self.img_shape)])
+            return out.view(*imgs.shape[:-3], *out.shape[1:])
+        return imgs
+
+    def __setup__(self):
+        self.cls_idx, self.cls_off = self.build_cls_index(self.targets)
+        self.cls_tgt = self.targets
+        self.build_epoch_index(self.cls_idx, self.cls_off)
+
+    def __episode__(self, episode: torch.Tensor):
+        # episode is an int64 (n_way, k_shot + k_query) table of sample indices
+        classes = self.cls_tgt[episode[:, 0]].tolist()
+        imgs = self.apply_transform(self.sample(episode))
+        return {_cls : imgs[idx] for idx, _cls in enumerate(classes)}
+
+    def __len__(self) -> int:
+        if self.maml:
+            return self.sample_cls_cnt
+        else:
+            return len(self.targets)
+
+    def __getitem__(self, index: int or torch.Tensor):
+        if self.maml:
+            if torch.is_tensor(index) and index.dim() == 2:
+                return self.__episode__(index)
+
+            if index >= len(self):
+                raise ValueError("Data set index of out range")
+            elif index == -1:
+                index = len(self) - 1
+
+            imgs = self.apply_transform(self.sample(self.column(index)))
+            return {_cls : imgs[_cls] for _cls in range(self.nt)}
+        else:
+            img = self.apply_transform(self.sample(torch.tensor([index])))[0]
+            target = int(self.targets[index])
+            if self.target_transform is not None:
+                target = self.target_transform(target)
+            return img, target
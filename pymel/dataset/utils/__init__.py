@@ -1,2 +1,5 @@
-from .helper import maml_detach, detach, single_task_detach
-from .sampler import MamlBatchSampler
\ No newline at end of file
+from .helper import maml_detach, detach, single_task_detach, is_episode, episode_tasks, \
+    EpisodeCollate, episode_collate, stack_episodes, LRUCache, TensorCache
+from .sampler import MamlBatchSampler, EpisodicSampler
+from .transform import BatchCompose, BatchToTensor, BatchNormalize, \
+    BatchRandomHorizontalFlip, BatchRandomCrop
\ No newline at end of file
@@ -1 +1,4 @@
-from .detach import detach, maml_detach, single_task_detach
\ No newline at end of file
+from .detach import detach, maml_detach, single_task_detach, is_episode, episode_tasks
+from .collate import EpisodeCollate, episode_collate, stack_episodes
+from .cache import LRUCache
+from .tensor_cache import TensorCache
\ No newline at end of file
@@ -0,0 +1,89 @@
+import os, sys
+from typing import *
+from collections import OrderedDict
+import numpy as np
+import torch
+
+
+def nbytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by the total size of its values in bytes.
+
+    Values larger than ``max_bytes`` are never stored. ``hits``, ``misses``
+    and ``evictions`` count the cache traffic. Every DataLoader worker holds
+    its own copy, so the budget applies per process.
+
+    Examples::
+        >>> cache = LRUCache(max_bytes=256 * 2**20)
+        >>> img = cache.get(index)
+        >>> if img is None:
+        >>>     img = cache.put(index, decode(index))
+    """
+    def __init__(self, max_bytes: int = 256 * 2**20) -> None:
+        if not isinstance(max_bytes, int):
+            raise TypeError(f"max_bytes must be an int, \
+                but found {type(max_bytes)} instead")
+
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return value
+
+        if key in self.entries:
+            self.nbytes -= nbytes(self.entries.pop(key))
+        while self.nbytes + size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= nbytes(old)
+            self.evictions += 1
+
+        self.entries[key] = value
+        self.nbytes += size
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "evictions" : self.evictions,
+            "hit_rate" : self.hits / total if total > 0 else 0.0,
+            "entries" : len(self.entries),
+            "nbytes" : self.nbytes,
+            "max_bytes" : self.max_bytes
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(max_bytes={self.max_bytes}, entries={len(self)}, " \
+            f"hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,63 @@
+import os, sys
+from typing import *
+import torch
+
+
+class EpisodeCollate:
+    """Collates MAML samples into one contiguous ``(x, y)`` episode.
+
+    ``x`` has shape ``(n_way, k_shot + k_query, C, H, W)`` and ``y`` holds
+    the ``n_way`` class labels, so support and query sets are plain slices
+    ``x[:, :k_shot]`` / ``x[:, k_shot:]``. The input can either be the list
+    of per-index dicts produced by ``batch_size=k_shot + k_query``, or one
+    ``{class: samples}`` episode as produced by ``EpisodicSampler`` with
+    ``batch_size=None`` or by the default collate function.
+
+    An optional ``batch_transform`` is applied once to the whole ``x``.
+
+    Examples::
+        >>> dl = DataLoader(train_ds, batch_size=k_shot + k_query, collate_fn=EpisodeCollate())
+        >>> for x, y in dl:
+        >>>     sp_x, qr_x = x[:, :k_shot], x[:, k_shot:]
+    """
+    def __init__(self, batch_transform: Callable[..., Any] = None) -> None:
+        self.batch_transform = batch_transform
+    
+    def __call__(self, batch: List[Dict[int, torch.Tensor]] or Dict[int, torch.Tensor]) -> Tuple[torch.Tensor]:
+        if isinstance(batch, dict):
+            classes = list(batch.keys())
+            samples = [batch[_cls] for _cls in classes]
+        elif isinstance(batch, (list, tuple)) and len(batch) > 0 and isinstance(batch[0], dict):
+            classes = list(batch[0].keys())
+            # class-major order so that the stacked tensor is already laid
+            # out as (n_way, k_shot + k_query, ...) without a transpose copy
+            samples = [sample[_cls] for _cls in classes for sample in batch]
+        else:
+            raise TypeError(f"batch must be a dict or a list of dicts, but found {type(batch)} instead")
+        
+        if not all(torch.is_tensor(sample) for sample in samples):
+            raise TypeError("EpisodeCollate requires tensor samples, set transform or batch_transform in the dataset")
+        
+        x = torch.stack(samples)
+        if not isinstance(batch, dict):
+            x = x.view(len(classes), len(batch), *x.shape[1:])
+        y = torch.tensor(classes, dtype=torch.int64)
+        
+        if self.batch_transform is not None:
+            x = self.batch_transform(x)
+        
+        return (x, y)
+
+
+def episode_collate(batch: List[Dict[int, torch.Tensor]] or Dict[int, torch.Tensor]) -> Tuple[torch.Tensor]:
+    return EpisodeCollate()(batch)
+
+
+def stack_episodes(batch: List[Dict[int, torch.Tensor]]) -> torch.Tensor:
+    """Stacks ``{class: samples}`` episodes into one ``(#episode, n_way, k_shot + k_query, ...)`` tensor.
+
+    Use it as ``collate_fn`` with an ``EpisodicSampler`` and ``batch_size=#episode``.
+    Classes are relabelled by their position in the episode, so labels are
+    implied by the layout and not returned.
+    """
+    return torch.stack([episode_collate(episode)[0] for episode in batch])
@@ -3,12 +3,20 @@ from typing import *
 import torch
 import random
 
+def is_episode(batch_dict) -> bool:
+    """True for the contiguous ``(x, y)`` layout produced by ``EpisodeCollate``."""
+    return isinstance(batch_dict, (tuple, list)) and len(batch_dict) == 2 \
+        and torch.is_tensor(batch_dict[0]) and torch.is_tensor(batch_dict[1])
+
 def detach(
-    batch_dict: Dict[int, List[torch.Tensor]] = None, 
+    batch_dict: Dict[int, List[torch.Tensor]] or Tuple[torch.Tensor] = None, 
     k_shot:int = None, 
     k_query:int = None
-    ) -> Tuple[Dict[int, List[torch.Tensor]]]:
-    sample_len = len(batch_dict[list(batch_dict.keys())[0]])
+    ) -> Tuple[Dict[int, List[torch.Tensor]]] or Tuple[torch.Tensor]:
+    if is_episode(batch_dict):
+        sample_len = batch_dict[0].shape[1]
+    else:
+        sample_len = len(batch_dict[list(batch_dict.keys())[0]])
     
     if k_shot + k_query > sample_len:
         raise ValueError(f"Many data to unpack. Since #sample in support set: k_shot and #sample \
@@ -19,6 +27,11 @@ def detach(
             totally are less than the #sample available in batch task dict. The redundant samples are \
                 used in automatically used in query set.")
     
+    if is_episode(batch_dict):
+        # slicing the (n_way, k_shot + k_query, ...) tensor only creates views
+        x, _ = batch_dict
+        return (x[:, :k_shot], x[:, k_shot:])
+    
     support_dct = {
         _cls : batch_dict[_cls][:k_shot] for _cls in batch_dict
     }
@@ -29,8 +42,14 @@ def detach(
     
     return (support_dct, query_dct)
 
+def episode_tasks(batch_dict) -> List[int]:
+    """Task (class) labels of a batch, in either layout."""
+    if is_episode(batch_dict):
+        return batch_dict[1].tolist()
+    return list(batch_dict.keys())
+
 def maml_detach(
-    batch_dict: Dict[int, List[torch.Tensor]] = None, 
+    batch_dict: Dict[int, List[torch.Tensor]] or Tuple[torch.Tensor] = None, 
     k_shot:int = None, 
     k_query:int = None,
     task:int = None
@@ -44,9 +63,20 @@ def maml_detach(
     
     if not isinstance(task, int):
         raise ValueError(f"task arg must be integer type but found {type(task)} instead")
-    elif task not in batch_dict.keys():
+    elif task not in episode_tasks(batch_dict):
         raise Exception(f"Found no task {task} in batch dict")
     
+    if is_episode(batch_dict):
+        _, y = batch_dict
+        is_task = (y == task).float()
+        
+        support_x = support_dct.flatten(0, 1)
+        support_y = is_task.repeat_interleave(k_shot)
+        query_x = query_dct.flatten(0, 1)
+        query_y = is_task.repeat_interleave(query_dct.shape[1])
+        
+        return (support_x, support_y, query_x, query_y)
+    
     tasks = list(batch_dict.keys())
     
     support_x, support_y, query_x, query_y = [], [], [], []
@@ -77,7 +107,7 @@ def maml_detach(
     return (support_x, support_y, query_x, query_y)
 
 def single_task_detach(
-    batch_dict: Dict[int, List[torch.Tensor]] = None, 
+    batch_dict: Dict[int, List[torch.Tensor]] or Tuple[torch.Tensor] = None, 
     k_shot:int = None, 
     k_query:int = None,
     task:int = None
@@ -91,9 +121,20 @@ def single_task_detach(
     
     if not isinstance(task, int):
         raise ValueError(f"task arg must be integer type but found {type(task)} instead")
-    elif task not in batch_dict.keys():
+    elif task not in episode_tasks(batch_dict):
         raise Exception(f"Found no task {task} in batch dict")
     
+    if is_episode(batch_dict):
+        _, y = batch_dict
+        pos = episode_tasks(batch_dict).index(task)
+        
+        support_x = support_dct[pos]
+        support_y = y[pos].expand(support_x.shape[0])
+        query_x = query_dct[pos]
+        query_y = y[pos].expand(query_x.shape[0])
+        
+        return (support_x, support_y, query_x, query_y)
+    
     support_x, support_y, query_x, query_y = [], [], [], []
     
     support_x.extend(support_dct[task])
@@ -0,0 +1,140 @@
+import os, sys
+import hashlib
+from typing import *
+import numpy as np
+import torch
+from PIL import Image
+
+
+# transforms whose output only depends on their input, matched by class name
+# so that torchvision and the batch transforms are both covered
+DETERMINISTIC = (
+    "ToTensor", "PILToTensor", "ConvertImageDtype", "Normalize", "Resize", "CenterCrop", "Grayscale",
+    "BatchToTensor", "BatchNormalize"
+)
+TO_TENSOR = ("ToTensor", "PILToTensor")
+
+
+class TensorCache:
+    """Memory-mapped tensors of the deterministic prefix of a transform pipeline.
+
+    The leading transforms listed in ``DETERMINISTIC`` (e.g. ``ToTensor`` and
+    ``Normalize``) are applied once to every sample and the float results are
+    stored in a ``.npy`` file opened with ``mmap_mode="r"``. The remaining
+    transforms, typically random augmentations, still run on every access on
+    top of the cached tensors, so no PIL work is left after the cache exists.
+
+    The file name holds ``signature``, a hash of the ``repr`` of the cached
+    transforms and of ``dtype``, so changing the transform builds a new file
+    instead of reusing stale tensors. ``float16`` halves the file size at the
+    cost of ~3 significant digits; cached values are returned as float32.
+
+    ``load`` maps int64 row indices to uint8 images of shape ``(n, C, H, W)``;
+    for a torchvision ``transform`` they are converted to PIL images of
+    ``mode`` first, a ``batched`` transform gets the uint8 tensor directly.
+
+    Examples::
+        >>> cache = TensorCache(transform, dtype=torch.float16)
+        >>> cache.open(os.path.join(root, f"MamlMnist_train_{cache.signature}.npy"), len(data), load, mode="L")
+        >>> imgs = cache(index)  # (*index.shape, C, H, W) float32
+    """
+    def __init__(self,
+                 transform: Callable[..., Any],
+                 batched: bool = False,
+                 dtype: torch.dtype = torch.float16) -> None:
+        if dtype not in (torch.float16, torch.float32):
+            raise ValueError(f"dtype must be torch.float16 or torch.float32, \
+                but found {dtype} instead")
+
+        transforms = list(getattr(transform, "transforms", [transform] if transform is not None else []))
+        n = 0
+        while n < len(transforms) and transforms[n].__class__.__name__ in DETERMINISTIC:
+            n += 1
+
+        if not batched:
+            # a torchvision prefix is only cacheable up to the point where
+            # the PIL image has been turned into a tensor
+            names = [t.__class__.__name__ for t in transforms[:n]]
+            if not any(name in TO_TENSOR for name in names):
+                raise ValueError(f"the deterministic prefix of the transform must convert the image to a tensor, \
+                    but found {names} instead")
+
+        self.batched = batched
+        self.dtype = dtype
+        self.prefix = transforms[:n]
+        self.rest = transforms[n:]
+        self.data = None
+
+        key = "|".join([repr(t) for t in self.prefix] + [str(dtype)])
+        self.signature = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def apply(self, transforms: List[Callable[..., Any]], x: Any) -> Any:
+        for t in transforms:
+            x = t(x)
+        return x
+
+    def encode(self, imgs: torch.Tensor, mode: str = None) -> torch.Tensor:
+        """Applies the cached prefix to a uint8 ``(n, C, H, W)`` chunk."""
+        if self.batched:
+            return self.apply(self.prefix, imgs)
+        return torch.stack([
+            self.apply(self.prefix, Image.fromarray(img.permute(1, 2, 0).squeeze(-1).numpy(), mode=mode))
+            for img in imgs
+        ])
+
+    def build(self, path: str, n: int, load: Callable[[torch.Tensor], torch.Tensor],
+              mode: str = None, chunk_size: int = 1024) -> None:
+        # renamed into place once complete, the pid keeps processes that
+        # build the same cache from writing into one file
+        tmp = path + f".{os.getpid()}.tmp"
+        data = None
+        for begin in range(0, n, chunk_size):
+            out = self.encode(load(torch.arange(begin, min(begin + chunk_size, n))), mode)
+
+            if data is None:
+                data = np.lib.format.open_memmap(
+                    tmp, mode="w+", dtype=torch.empty((), dtype=self.dtype).numpy().dtype,
+                    shape=(n,) + tuple(out.shape[1:])
+                )
+            data[begin:begin + len(out)] = out.to(self.dtype).numpy()
+
+        data.flush()
+        del data
+        os.replace(tmp, path)
+
+    def open(self, path: str, n: int, load: Callable[[torch.Tensor], torch.Tensor],
+             mode: str = None, chunk_size: int = 1024) -> "TensorCache":
+        """Maps the cache file at ``path``, building it first if it is missing or stale.
+
+        A file is stale unless it holds ``n`` rows of the shape the prefix
+        gives the first sample, in ``dtype``.
+        """
+        shape = (n,) + tuple(self.encode(load(torch.arange(1)), mode).shape[1:])
+        dtype = torch.empty((), dtype=self.dtype).numpy().dtype
+
+        self.data = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        if self.data is None or self.data.shape != shape or self.data.dtype != dtype:
+            self.data = None
+            self.build(path, n, load, mode, chunk_size)
+            self.data = np.load(path, mmap_mode="r")
+
+        self.path = path
+        return self
+
+    def __call__(self, index: torch.Tensor) -> torch.Tensor:
+        """Cached tensors of the row indices ``index`` with the remaining transforms applied."""
+        imgs = torch.from_numpy(self.data[index.numpy()]).to(torch.float32)
+        if len(self.rest) == 0:
+            return imgs
+        if self.batched:
+            return self.apply(self.rest, imgs)
+
+        out = torch.stack([self.apply(self.rest, img) for img in imgs.reshape(-1, *imgs.shape[-3:])])
+        return out.view(*index.shape, *out.shape[1:])
+
+    def __len__(self) -> int:
+        return 0 if self.data is None else self.data.shape[0]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(signature={self.signature}, prefix={self.prefix}, " \
+            f"rest={self.rest}, dtype={self.dtype})"
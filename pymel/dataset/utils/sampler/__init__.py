@@ -1 +1,2 @@
-from .maml_batch_sampler import MamlBatchSampler
\ No newline at end of file
+from .maml_batch_sampler import MamlBatchSampler
+from .episodic_sampler import EpisodicSampler
\ No newline at end of file
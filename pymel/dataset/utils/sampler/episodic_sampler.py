@@ -0,0 +1,86 @@
+import os, sys
+from typing import Iterator
+from typing import *
+
+import torch
+from torch.utils.data.sampler import Sampler
+
+class EpisodicSampler(Sampler[torch.Tensor]):
+    """Draws N-way (K + Q)-shot episodes straight from the per-class index.
+
+    Every item is an int64 tensor of shape ``(n_way, k_shot + k_query)``
+    holding dataset row indices, one row per randomly drawn class, which the
+    ``Maml*`` datasets accept as ``__getitem__`` index. Use it with
+    ``batch_size=None`` so that every item is one episode.
+
+    Examples::
+        >>> sampler = EpisodicSampler(train_ds, n_way=5, seed=0)
+        >>> dl = DataLoader(train_ds, sampler=sampler, batch_size=None)
+    
+    Without ``seed`` every pass draws fresh episodes. With a ``seed`` the
+    stream is reproducible and changes with ``set_epoch``; passing a
+    different ``rank`` per process (or worker) with a shared ``seed`` gives
+    every process its own reproducible episode stream.
+    """
+    def __init__(self, 
+                 data_source = None,
+                 n_way: int = 5,
+                 k_shot: int = None,
+                 k_query: int = None,
+                 n_episode: int = None,
+                 seed: int = None,
+                 rank: int = 0) -> None:
+        super().__init__()
+        
+        if not hasattr(data_source, "cls_idx"):
+            raise ValueError("data_source must provide a class index, construct it with maml=True")
+        
+        self.ds = data_source
+        self.ks = self.ds.ks if k_shot is None else k_shot
+        self.kq = self.ds.kq if k_query is None else k_query
+        self.bs = self.ks + self.kq
+        
+        self.cls_idx = self.ds.cls_idx
+        self.cls_off = self.ds.cls_off
+        self.cls_cnt = self.cls_off[1:] - self.cls_off[:-1]
+        
+        if n_way > len(self.cls_cnt):
+            raise ValueError(f"n_way: {n_way} is larger than the number of classes: {len(self.cls_cnt)}")
+        elif int(self.cls_cnt.min()) < self.bs:
+            raise ValueError(f"Every class needs at least k_shot + k_query: {self.bs} samples, \
+                but found a class with {int(self.cls_cnt.min())} samples")
+        self.nw = n_way
+        
+        if n_episode is None:
+            n_episode = len(self.cls_idx) // (self.nw * self.bs)
+        self.ne = n_episode
+        
+        self.seed = seed
+        self.rank = rank
+        self.epoch = 0
+    
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+    
+    def __len__(self) -> int:
+        return self.ne
+    
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        g = torch.Generator()
+        if self.seed is None:
+            g.seed()
+        else:
+            g.manual_seed(self.seed + self.rank + 1000003 * self.epoch)
+        
+        max_cnt = int(self.cls_cnt.max())
+        pos = torch.arange(max_cnt)
+        for _ in range(self.ne):
+            classes = torch.randperm(len(self.cls_cnt), generator=g)[:self.nw]
+            
+            # k_shot + k_query distinct positions per class in one shot: random
+            # keys for every slot, invalid slots pushed past the valid ones
+            keys = torch.rand((self.nw, max_cnt), generator=g)
+            keys.masked_fill_(pos >= self.cls_cnt[classes, None], 2.0)
+            slots = keys.topk(self.bs, dim=1, largest=False).indices
+            
+            yield self.cls_idx[self.cls_off[classes, None] + slots]
@@ -1,7 +1,5 @@
 import os, sys
 from typing import Iterator
-sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
-sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-2]))
 from typing import *
 
 from torch.utils.data.sampler import Sampler
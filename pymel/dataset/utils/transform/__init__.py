@@ -0,0 +1,2 @@
+from .batch_transform import BatchCompose, BatchToTensor, BatchNormalize, \
+    BatchRandomHorizontalFlip, BatchRandomCrop
\ No newline at end of file
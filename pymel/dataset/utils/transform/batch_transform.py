@@ -0,0 +1,119 @@
+import os, sys
+from typing import *
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+
+class BatchCompose:
+    """Chains batch transforms, the batched counterpart of ``transforms.Compose``.
+
+    Every transform takes a tensor of shape ``(*, C, H, W)`` so the same
+    pipeline can be applied to a single episode ``(#class, k, C, H, W)``
+    inside a dataset or collate function, or to a whole batch after the
+    DataLoader. ``BatchCompose([])`` returns its input untouched, which is
+    how raw uint8 episodes are obtained for a deferred transform.
+
+    Examples::
+        >>> transform = BatchCompose([
+        >>>     BatchToTensor(),
+        >>>     BatchNormalize((0.1307,), (0.3081,))
+        >>> ])
+        >>> episode = transform(uint8_episode)
+    """
+    def __init__(self, transforms: List[Callable[..., Any]]) -> None:
+        self.transforms = transforms
+    
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        for t in self.transforms:
+            x = t(x)
+        return x
+    
+    def __repr__(self) -> str:
+        body = "".join([f"\n    {t}" for t in self.transforms])
+        return f"{self.__class__.__name__}({body}\n)"
+
+
+class BatchToTensor:
+    """Converts a uint8 batch ``(*, C, H, W)`` into float32 in ``[0, 1]``."""
+    def __call__(self, x: torch.Tensor or np.ndarray) -> torch.Tensor:
+        if isinstance(x, np.ndarray):
+            x = torch.from_numpy(x)
+        if x.dtype == torch.uint8:
+            return x.to(torch.float32).div_(255)
+        return x.to(torch.float32)
+    
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}()"
+
+
+class BatchNormalize:
+    """Normalizes a float batch ``(*, C, H, W)`` with per-channel mean and std."""
+    def __init__(self, mean: Sequence[float], std: Sequence[float], inplace: bool = False) -> None:
+        self.mean = tuple(mean)
+        self.std = tuple(std)
+        self.inplace = inplace
+        
+        self._mean = torch.tensor(self.mean, dtype=torch.float32).view(-1, 1, 1)
+        self._std = torch.tensor(self.std, dtype=torch.float32).view(-1, 1, 1)
+    
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        mean = self._mean.to(device=x.device, dtype=x.dtype)
+        std = self._std.to(device=x.device, dtype=x.dtype)
+        if self.inplace:
+            return x.sub_(mean).div_(std)
+        return (x - mean) / std
+    
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(mean={self.mean}, std={self.std})"
+
+
+class BatchRandomHorizontalFlip:
+    """Flips every image of a batch ``(*, C, H, W)`` independently with probability ``p``."""
+    def __init__(self, p: float = 0.5) -> None:
+        self.p = p
+    
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        mask = torch.rand(x.shape[:-3], device=x.device) < self.p
+        return torch.where(mask[..., None, None, None], x.flip(-1), x)
+    
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(p={self.p})"
+
+
+class BatchRandomCrop:
+    """Crops every image of a batch ``(*, C, H, W)`` at an independent random offset.
+
+    The batch is padded once and all crops are gathered with a single
+    advanced-indexing call instead of one crop per image.
+    """
+    def __init__(self, size: int or Tuple[int, int], padding: int = 0, fill: float = 0) -> None:
+        self.size = (size, size) if isinstance(size, int) else tuple(size)
+        self.padding = padding
+        self.fill = fill
+    
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        lead, (c, h, w) = x.shape[:-3], x.shape[-3:]
+        th, tw = self.size
+        
+        x = x.reshape(-1, c, h, w)
+        if self.padding > 0:
+            x = F.pad(x, [self.padding] * 4, value=self.fill)
+            h, w = h + 2 * self.padding, w + 2 * self.padding
+        
+        if h < th or w < tw:
+            raise ValueError(f"crop size {self.size} is larger than the padded image size {(h, w)}")
+        
+        n = x.shape[0]
+        top = torch.randint(0, h - th + 1, (n, 1), device=x.device)
+        left = torch.randint(0, w - tw + 1, (n, 1), device=x.device)
+        rows = top + torch.arange(th, device=x.device)
+        cols = left + torch.arange(tw, device=x.device)
+        
+        out = x[
+            torch.arange(n, device=x.device)[:, None, None], :, rows[:, :, None], cols[:, None, :]
+        ]
+        return out.permute(0, 3, 1, 2).reshape(*lead, c, th, tw)
+    
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(size={self.size}, padding={self.padding})"
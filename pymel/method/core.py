@@ -2,14 +2,22 @@ import os, sys
 sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
 from typing import *
 from config import DSConfig, TrainConfig
-from utils import ModelCheckPoint
+from utils import ModelCheckPoint, PhaseProfiler, AverageMeter, InnerLoop, Evaluator, EpisodicEvaluator, load_sharded
+from dataset.utils import detach, single_task_detach, episode_tasks, EpisodeCollate, EpisodicSampler, stack_episodes
+from contextlib import nullcontext
+import math
+import random
+import time
+from collections import deque
 import torch
 from torch import nn
 from torch.optim import *
+from torch.utils.data import DataLoader
 import numpy as np
 
 opt_mapping = {
-    'adam' : Adam
+    'adam' : Adam,
+    'sgd' : SGD
 }
 
 class Trainer:
@@ -27,13 +35,20 @@ class Trainer:
         
         self.ds_cfg = ds_cfg
         self.tr_cfg = tr_cfg
+        self.resume_state = None
+        self.profiler = PhaseProfiler(
+            enabled = self.tr_cfg.get_profile(),
+            record_ranges = self.tr_cfg.get_profile_ranges()
+        )
         
         if self.tr_cfg.checkpoint():
             self.checker = ModelCheckPoint(
                 save_dir = self.tr_cfg.get_sv_dir(),
                 save_best = self.tr_cfg.get_sv_best(),
                 save_last = self.tr_cfg.get_sv_last(),
-                extension = self.tr_cfg.get_ext()
+                extension = self.tr_cfg.get_ext(),
+                async_save = self.tr_cfg.get_async_save(),
+                keep_last = self.tr_cfg.get_keep_last()
             )
         
         if model is None:
@@ -44,7 +59,7 @@ class Trainer:
         else:
             self.model = model
             
-        if len(gpus) > torch.cuda.device_count():
+        if torch.cuda.is_available() and len(gpus) > torch.cuda.device_count():
             raise ValueError(f"PyMel GPT: The number of availabel GPUs: \
                 {torch.cuda.is_available()} but found required {len(gpus)}\
                     in gpus: {gpus}")
@@ -57,6 +72,94 @@ class Trainer:
         else:
             self.gpus = gpus            
     
+    def resume(self, path: str) -> Tuple[int]:
+        """Loads a state written by ``save_resume``, the next training run restarts from it.
+        
+        ``path`` is either the ``resume`` checkpoint directory or the experiment
+        directory holding it. The run continues in that experiment directory
+        instead of the fresh one made by ``folder_setup``, so checkpoints,
+        their ``keep_last`` rotation and the profile stay in one place.
+        Returns the ``(epoch, step)`` training continues at.
+        """
+        path = path.rstrip("/")
+        if os.path.isdir(path + "/resume"):
+            path = path + "/resume"
+        self.resume_state = load_sharded(path)
+        
+        # the still empty folder made by folder_setup for this run is dropped
+        fresh_dir = getattr(self.tr_cfg, "exp_dir", None)
+        if fresh_dir is not None and os.path.isdir(fresh_dir) and len(os.listdir(fresh_dir)) == 0:
+            os.rmdir(fresh_dir)
+        
+        exp_dir = os.path.dirname(path)
+        self.tr_cfg.exp_dir = exp_dir
+        if self.tr_cfg.checkpoint():
+            self.checker.set_save_dir(exp_dir)
+        return self.resume_state["epoch"], self.resume_state["step"]
+    
+    def restore(self, model: nn.Module, optimizer: torch.optim.Optimizer) -> Tuple[int]:
+        """Applies the pending ``resume`` state and returns the ``(epoch, step)`` to start from."""
+        state = self.resume_state
+        if state is None:
+            return 0, 0
+        
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        
+        random.setstate(state["rng"]["random"])
+        np.random.set_state(state["rng"]["numpy"])
+        torch.set_rng_state(state["rng"]["torch"])
+        if state["rng"]["cuda"] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state["rng"]["cuda"])
+        
+        # the episode order of an epoch comes from the dataset's index seed,
+        # which is drawn from the torch RNG when the dataset is built
+        train_ds = self.ds_cfg.train_ds
+        train_ds.index_seed = state["index_seed"]
+        train_ds.set_epoch(state["epoch"])
+        
+        if self.tr_cfg.checkpoint():
+            self.checker.old_loss, self.checker.old_acc = state["best"]
+            self.checker.last_paths = deque(state["last_paths"])
+        
+        self.resume_state = None
+        return state["epoch"], state["step"]
+    
+    def save_resume(self, model: nn.Module, optimizer: torch.optim.Optimizer, epoch: int, step: int):
+        """Saves everything needed to continue training at meta-step ``step`` of ``epoch``."""
+        if not self.tr_cfg.checkpoint():
+            return
+        
+        # the last-file rotation is only up to date once the pending write is done
+        self.checker.flush()
+        self.checker.save_resume({
+            "epoch" : epoch,
+            "step" : step,
+            "model" : model.state_dict(),
+            "optimizer" : optimizer.state_dict(),
+            "rng" : {
+                "random" : random.getstate(),
+                "numpy" : np.random.get_state(),
+                "torch" : torch.get_rng_state(),
+                "cuda" : torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None
+            },
+            "index_seed" : self.ds_cfg.train_ds.index_seed,
+            "best" : (self.checker.old_loss, self.checker.old_acc),
+            "last_paths" : list(self.checker.last_paths)
+        })
+    
+    def describe(self) -> str:
+        dsn = self.ds_cfg.config["dataset"]
+        ks = self.ds_cfg.get_k_shot()
+        kq = self.ds_cfg.get_k_query()
+        return f"Method: {self.method} - Dataset: {dsn} - ks: {ks} - kq: {kq}"
+    
+    def export_profile(self, name: str = "profile") -> Dict[str, Dict[str, float]]:
+        """Writes the per-phase timings to ``{exp_dir}/{name}.json`` and ``.csv``."""
+        if not self.profiler.enabled:
+            return {}
+        return self.profiler.export(self.tr_cfg.exp_dir, name)
+    
     def train(self):
         raise NotImplementedError()
     
@@ -68,4 +171,461 @@ class Trainer:
             "training_config" : self.tr_cfg.config_export(),
             "dataset_config" : self.ds_cfg.config_export(),
             "gpus" : self.gpus
-        }
\ No newline at end of file
+        }
+
+
+class GradientTrainer(Trainer):
+    """Base of the trainers that adapt every task with an ``InnerLoop``.
+    
+    ``single_train`` is the shared meta-training loop: every meta-batch is
+    turned into a meta-gradient in the flat gradient buffer of the inner
+    loop by ``meta_batch`` and applied by the meta optimizer, with
+    evaluation, checkpoints, resume states and the step profile handled
+    here. The wall time of every meta-batch is kept in ``step_time``
+    whether or not profiling is enabled. ``meta_batch`` runs ``vmap_step`` with ``vmap`` and ``loop_step``
+    otherwise, both backpropagate the query loss to ``meta_inputs`` and
+    add the gradients up with ``accumulate``. Subclasses set ``method`` and
+    override these hooks, ``build_inner_loop`` and ``epoch_log`` where
+    they differ.
+    """
+    method = None
+    vmap = False
+    
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 1e-4,
+                 sp_opt: str = "sgd",
+                 sp_lr: float = 0.01,
+                 sp_wd: float = 0.0,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 inner_epoch: int = 1,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        super().__init__(ds_cfg, tr_cfg, model, gpus)
+        
+        os.environ["CUDA_VISIBLE_DEVICES"] = ",".join([str(x) for x in gpus])
+        
+        for optn, opt in zip(["meta_opt", "sp_opt"], [meta_opt, sp_opt]):
+            if not isinstance(opt, str):
+                raise TypeError(f"PyMel GPT: {optn} must be a string, \
+                    but found {type(opt)} instead")
+        
+        for name, value in zip(
+            ["meta_lr", "meta_wd", "sp_lr", "sp_wd"],
+            [meta_lr, meta_wd, sp_lr, sp_wd]
+        ):
+            if not isinstance(value, float):
+                raise TypeError(f"PyMel GPT: {name} must be a float, \
+                    but found {type(value)} instead")
+        
+        if not isinstance(criterion, torch.nn.Module):
+            raise TypeError(f"PyMel GPT: criterion must be a torch.nn.Module, \
+                but found {type(criterion)} instead")
+        
+        for name, var in zip(
+            ["outer_epoch", "inner_epoch"],
+            [outer_epoch, inner_epoch]
+        ):
+            if not isinstance(var, int):
+                raise TypeError(f"PyMel GPT: {name} must be an int, \
+                    but found {type(var)} instead")
+        
+        self.meta_opt = meta_opt
+        self.sp_opt = sp_opt
+        self.meta_lr = meta_lr
+        self.meta_wd = meta_wd
+        self.sp_lr = sp_lr
+        self.sp_wd = sp_wd
+        self.crit = criterion
+        self.outer_epoch = outer_epoch
+        self.inner_epoch = inner_epoch
+        self.ep_eval = episodic_eval
+        self.tr_cfg.folder_setup(
+            method=self.method,
+            dataset=self.ds_cfg.config["dataset"],
+            k_shot=self.ds_cfg.get_k_shot(),
+            k_query=self.ds_cfg.get_k_query()
+        )
+        if self.tr_cfg.checkpoint():
+            self.checker.set_save_dir(self.tr_cfg.exp_dir)
+    
+    def describe(self) -> str:
+        return super().describe() + f" - inner steps: {self.inner_epoch}"
+    
+    def build_inner_loop(self, model: nn.Module) -> InnerLoop:
+        return InnerLoop(
+            model=model,
+            criterion=self.crit,
+            opt=self.sp_opt,
+            lr=self.sp_lr,
+            weight_decay=self.sp_wd,
+            steps=self.inner_epoch,
+            first_order=True
+        )
+    
+    def make_task_pool(self, inner_loop: InnerLoop, device: torch.device):
+        """Context manager yielding the worker pool handed to ``meta_batch``, none by default."""
+        return nullcontext()
+    
+    def zero_grad(self, inner_loop: InnerLoop) -> None:
+        # every .grad is a view of one flat buffer, optimizer.zero_grad
+        # would unbind them
+        inner_loop.flat.zero_grad()
+    
+    def epoch_log(self, model: nn.Module, device: torch.device) -> str:
+        """Extra ``" - name: value"`` fields of the epoch log line."""
+        return ""
+    
+    def meta_batch(self, inner_loop, data_dict, task_pool=None):
+        """Accumulates the summed meta-gradient of a meta-batch, returns the summed query loss."""
+        if self.vmap:
+            return self.vmap_step(inner_loop, data_dict)
+        return self.loop_step(inner_loop, data_dict)
+    
+    def meta_inputs(self, inner_loop, params):
+        """Tensors the query loss is differentiated w.r.t., the initial fast weights by default."""
+        return (params,)
+    
+    def accumulate(self, inner_loop, grads):
+        inner_loop.flat.grad.add_(grads[0])
+    
+    def single_train(self):
+        
+        print(self.describe())
+        
+        batch_size = self.ds_cfg.get_k_shot() + self.ds_cfg.get_k_query()
+        
+        evaluator = Evaluator(
+            criterion=self.crit,
+            batch_size=self.ds_cfg.get_test_bs(),
+            num_worker=self.ds_cfg.get_wk(),
+            pin_memory=self.ds_cfg.get_pin_mem()
+        )
+        
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu", index=self.gpus[0])
+        
+        global_model = self.model.to(device)
+        
+        meta_optimizer = opt_mapping[self.meta_opt](
+            global_model.parameters(),
+            lr=self.meta_lr, weight_decay=self.meta_wd
+        )
+        
+        inner_loop = self.build_inner_loop(global_model)
+        self.zero_grad(inner_loop)
+        
+        start_epoch, start_step = self.restore(global_model, meta_optimizer)
+        resume_every = self.tr_cfg.get_resume_every()
+        
+        num_task = self.ds_cfg.train_ds.nt
+        self.step_time = AverageMeter()
+        with self.make_task_pool(inner_loop, device) as task_pool:
+            for epoch in range(start_epoch, self.outer_epoch):
+                global_model.train()
+                self.ds_cfg.train_ds.set_epoch(epoch)
+                if device.type == "cuda":
+                    torch.cuda.reset_peak_memory_stats(device)
+                
+                # a resumed epoch skips the meta-batches that were already done
+                # without loading them
+                train_dl = DataLoader(
+                    dataset=self.ds_cfg.train_ds,
+                    batch_size=batch_size,
+                    sampler=range(start_step * batch_size, len(self.ds_cfg.train_ds)),
+                    num_workers=self.ds_cfg.get_wk(),
+                    pin_memory=self.ds_cfg.get_pin_mem(),
+                    collate_fn=EpisodeCollate()
+                )
+                
+                metaloss = 0.0
+                self.step_time.reset()
+                for train_idx, data_dict in enumerate(self.profiler.iterate(train_dl, "data"), start=start_step):
+                    with self.profiler.phase("to_device"):
+                        data_dict = tuple(data.to(device) for data in data_dict)
+                    
+                    start = time.perf_counter()
+                    metaloss = self.meta_batch(inner_loop, data_dict, task_pool)
+                    
+                    with self.profiler.phase("meta_step"):
+                        meta_optimizer.step()
+                        self.zero_grad(inner_loop)
+                    
+                    if device.type == "cuda":
+                        torch.cuda.synchronize(device)
+                    self.step_time.update(time.perf_counter() - start)
+                    
+                    if resume_every > 0 and (train_idx + 1) % resume_every == 0:
+                        self.save_resume(global_model, meta_optimizer, epoch, train_idx + 1)
+                start_step = 0
+                
+                test_loss, test_acc = evaluator(global_model, self.ds_cfg.test_ds, device)
+                log = f"Epoch: {epoch} - MetaLoss: {metaloss/num_task}{self.epoch_log(global_model, device)} - Test Loss: {test_loss} - Test Acc: {test_acc}%"
+                
+                if self.ep_eval is not None:
+                    ep_acc, ep_ci = self.ep_eval(inner_loop, device)
+                    log += f" - Episode Acc: {ep_acc:.2f} +- {ep_ci:.2f}%"
+                
+                print(log)
+                
+                if self.tr_cfg.checkpoint():
+                    self.checker(global_model, loss=[test_loss], acc=[test_acc], optimizer=meta_optimizer, epoch=epoch)
+                if resume_every > 0:
+                    self.save_resume(global_model, meta_optimizer, epoch + 1, 0)
+        
+        if self.tr_cfg.checkpoint():
+            self.checker.flush()
+        self.export_profile()
+    
+    def loop_step(self, inner_loop, data_dict):
+        # adapts the tasks of the meta-batch one by one and accumulates the
+        # summed meta-gradient
+        metaloss = 0.0
+        for task in episode_tasks(data_dict):
+            with self.profiler.phase("detach"):
+                sp_x, sp_y, qr_x, qr_y = single_task_detach(
+                    batch_dict=data_dict,
+                    k_shot=self.ds_cfg.get_k_shot(),
+                    k_query=self.ds_cfg.get_k_query(),
+                    task=task
+                )
+            
+            # fast weights start as views of the global weights, in
+            # second-order mode the graph runs through every inner step
+            with self.profiler.phase("adapt"):
+                params = inner_loop.init_params()
+                fast_params = inner_loop.adapt(params, sp_x, sp_y)
+            
+            with self.profiler.phase("query_backward"):
+                qr_loss = inner_loop.loss(fast_params, qr_x, qr_y)
+                metaloss += qr_loss.item()
+                grads = torch.autograd.grad(qr_loss, self.meta_inputs(inner_loop, params))
+            
+            with self.profiler.phase("accumulate"):
+                self.accumulate(inner_loop, grads)
+        
+        return metaloss
+    
+    def vmap_step(self, inner_loop, data_dict):
+        # adapts every task of the meta-batch in a single vmapped call and
+        # accumulates the summed meta-gradient
+        ks = self.ds_cfg.get_k_shot()
+        _, y = data_dict
+        with self.profiler.phase("detach"):
+            sp_x, qr_x = detach(
+                batch_dict=data_dict,
+                k_shot=ks,
+                k_query=self.ds_cfg.get_k_query()
+            )
+            sp_y = y[:, None].expand(-1, sp_x.shape[1])
+            qr_y = y[:, None].expand(-1, qr_x.shape[1])
+        
+        with self.profiler.phase("adapt"):
+            params = inner_loop.init_params()
+            qr_losses, _ = inner_loop.adapt_batch(params, sp_x, sp_y, qr_x, qr_y)
+            qr_loss = qr_losses.sum()
+        
+        with self.profiler.phase("query_backward"):
+            grads = torch.autograd.grad(qr_loss, self.meta_inputs(inner_loop, params))
+        
+        with self.profiler.phase("accumulate"):
+            self.accumulate(inner_loop, grads)
+        
+        return qr_loss.item()
+
+
+class EpisodicTrainer(Trainer):
+    """Base of the trainers fitted end to end on ``EpisodicSampler`` episodes.
+    
+    Every step scores a meta-batch of ``episode_batch`` N-way episodes with
+    ``episode_logits`` and backpropagates the query cross-entropy, there is
+    no inner loop. With an ``EpisodicEvaluator`` its episodes are scored
+    every epoch and drive the checkpoints, otherwise the training loss and
+    accuracy do. Subclasses set ``method`` and implement ``episode_logits``.
+    """
+    method = None
+    
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 1e-4,
+                 n_way: int = 5,
+                 n_episode: int = None,
+                 episode_batch: int = 4,
+                 seed: int = None,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        super().__init__(ds_cfg, tr_cfg, model, gpus)
+        
+        os.environ["CUDA_VISIBLE_DEVICES"] = ",".join([str(x) for x in gpus])
+        
+        if not isinstance(meta_opt, str):
+            raise TypeError(f"PyMel GPT: meta_opt must be a string, \
+                but found {type(meta_opt)} instead")
+        
+        for name, value in zip(["meta_lr", "meta_wd"], [meta_lr, meta_wd]):
+            if not isinstance(value, float):
+                raise TypeError(f"PyMel GPT: {name} must be a float, \
+                    but found {type(value)} instead")
+        
+        if not isinstance(criterion, torch.nn.Module):
+            raise TypeError(f"PyMel GPT: criterion must be a torch.nn.Module, \
+                but found {type(criterion)} instead")
+        
+        for name, var in zip(
+            ["n_way", "episode_batch", "outer_epoch"],
+            [n_way, episode_batch, outer_epoch]
+        ):
+            if not isinstance(var, int):
+                raise TypeError(f"PyMel GPT: {name} must be an int, \
+                    but found {type(var)} instead")
+        
+        self.meta_opt = meta_opt
+        self.meta_lr = meta_lr
+        self.meta_wd = meta_wd
+        self.n_way = n_way
+        self.n_episode = n_episode
+        self.eb = episode_batch
+        self.seed = seed
+        self.crit = criterion
+        self.outer_epoch = outer_epoch
+        self.ep_eval = episodic_eval
+        self.tr_cfg.folder_setup(
+            method=self.method,
+            dataset=self.ds_cfg.config["dataset"],
+            k_shot=self.ds_cfg.get_k_shot(),
+            k_query=self.ds_cfg.get_k_query()
+        )
+        if self.tr_cfg.checkpoint():
+            self.checker.set_save_dir(self.tr_cfg.exp_dir)
+    
+    def describe(self) -> str:
+        return super().describe() + f" - n_way: {self.n_way}"
+    
+    def episode_logits(self, model: nn.Module, x: torch.Tensor, k_shot: int) -> torch.Tensor:
+        """Query logits ``(#episode, n_way * k_query, #class)`` of a ``(#episode, n_way, k_shot + k_query, ...)`` batch."""
+        raise NotImplementedError()
+    
+    def eval_logits(self, model: nn.Module, episodes: torch.Tensor, device: torch.device) -> torch.Tensor:
+        """Query logits of a chunk of ``episodic_eval`` episodes, given as index tables."""
+        x = stack_episodes([self.ep_eval.ds[episode] for episode in episodes])
+        return self.episode_logits(model, x.to(device), self.ep_eval.ks)
+    
+    def query_labels(self, n_way: int, k_query: int, device: torch.device) -> torch.Tensor:
+        return torch.arange(n_way, device=device).repeat_interleave(k_query)
+    
+    def evaluate(self, model: nn.Module, device: torch.device) -> Tuple[float]:
+        """Scores the ``episodic_eval`` episodes, returns ``(loss, acc in %, 95% CI of acc)``."""
+        ep_eval = self.ep_eval
+        episodes = ep_eval.episodes()
+        qr_y = self.query_labels(ep_eval.nw, ep_eval.kq, device)
+        
+        was_training = model.training
+        model.eval()
+        
+        losses, accs = [], []
+        with torch.inference_mode():
+            for start in range(0, len(episodes), ep_eval.eb):
+                logits = self.eval_logits(model, episodes[start:start + ep_eval.eb], device)
+                
+                losses.append(self.crit(logits.flatten(0, 1), qr_y.repeat(len(logits))) * len(logits))
+                accs.append(logits.argmax(-1).eq(qr_y).float().mean(-1))
+        
+        model.train(was_training)
+        
+        accs = torch.cat(accs).cpu()
+        loss = torch.stack(losses).sum().item() / len(accs)
+        ci95 = 1.96 * accs.std().item() / math.sqrt(len(accs)) if len(accs) > 1 else 0.0
+        return loss, 100 * accs.mean().item(), 100 * ci95
+    
+    def single_train(self):
+        
+        ks = self.ds_cfg.get_k_shot()
+        kq = self.ds_cfg.get_k_query()
+        print(self.describe())
+        
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu", index=self.gpus[0])
+        
+        global_model = self.model.to(device)
+        
+        meta_optimizer = opt_mapping[self.meta_opt](
+            global_model.parameters(),
+            lr=self.meta_lr, weight_decay=self.meta_wd
+        )
+        
+        sampler = EpisodicSampler(
+            self.ds_cfg.train_ds, n_way=self.n_way, k_shot=ks, k_query=kq,
+            n_episode=self.n_episode, seed=self.seed
+        )
+        qr_y = self.query_labels(self.n_way, kq, device)
+        
+        start_epoch, start_step = self.restore(global_model, meta_optimizer)
+        resume_every = self.tr_cfg.get_resume_every()
+        
+        for epoch in range(start_epoch, self.outer_epoch):
+            global_model.train()
+            sampler.set_epoch(epoch)
+            
+            # a resumed epoch skips the meta-batches that were already done,
+            # episodes are only index tables so drawing them all is cheap
+            train_dl = DataLoader(
+                dataset=self.ds_cfg.train_ds,
+                batch_size=self.eb,
+                sampler=list(sampler)[start_step * self.eb:],
+                num_workers=self.ds_cfg.get_wk(),
+                pin_memory=self.ds_cfg.get_pin_mem(),
+                collate_fn=stack_episodes
+            )
+            
+            # summed on device and read back once per epoch
+            loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+            correct = torch.zeros((), dtype=torch.int64, device=device)
+            total = 0
+            for train_idx, x in enumerate(self.profiler.iterate(train_dl, "data"), start=start_step):
+                with self.profiler.phase("to_device"):
+                    x = x.to(device, non_blocking=True)
+                
+                with self.profiler.phase("forward"):
+                    logits = self.episode_logits(global_model, x, ks)
+                
+                with self.profiler.phase("backward"):
+                    loss = self.crit(logits.flatten(0, 1), qr_y.repeat(len(logits)))
+                    loss.backward()
+                
+                with self.profiler.phase("meta_step"):
+                    meta_optimizer.step()
+                    meta_optimizer.zero_grad()
+                
+                loss_sum += loss.detach() * qr_y.numel() * len(logits)
+                correct += logits.detach().argmax(-1).eq(qr_y).sum()
+                total += qr_y.numel() * len(logits)
+                
+                if resume_every > 0 and (train_idx + 1) % resume_every == 0:
+                    self.save_resume(global_model, meta_optimizer, epoch, train_idx + 1)
+            start_step = 0
+            
+            loss_sum, correct = torch.stack([loss_sum, correct.to(loss_sum.dtype)]).tolist()
+            train_loss, train_acc = loss_sum / max(total, 1), 100 * correct / max(total, 1)
+            log = f"Epoch: {epoch} - MetaLoss: {train_loss} - Train Acc: {train_acc}%"
+            
+            if self.ep_eval is not None:
+                test_loss, test_acc, test_ci = self.evaluate(global_model, device)
+                log += f" - Test Loss: {test_loss} - Episode Acc: {test_acc:.2f} +- {test_ci:.2f}%"
+            else:
+                test_loss, test_acc = train_loss, train_acc
+            
+            print(log)
+            
+            if self.tr_cfg.checkpoint():
+                self.checker(global_model, loss=[test_loss], acc=[test_acc], optimizer=meta_optimizer, epoch=epoch)
+            if resume_every > 0:
+                self.save_resume(global_model, meta_optimizer, epoch + 1, 0)
+        
+        if self.tr_cfg.checkpoint():
+            self.checker.flush()
+        self.export_profile()
\ No newline at end of file
@@ -1 +1,2 @@
-from .fsmaml import FSMAML
\ No newline at end of file
+from .fsmaml import FSMAML
+from .maml import MAML
\ No newline at end of file
@@ -2,24 +2,25 @@ import os, sys
 sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
 from typing import *
 from random import randint
+from contextlib import nullcontext
 import argparse
 from tqdm import tqdm
-import copy
 
 from pymel.config import DSConfig, TrainConfig
-from core import Trainer, opt_mapping
-from dataset.utils import single_task_detach
+from core import GradientTrainer, opt_mapping
+from utils import Evaluator, EpisodicEvaluator, TaskPool
+from dataset.utils import single_task_detach, episode_tasks, EpisodeCollate
 
 import torch
 from torch import nn
 import torch.multiprocessing as mp
 import torch.distributed as dist
 from torch.utils.data import DataLoader
-from torch.nn.parallel import DistributedDataParallel as DDP
-from torch.utils.data.distributed import DistributedSampler
 
 
-class FSMAML(Trainer):
+class FSMAML(GradientTrainer):
+    method = "fsmaml"
+
     def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig, 
                  model: nn.Module = None, gpus: List[int] = ...,
                  meta_opt: str = None, 
@@ -30,286 +31,189 @@ class FSMAML(Trainer):
                  sp_wd: float = 1e-4,
                  criterion: torch.nn.Module = nn.CrossEntropyLoss(),
                  outer_epoch: int = 100,
-                 inner_epoch: int = 1
+                 inner_epoch: int = 1,
+                 vmap: bool = False,
+                 num_proc: int = 0,
+                 episodic_eval: EpisodicEvaluator = None
                  ) -> None:
-        super().__init__(ds_cfg, tr_cfg, model, gpus)
-        
-        os.environ["CUDA_VISIBLE_DEVICES"] = ",".join([str(x) for x in gpus])
-        
-        self.ds_cfg = ds_cfg
-        self.tr_cfg = tr_cfg
-        self.model = model
-        self.gpus = gpus
-        
-        for optn, opt in zip(["meta_opt", "sp_opt"], [meta_opt, sp_opt]):
-            if not isinstance(opt, str):
-                raise TypeError(f"PyMel GPT: {optn} must be a string, \
-                    but found {type(opt)} instead")
-            elif opt is None:
-                raise ValueError(f"PyMel GPT: {optn} cannot be a None")
-        
-        for name, value in zip(
-            ["meta_lr", "meta_wd", "sp_lr", "sp_wd"],
-            [meta_lr, meta_wd, sp_lr, sp_wd]
-        ):
-            if not isinstance(value, float):
-                raise TypeError(f"PyMel GPT: {name} must be a float, \
-                    but found {type(value)} instead")
-        
-        if not isinstance(criterion, torch.nn.Module):
-            raise TypeError(f"PyMel GPT: {criterion} must be a float, \
-                but found {type(criterion)} instead")
-        
-        for name, var in zip(
-            ["outer_epoch", "inner_epoch"],
-            [outer_epoch, inner_epoch]
-        ):
-            if not isinstance(var, int):
-                raise TypeError(f"PyMel GPT: {name} must be an int, \
-                        but found {type(var)} instead")
-        
-        self.meta_opt = meta_opt
-        self.sp_opt = sp_opt
-        self.meta_lr = meta_lr
-        self.meta_wd = meta_wd
-        self.sp_lr = sp_lr
-        self.sp_wd = sp_wd
-        self.crit = criterion        
-        self.outer_epoch = outer_epoch
-        self.inner_epoch = inner_epoch
-        self.method = "fsmaml"
-        self.tr_cfg.folder_setup(
-            method=self.method, 
-            dataset=self.ds_cfg.config["dataset"],
-            k_shot=self.ds_cfg.get_k_shot(),
-            k_query=self.ds_cfg.get_k_query()
-        )
+        if not isinstance(vmap, bool):
+            raise TypeError(f"PyMel GPT: vmap must be a boolean, \
+                but found {type(vmap)} instead")
+        
+        if not isinstance(num_proc, int):
+            raise TypeError(f"PyMel GPT: num_proc must be an int, \
+                but found {type(num_proc)} instead")
+        
+        self.vmap = vmap
+        self.num_proc = num_proc
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         sp_opt=sp_opt, sp_lr=sp_lr, sp_wd=sp_wd, criterion=criterion,
+                         outer_epoch=outer_epoch, inner_epoch=inner_epoch, episodic_eval=episodic_eval)
     
-    def single_train(self):
-        
-        dsn = self.ds_cfg.config["dataset"]
-        ks = self.ds_cfg.get_k_shot()
-        kq = self.ds_cfg.get_k_query()
-        print(f"Method: {self.method} - Dataset: {dsn} - ks: {ks} - kq: {kq}")
-        
-        batch_size = ks + kq
-        train_dl = DataLoader(
-            dataset=self.ds_cfg.train_ds, 
-            batch_size=batch_size, 
-            num_workers=self.ds_cfg.get_wk(), 
-            pin_memory=self.ds_cfg.get_pin_mem(), 
-        )
-        
-        test_dl = DataLoader(
-            dataset=self.ds_cfg.test_ds,
-            batch_size=1,
-            num_workers=self.ds_cfg.get_wk(), 
-            pin_memory=self.ds_cfg.get_pin_mem(),
-        )
-        
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu", index=self.gpus[0])
-        
-        global_model = self.model.to(device)
-        
-        meta_optimizer = opt_mapping[self.meta_opt](
-            global_model.parameters(), 
-            lr=self.meta_lr, weight_decay=self.meta_wd
-        )
-        
-        num_task = self.ds_cfg.train_ds.nt
-        for epoch in range(self.outer_epoch):
-            global_model.train()
-            
-            for train_idx, data_dict in enumerate(train_dl):
-                
-                metaloss = 0.0
-                for task in data_dict:
-                    task_model = copy.deepcopy(global_model)
-                    task_optimizer = opt_mapping[self.meta_opt](
-                        task_model.parameters(), 
-                        lr=self.sp_lr, weight_decay=self.sp_wd
-                    )
-                    
-                    sp_x, sp_y, qr_x, qr_y = single_task_detach(
-                        batch_dict=data_dict,
-                        k_shot=self.ds_cfg.get_k_shot(),
-                        k_query=self.ds_cfg.get_k_query(),
-                        task=task
-                    )
-                    
-                    for in_e in range(self.inner_epoch):
-                        sp_x, sp_y = sp_x.to(device), sp_y.to(device)
-                        sp_logits = task_model(sp_x)
-                        sp_loss = self.crit(sp_logits, sp_y)
-                        task_optimizer.zero_grad()
-                        sp_loss.backward()
-                        task_optimizer.step()
-                    
-                    qr_x, qr_y = qr_x.to(device), qr_y.to(device)
-                    qr_logits = task_model(qr_x)
-                    qr_loss = self.crit(qr_logits, qr_y)
-                    metaloss += qr_loss.item()
-                    qr_loss.backward()            
-
-                    for w_global, w_local in zip(global_model.parameters(), task_model.parameters()):
-                        if w_global.grad is None:
-                            w_global.grad = w_local.grad
-                        else:
-                            w_global.grad += w_local.grad
-
-                meta_optimizer.step()
-                meta_optimizer.zero_grad()            
-            
-            global_model.eval()
-            with torch.no_grad():
-                test_loss = 0
-                correct = 0
-                total = 0
-                batch_count = 0
-                for test_idx, (test_imgs, test_labels) in enumerate(test_dl):
-                    batch_count = test_idx
-                    test_imgs = test_imgs.to(device)
-                    test_labels = test_labels.to(device)
-                    test_logits = global_model(test_imgs)                
-                
-                    test_loss += self.crit(test_logits, test_labels).item()
-                    _, predicted = test_logits.max(1)
-                    total += test_labels.size(0)
-                    correct += predicted.eq(test_labels).sum().item()
-                    
-            print(f"Epoch: {epoch} - MetaLoss: {metaloss/num_task} - Test Loss: {test_loss/batch_count} - Test Acc: {100*correct/total}%")  
-        
-    def train(self, port=randint(1000, 8000)):
-        raise NotImplementedError()
-        parser = argparse.ArgumentParser()
-        args = parser.parse_args()
+    def make_task_pool(self, inner_loop, device):
+        # tasks are adapted by a persistent pool of forked cpu workers which
+        # read the shared-memory weights and only send back gradients
+        if self.num_proc > 0 and device.type == "cpu":
+            return TaskPool(inner_loop, num_proc=self.num_proc)
+        return nullcontext()
+    
+    def meta_batch(self, inner_loop, data_dict, task_pool=None):
+        if task_pool is not None and not self.vmap:
+            return self.pool_step(task_pool, data_dict)
+        return super().meta_batch(inner_loop, data_dict)
+    
+    def pool_step(self, task_pool, data_dict):
+        with self.profiler.phase("detach"):
+            tasks = [
+                single_task_detach(
+                    batch_dict=data_dict,
+                    k_shot=self.ds_cfg.get_k_shot(),
+                    k_query=self.ds_cfg.get_k_query(),
+                    task=task
+                ) for task in episode_tasks(data_dict)
+            ]
+        
+        # adaptation, query backward and accumulation all run in the pool
+        with self.profiler.phase("pool"):
+            return task_pool(tasks)
+    
+    def task_sampler(self, rank, world_size, start=0):
+        # every item is a (#local task, k_shot + k_query) episode holding only
+        # the classes owned by this rank, so ranks never load each other's tasks
+        train_ds = self.ds_cfg.train_ds
+        batch_size = self.ds_cfg.get_k_shot() + self.ds_cfg.get_k_query()
+        local_cls = torch.arange(train_ds.nt)[rank::world_size, None]
+        return [
+            train_ds.gather(local_cls, torch.arange(begin, begin + batch_size)[None, :])
+            for begin in range(start * batch_size, len(train_ds), batch_size)
+        ]
+    
+    def all_reduce_grads(self, flat, metaloss):
+        # one collective per meta-batch over the flat gradient buffer, the
+        # meta loss rides along in one extra slot
+        packed = torch.cat([flat.grad, flat.grad.new_tensor([metaloss])])
+        dist.all_reduce(packed, op=dist.ReduceOp.SUM)
+        flat.grad.copy_(packed[:-1])
+        return packed[-1].item()
+    
+    def train(self, port=randint(1000, 8000), world_size: int = None, backend: str = None):
+        args = argparse.Namespace()
             
         args.rank = 0
         args.port = port
         args.dist_url = f'tcp://localhost:{port}'
         print(f"PyMel GPT: The experiment is deployed at {args.dist_url}")
         
-        args.world_size = torch.cuda.device_count()
+        if backend is None:
+            backend = 'nccl' if torch.cuda.is_available() else 'gloo'
+        if backend not in ['nccl', 'gloo']:
+            raise ValueError(f"PyMel GPT: backend must be 'nccl' or 'gloo', \
+                but found {backend} instead")
+        args.backend = backend
+        
+        if world_size is None:
+            world_size = len(self.gpus) if backend == 'nccl' else 1
+        args.world_size = world_size
+        
+        if args.world_size > self.ds_cfg.train_ds.nt:
+            raise ValueError(f"PyMel GPT: world_size: {args.world_size} is larger than \
+                the number of tasks: {self.ds_cfg.train_ds.nt}")
         
         mp.spawn(self.main_worker, (args,), nprocs = args.world_size)
         
     def main_worker(self, gpu, args):
-        print("get here")
-        args.rank += gpu
+        rank = args.rank + gpu
 
         dist.init_process_group(
-            backend='nccl', 
+            backend=args.backend, 
             init_method=args.dist_url,
-            world_size=args.world_size, rank=args.rank)
-        
-        torch.cuda.set_device(gpu)
-        torch.backends.cudnn.benchmark = True
-        print("Process Group Init: Done")
-        
-        batch_size = self.ds_cfg.get_k_shot() + self.ds_cfg.get_k_query()
-        assert batch_size % args.world_size == 0
-        assert self.ds_cfg.get_k_shot() % args.world_size == 0
-        assert self.ds_cfg.get_k_query() % args.world_size == 0
-        
-        train_sampler = DistributedSampler(self.ds_cfg.train_ds)
-        test_sampler = DistributedSampler(self.ds_cfg.test_ds)
-        
-        per_device_batch_size = batch_size // args.world_size
-        per_device_k_shot = self.ds_cfg.get_k_shot() // args.world_size
-        per_device_k_query = self.ds_cfg.get_k_query() // args.world_size
-        
-        train_dl = DataLoader(
-            dataset=self.ds_cfg.train_ds, 
-            batch_size=per_device_batch_size, 
-            num_workers=self.ds_cfg.get_wk(), 
-            pin_memory=self.ds_cfg.get_pin_mem(), 
-            sampler=train_sampler
+            world_size=args.world_size, rank=rank)
+        
+        if args.backend == 'nccl':
+            torch.cuda.set_device(gpu)
+            torch.backends.cudnn.benchmark = True
+            device = torch.device("cuda", index=gpu)
+        else:
+            torch.set_num_threads(max(1, os.cpu_count() // args.world_size))
+            device = torch.device("cpu")
+        
+        if rank == 0:
+            print(self.describe() + f" - world size: {args.world_size} ({args.backend})")
+        
+        evaluator = Evaluator(
+            criterion=self.crit,
+            batch_size=self.ds_cfg.get_test_bs(),
+            num_worker=self.ds_cfg.get_wk(),
+            pin_memory=self.ds_cfg.get_pin_mem()
         )
         
-        test_dl = DataLoader(
-            dataset=self.ds_cfg.test_ds,
-            batch_size=1,
-            num_workers=self.ds_cfg.get_wk(), 
-            pin_memory=self.ds_cfg.get_pin_mem(),
-            sampler=test_sampler
-        )
-        print("Data Loader Setup: Done")
+        global_model = self.model.to(device)
         
-        global_model = self.model.cuda(gpu)
-        global_model = nn.SyncBatchNorm.convert_sync_batchnorm(global_model)
-        global_model = torch.compile(model=global_model)
-        global_model = DDP(global_model, device_ids=[gpu])
+        inner_loop = self.build_inner_loop(global_model)
+        self.zero_grad(inner_loop)
         
-        print("Setup Model: Done")
+        # all replicas start from the weights of rank 0, broadcast in place
+        # into the flat weight buffer
+        dist.broadcast(inner_loop.flat.data, src=0)
         
         meta_optimizer = opt_mapping[self.meta_opt](
             global_model.parameters(), 
             lr=self.meta_lr, weight_decay=self.meta_wd
         )
         
+        # every rank reads the same resume state, so replicas stay identical
+        start_epoch, start_step = self.restore(global_model, meta_optimizer)
+        resume_every = self.tr_cfg.get_resume_every()
+        
         num_task = self.ds_cfg.train_ds.nt
-        for epoch in range(self.outer_epoch):
-            train_sampler.set_epoch(epoch)
+        for epoch in range(start_epoch, self.outer_epoch):
             global_model.train()
+            self.ds_cfg.train_ds.set_epoch(epoch)
             
-            for train_idx, data_dict in enumerate(train_dl):
+            train_dl = DataLoader(
+                dataset=self.ds_cfg.train_ds, 
+                batch_size=None, 
+                num_workers=self.ds_cfg.get_wk(), 
+                pin_memory=self.ds_cfg.get_pin_mem(), 
+                sampler=self.task_sampler(rank, args.world_size, start=start_step),
+                collate_fn=EpisodeCollate()
+            )
+            
+            metaloss = 0.0
+            for train_idx, data_dict in enumerate(self.profiler.iterate(train_dl, "data"), start=start_step):
+                with self.profiler.phase("to_device"):
+                    data_dict = tuple(data.to(device) for data in data_dict)
                 
-                metaloss = 0.0
-                for task in data_dict:
-                    task_model = copy.deepcopy(global_model)
-                    task_optimizer = opt_mapping[self.meta_opt](
-                        task_model.parameters(), 
-                        lr=self.sp_lr, weight_decay=self.sp_wd
-                    )
-                    
-                    sp_x, sp_y, qr_x, qr_y = single_task_detach(
-                        batch_dict=data_dict,
-                        k_shot=per_device_k_shot,
-                        k_query=per_device_k_query,
-                        task=task
-                    )
-                    
-                    for in_e in range(self.inner_epochs):
-                        sp_x, sp_y = sp_x.cuda(gpu), sp_y.cuda(gpu)
-                        sp_logits = task_model(sp_x)
-                        sp_loss = self.crit(sp_logits, sp_y)
-                        task_optimizer.zero_grad()
-                        sp_loss.backward()
-                        task_optimizer.step()
-                    
-                    qr_x, qr_y = qr_x.cuda(gpu), qr_y.cuda(gpu)
-                    qr_logits = task_model(qr_x)
-                    qr_loss = self.crit(qr_logits, qr_y)
-                    metaloss += qr_loss.item()
-                    qr_loss.backward()            
-
-                    for w_global, w_local in zip(global_model.parameters(), task_model.parameters()):
-                        if w_global.grad is None:
-                            w_global.grad = w_local.grad
-                        else:
-                            w_global.grad += w_local.grad
-
-                meta_optimizer.step()
-                meta_optimizer.zero_grad()
-            if args.rank == 0:
-                test_sampler.set_epoch(epoch)
-                global_model.eval()
-                with torch.no_grad():
-                    test_loss = 0
-                    correct = 0
-                    total = 0
-                    batch_count = 0
-                    for test_idx, (test_imgs, test_labels) in enumerate(test_dl):
-                        batch_count = test_idx
-                        test_imgs = test_imgs.cuda(gpu)
-                        test_labels = test_labels.cuda(gpu)
-                        test_logits = global_model(test_imgs)                
-                    
-                        test_loss += self.crit(test_logits, test_labels).item()
-                        _, predicted = test_logits.max(1)
-                        total += test_labels.size(0)
-                        correct += predicted.eq(test_labels).sum().item()
-                        
-                print(f"Epoch: {epoch} - MetaLoss: {metaloss/num_task} - Test Loss: {test_loss/batch_count} - Test Acc: {100*correct/total}%")  
-    
-        dist.destroy_process_group()
\ No newline at end of file
+                metaloss = self.meta_batch(inner_loop, data_dict)
+                
+                with self.profiler.phase("all_reduce"):
+                    metaloss = self.all_reduce_grads(inner_loop.flat, metaloss)
+                with self.profiler.phase("meta_step"):
+                    meta_optimizer.step()
+                    self.zero_grad(inner_loop)
+                
+                if rank == 0 and resume_every > 0 and (train_idx + 1) % resume_every == 0:
+                    self.save_resume(global_model, meta_optimizer, epoch, train_idx + 1)
+            start_step = 0
+            
+            if rank == 0:
+                test_loss, test_acc = evaluator(global_model, self.ds_cfg.test_ds, device)
+                log = f"Epoch: {epoch} - MetaLoss: {metaloss/num_task} - Test Loss: {test_loss} - Test Acc: {test_acc}%"
+                
+                if self.ep_eval is not None:
+                    ep_acc, ep_ci = self.ep_eval(inner_loop, device)
+                    log += f" - Episode Acc: {ep_acc:.2f} +- {ep_ci:.2f}%"
+                
+                print(log)
+                
+                if self.tr_cfg.checkpoint():
+                    self.checker(global_model, loss=[test_loss], acc=[test_acc], optimizer=meta_optimizer, epoch=epoch)
+                if resume_every > 0:
+                    self.save_resume(global_model, meta_optimizer, epoch + 1, 0)
+            dist.barrier()
+        
+        if rank == 0 and self.tr_cfg.checkpoint():
+            self.checker.flush()
+        self.export_profile(f"profile_rank{rank}")
+        dist.destroy_process_group()
@@ -1,6 +1,75 @@
 import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+import resource
 
+from pymel.config import DSConfig, TrainConfig
+from core import GradientTrainer
+from utils import InnerLoop, EpisodicEvaluator
 
-class MAML:
-    def __init__(self) -> None:
-        pass
\ No newline at end of file
+import torch
+from torch import nn
+
+
+def peak_memory(device: torch.device) -> Tuple[str, float]:
+    """Log label and peak memory in MB.
+
+    On CUDA this is the allocator peak since the last ``reset_peak_memory_stats``,
+    i.e. of the current epoch. On CPU it is the ``ru_maxrss`` high-water mark of
+    the whole process, which never resets and so also covers every model
+    trained earlier in the same process; the label says so, since the value is
+    not comparable across epochs or runs.
+    """
+    if device.type == "cuda":
+        return "Peak Mem", torch.cuda.max_memory_allocated(device) / 2**20
+    return "Process Peak RSS (lifetime, not per-epoch)", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class MAML(GradientTrainer):
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 1e-4,
+                 sp_opt: str = "sgd",
+                 sp_lr: float = 0.01,
+                 sp_wd: float = 0.0,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 inner_epoch: int = 1,
+                 first_order: bool = False,
+                 grad_checkpoint: bool = False,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        for name, var in zip(
+            ["first_order", "grad_checkpoint"],
+            [first_order, grad_checkpoint]
+        ):
+            if not isinstance(var, bool):
+                raise TypeError(f"PyMel GPT: {name} must be a boolean, \
+                    but found {type(var)} instead")
+
+        self.first_order = first_order
+        self.grad_checkpoint = grad_checkpoint
+        self.method = "fomaml" if first_order else "maml"
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         sp_opt=sp_opt, sp_lr=sp_lr, sp_wd=sp_wd, criterion=criterion,
+                         outer_epoch=outer_epoch, inner_epoch=inner_epoch, episodic_eval=episodic_eval)
+
+    def build_inner_loop(self, model: nn.Module) -> InnerLoop:
+        # in second-order mode the graph runs through every inner step
+        return InnerLoop(
+            model=model,
+            criterion=self.crit,
+            opt=self.sp_opt,
+            lr=self.sp_lr,
+            weight_decay=self.sp_wd,
+            steps=self.inner_epoch,
+            first_order=self.first_order,
+            grad_checkpoint=self.grad_checkpoint
+        )
+
+    def epoch_log(self, model: nn.Module, device: torch.device) -> str:
+        mem_name, mem = peak_memory(device)
+        return f" - Step Time: {1000*self.step_time.avg:.2f}ms - {mem_name}: {mem:.1f}MB"
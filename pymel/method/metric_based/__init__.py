@@ -0,0 +1 @@
+from .protonet import ProtoNet
\ No newline at end of file
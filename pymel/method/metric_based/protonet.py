@@ -0,0 +1,103 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+
+from pymel.config import DSConfig, TrainConfig
+from core import EpisodicTrainer
+from utils import EpisodicEvaluator, EmbeddingCache, prototypes, dist_mapping
+
+import torch
+from torch import nn
+
+
+class ProtoNet(EpisodicTrainer):
+    """Prototypical Networks: the model embeds images, a query is classified
+    by its distance to the mean embedding (prototype) of every support class.
+
+    There is no inner loop. A meta-batch of ``episode_batch`` N-way episodes
+    is embedded with one forward pass, the prototypes of all episodes come
+    from one scatter-mean and the query-to-prototype distances from one
+    batched matmul, so a step has no per-class or per-episode Python loop.
+    ``distance`` is ``"euclidean"`` (squared) or ``"cosine"``, logits are
+    ``-distance / temperature``.
+
+    Episodes are drawn from the training set by an ``EpisodicSampler``
+    (``n_episode`` per epoch, reproducible with ``seed``) and the training
+    loop is the one of ``EpisodicTrainer``. With an
+    ``EmbeddingCache`` over the ``maml=False`` dataset the evaluation
+    episodes index into (same rows, e.g. the same split), the test set is
+    embedded once per evaluation and every episode is only a gather plus the
+    distance kernels.
+
+    Examples::
+        >>> trainer = ProtoNet(ds_cfg, tr_cfg, model=CNN_Mnist((1, 28, 28), 64), gpus=[0],
+        ...                    meta_opt="adam", n_way=5, episode_batch=4, outer_epoch=10,
+        ...                    episodic_eval=EpisodicEvaluator(test_ds, n_way=5, n_episode=1000))
+        >>> trainer.single_train()
+    """
+    method = "protonet"
+
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 1e-4,
+                 distance: str = "euclidean",
+                 temperature: float = 1.0,
+                 n_way: int = 5,
+                 n_episode: int = None,
+                 episode_batch: int = 4,
+                 seed: int = None,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 episodic_eval: EpisodicEvaluator = None,
+                 embedding_cache: EmbeddingCache = None
+                 ) -> None:
+        if distance not in dist_mapping:
+            raise ValueError(f"PyMel GPT: distance must be one of {list(dist_mapping.keys())}, \
+                but found {distance} instead")
+
+        if not isinstance(temperature, float):
+            raise TypeError(f"PyMel GPT: temperature must be a float, \
+                but found {type(temperature)} instead")
+
+        self.distance = distance
+        self.dist = dist_mapping[distance]
+        self.temperature = temperature
+        self.emb_cache = embedding_cache
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         n_way=n_way, n_episode=n_episode, episode_batch=episode_batch, seed=seed,
+                         criterion=criterion, outer_epoch=outer_epoch, episodic_eval=episodic_eval)
+
+    def describe(self) -> str:
+        return super().describe() + f" - distance: {self.distance}"
+
+    def episode_logits(self, model: nn.Module, x: torch.Tensor, k_shot: int) -> torch.Tensor:
+        """Query logits ``(#episode, n_way * k_query, n_way)`` of a ``(#episode, n_way, k_shot + k_query, ...)`` batch."""
+        n_episode, n_way, n_sample = x.shape[:3]
+        return self.embedding_logits(model(x.flatten(0, 2)).view(n_episode, n_way, n_sample, -1), k_shot)
+
+    def embedding_logits(self, emb: torch.Tensor, k_shot: int) -> torch.Tensor:
+        """Query logits of already embedded ``(#episode, n_way, k_shot + k_query, D)`` episodes."""
+        n_way = emb.shape[1]
+        sp_emb = emb[:, :, :k_shot].flatten(1, 2)
+        qr_emb = emb[:, :, k_shot:].flatten(1, 2)
+        sp_y = torch.arange(n_way, device=emb.device).repeat_interleave(k_shot)
+        protos = prototypes(sp_emb, sp_y, n_way)
+        return -self.dist(qr_emb, protos) / self.temperature
+
+    def evaluate(self, model: nn.Module, device: torch.device) -> Tuple[float]:
+        if self.emb_cache is not None:
+            # embedded once per model version, episodes only gather rows
+            emb = self.emb_cache(model, device)
+            episodes = self.ep_eval.episodes()
+            if int(episodes.max()) >= len(emb):
+                raise ValueError(f"PyMel GPT: the evaluation episodes index rows up to {int(episodes.max())}, \
+                    but the embedding cache only holds {len(emb)} samples")
+        return super().evaluate(model, device)
+
+    def eval_logits(self, model: nn.Module, episodes: torch.Tensor, device: torch.device) -> torch.Tensor:
+        if self.emb_cache is None:
+            return super().eval_logits(model, episodes, device)
+        return self.embedding_logits(self.emb_cache.lookup(episodes, device), self.ep_eval.ks)
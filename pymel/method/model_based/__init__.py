@@ -0,0 +1 @@
+from .snail import SNAIL, SequenceLearner, pad_episodes
\ No newline at end of file
@@ -0,0 +1,184 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+
+from pymel.config import DSConfig, TrainConfig
+from core import EpisodicTrainer
+from utils import EpisodicEvaluator, squared_euclidean
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+
+def pad_episodes(episodes: List[torch.Tensor], k_shot: int) -> Tuple[torch.Tensor]:
+    """Packs episodes of different sizes into padded support/query batches.
+
+    Every episode is a ``(n_way, k_shot + k_query, ...)`` tensor, ``n_way``
+    and ``k_query`` may differ between episodes. Returns ``(sp_x, sp_y,
+    qr_x, qr_y, sp_valid, qr_valid)`` where ``sp_x`` is ``(#episode,
+    max support, ...)``, labels are positions in the episode and the
+    ``*_valid`` masks are False on padding.
+    """
+    n_sp = [episode.shape[0] * k_shot for episode in episodes]
+    n_qr = [episode.shape[0] * (episode.shape[1] - k_shot) for episode in episodes]
+    shape = episodes[0].shape[2:]
+
+    sp_x = episodes[0].new_zeros(len(episodes), max(n_sp), *shape)
+    qr_x = episodes[0].new_zeros(len(episodes), max(n_qr), *shape)
+    sp_y = torch.zeros(len(episodes), max(n_sp), dtype=torch.int64)
+    qr_y = torch.zeros(len(episodes), max(n_qr), dtype=torch.int64)
+    sp_valid = torch.arange(max(n_sp)) < torch.tensor(n_sp)[:, None]
+    qr_valid = torch.arange(max(n_qr)) < torch.tensor(n_qr)[:, None]
+
+    for idx, episode in enumerate(episodes):
+        n_way = episode.shape[0]
+        sp_x[idx, :n_sp[idx]] = episode[:, :k_shot].flatten(0, 1)
+        qr_x[idx, :n_qr[idx]] = episode[:, k_shot:].flatten(0, 1)
+        sp_y[idx, :n_sp[idx]] = torch.arange(n_way).repeat_interleave(k_shot)
+        qr_y[idx, :n_qr[idx]] = torch.arange(n_way).repeat_interleave(episode.shape[1] - k_shot)
+
+    return sp_x, sp_y, qr_x, qr_y, sp_valid, qr_valid
+
+
+class SequenceLearner(nn.Module):
+    """Reads a whole episode as one sequence of (image, label) tokens.
+
+    Every image is embedded by ``encoder`` (any network mapping a batch of
+    images to ``(N, embed_dim)``) and summed with the embedding of its label;
+    query tokens get the extra "unknown" label ``max_way``. A stack of
+    self-attention layers lets every support token attend to all support
+    tokens and every query token to the support tokens and itself. Queries
+    are then classified by a content-based read of the support memory, as in
+    MANN: the logit of a label is the log-sum of ``exp(-|q - s|^2)`` over the
+    supports holding it, in a learned read space. All queries of all
+    episodes are classified by one forward pass, without gradient steps.
+    There is no positional encoding, the order of the tokens does not matter.
+
+    Episodes of a batch can differ in size, ``sp_valid``/``qr_valid`` mark
+    the real tokens and become the attention padding mask (see
+    ``pad_episodes``). Labels absent from an episode get a ``-inf`` logit.
+
+    Examples::
+        >>> learner = SequenceLearner(CNN_Mnist((1, 28, 28), 64), embed_dim=64, max_way=5)
+        >>> qr_logits = learner(sp_x, sp_y, qr_x)  # (#episode, #query, max_way)
+    """
+    def __init__(self,
+                 encoder: nn.Module,
+                 embed_dim: int = 64,
+                 max_way: int = 5,
+                 n_layer: int = 2,
+                 n_head: int = 4,
+                 ff_dim: int = None,
+                 dropout: float = 0.0) -> None:
+        super().__init__()
+        self.encoder = encoder
+        self.embed_dim = embed_dim
+        self.max_way = max_way
+        # zero-initialized, so training starts from plain image embeddings
+        # and learns how much of the label to write into every token
+        self.label_emb = nn.Embedding(max_way + 1, embed_dim)
+        nn.init.zeros_(self.label_emb.weight)
+        self.attention = nn.TransformerEncoder(
+            nn.TransformerEncoderLayer(
+                d_model=embed_dim, nhead=n_head, dim_feedforward=4 * embed_dim if ff_dim is None else ff_dim,
+                dropout=dropout, batch_first=True
+            ),
+            num_layers=n_layer
+        )
+        self.read = nn.Linear(embed_dim, embed_dim)
+
+    def forward(self,
+                sp_x: torch.Tensor,
+                sp_y: torch.Tensor,
+                qr_x: torch.Tensor,
+                sp_valid: torch.Tensor = None,
+                qr_valid: torch.Tensor = None) -> torch.Tensor:
+        n_episode, n_sp, n_qr = sp_x.shape[0], sp_x.shape[1], qr_x.shape[1]
+
+        # one encoder call over every image of every episode
+        emb = self.encoder(torch.cat([sp_x.flatten(0, 1), qr_x.flatten(0, 1)])).view(-1, self.embed_dim)
+        emb = torch.cat([
+            emb[:n_episode * n_sp].view(n_episode, n_sp, -1), emb[n_episode * n_sp:].view(n_episode, n_qr, -1)
+        ], dim=1)
+        labels = torch.cat([sp_y, sp_y.new_full((n_episode, n_qr), self.max_way)], dim=1)
+        tokens = emb + self.label_emb(labels)
+
+        # supports see the supports, a query sees the supports and itself
+        length = n_sp + n_qr
+        pos = torch.arange(length, device=tokens.device)
+        attn_mask = ~((pos[None, :] < n_sp) | (pos[:, None] == pos[None, :]))
+
+        padding_mask = None
+        if sp_valid is not None or qr_valid is not None:
+            sp_valid = torch.ones(n_episode, n_sp, dtype=torch.bool, device=tokens.device) if sp_valid is None else sp_valid
+            qr_valid = torch.ones(n_episode, n_qr, dtype=torch.bool, device=tokens.device) if qr_valid is None else qr_valid
+            padding_mask = ~torch.cat([sp_valid, qr_valid], dim=1)
+
+        out = self.attention(tokens, mask=attn_mask, src_key_padding_mask=padding_mask)
+
+        # content-based read of the support memory: the logit of a label is
+        # the log of the summed similarity to the supports holding it
+        read = self.read(out)
+        scores = -squared_euclidean(read[:, n_sp:], read[:, :n_sp])
+        label_mask = F.one_hot(sp_y, self.max_way).bool()
+        if sp_valid is not None:
+            label_mask &= sp_valid[..., None]
+        scores = scores[..., None].masked_fill(~label_mask[:, None], float("-inf"))
+        return scores.logsumexp(dim=2)
+
+
+class SNAIL(EpisodicTrainer):
+    """Model-based meta-learner: adaptation is a forward pass of a ``SequenceLearner``.
+
+    In the spirit of SNAIL and MANN, the support set is read as a sequence
+    instead of being fitted with gradient steps. A meta-batch of
+    ``episode_batch`` N-way episodes drawn by an ``EpisodicSampler`` is
+    packed into one token batch, scored with one forward pass and trained
+    end to end on the query cross-entropy. At test time an episode costs a
+    single forward pass, which makes it the lowest-latency learner here.
+
+    The training and evaluation loops are the ones of ``EpisodicTrainer``.
+
+    Examples::
+        >>> learner = SequenceLearner(CNN_Mnist((1, 28, 28), 64), embed_dim=64, max_way=5)
+        >>> trainer = SNAIL(ds_cfg, tr_cfg, model=learner, gpus=[0], meta_opt="adam", n_way=5,
+        ...                 episodic_eval=EpisodicEvaluator(test_ds, n_way=5, n_episode=1000))
+        >>> trainer.single_train()
+    """
+    method = "snail"
+
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: SequenceLearner = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 1e-4,
+                 n_way: int = 5,
+                 n_episode: int = None,
+                 episode_batch: int = 4,
+                 seed: int = None,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        if not isinstance(model, SequenceLearner):
+            raise TypeError(f"PyMel GPT: model must be a SequenceLearner, \
+                but found {type(model)} instead")
+
+        for name, way in zip(
+            ["n_way", "episodic_eval.n_way"],
+            [n_way, n_way if episodic_eval is None else episodic_eval.nw]
+        ):
+            if way > model.max_way:
+                raise ValueError(f"PyMel GPT: {name}: {way} is larger than the model's max_way: {model.max_way}")
+
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         n_way=n_way, n_episode=n_episode, episode_batch=episode_batch, seed=seed,
+                         criterion=criterion, outer_epoch=outer_epoch, episodic_eval=episodic_eval)
+
+    def episode_logits(self, model: SequenceLearner, x: torch.Tensor, k_shot: int) -> torch.Tensor:
+        """Query logits ``(#episode, n_way * k_query, max_way)`` of a ``(#episode, n_way, k_shot + k_query, ...)`` batch."""
+        n_episode, n_way = x.shape[:2]
+        sp_y = torch.arange(n_way, device=x.device).repeat_interleave(k_shot).expand(n_episode, -1)
+        return model(x[:, :, :k_shot].flatten(1, 2), sp_y, x[:, :, k_shot:].flatten(1, 2))
@@ -0,0 +1,2 @@
+from .reptile import Reptile
+from .metasgd import MetaSGD, MetaSGDLearner
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+
+from pymel.config import DSConfig, TrainConfig
+from core import GradientTrainer
+from utils import InnerLoop, EpisodicEvaluator
+
+import torch
+from torch import nn
+
+
+class MetaSGDLearner(nn.Module):
+    """A model together with the per-parameter inner learning rates of Meta-SGD.
+
+    ``lr`` is one flat ``(numel,)`` parameter laid out like the model's
+    ``FlatParams`` buffer and initialised to ``init_lr``. Being part of the
+    module it is trained by the meta optimizer and saved with the weights.
+    """
+    def __init__(self, model: nn.Module, init_lr: float = 0.01) -> None:
+        super().__init__()
+        param = next(model.parameters())
+        self.model = model
+        self.lr = nn.Parameter(torch.full(
+            (sum(p.numel() for p in model.parameters()),), init_lr, dtype=param.dtype, device=param.device
+        ))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model(x)
+
+
+class MetaSGD(GradientTrainer):
+    """Meta-SGD: MAML whose inner step ``theta - lr * grad`` uses a learned
+    learning rate for every single weight.
+
+    The model is wrapped into a ``MetaSGDLearner`` and both the weights and
+    the flat learning-rate vector are meta-trained. Inner steps run on the
+    shared ``InnerLoop`` engine, where the per-parameter update is one
+    vector op over the flat weights. With ``first_order`` the inner
+    gradients are treated as constants, the learning rates still receive
+    their meta-gradient through the update. ``vmap`` adapts the whole
+    meta-batch in one ``InnerLoop.adapt_batch`` call.
+
+    Examples::
+        >>> trainer = MetaSGD(ds_cfg, tr_cfg, model=CNN_Mnist((1, 28, 28), 10), gpus=[0],
+        ...                   meta_opt="adam", sp_lr=0.01, inner_epoch=1)
+        >>> trainer.single_train()
+    """
+    method = "metasgd"
+
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = None,
+                 meta_lr: float = 0.001,
+                 meta_wd: float = 0.0,
+                 sp_opt: str = "sgd",
+                 sp_lr: float = 0.01,
+                 sp_wd: float = 0.0,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 inner_epoch: int = 1,
+                 first_order: bool = False,
+                 vmap: bool = False,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        for name, var in zip(["first_order", "vmap"], [first_order, vmap]):
+            if not isinstance(var, bool):
+                raise TypeError(f"PyMel GPT: {name} must be a boolean, \
+                    but found {type(var)} instead")
+
+        self.first_order = first_order
+        self.vmap = vmap
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         sp_opt=sp_opt, sp_lr=sp_lr, sp_wd=sp_wd, criterion=criterion,
+                         outer_epoch=outer_epoch, inner_epoch=inner_epoch, episodic_eval=episodic_eval)
+
+        if not isinstance(self.model, MetaSGDLearner):
+            self.model = MetaSGDLearner(self.model, init_lr=sp_lr)
+
+    def build_inner_loop(self, learner: MetaSGDLearner) -> InnerLoop:
+        return InnerLoop(
+            model=learner.model,
+            criterion=self.crit,
+            opt=self.sp_opt,
+            lr=learner.lr,
+            weight_decay=self.sp_wd,
+            steps=self.inner_epoch,
+            first_order=self.first_order
+        )
+
+    def zero_grad(self, inner_loop):
+        # the learning rates get their own flat gradient next to the weights'
+        inner_loop.flat.zero_grad()
+        if inner_loop.lr.grad is None:
+            inner_loop.lr.grad = torch.zeros_like(inner_loop.lr)
+        else:
+            inner_loop.lr.grad.zero_()
+
+    def meta_inputs(self, inner_loop, params):
+        return (params, inner_loop.lr)
+
+    def accumulate(self, inner_loop, grads):
+        w_grad, lr_grad = grads
+        inner_loop.flat.grad.add_(w_grad)
+        inner_loop.lr.grad.add_(lr_grad)
+
+    def epoch_log(self, learner: MetaSGDLearner, device: torch.device) -> str:
+        return f" - Mean LR: {learner.lr.mean().item():.4g}"
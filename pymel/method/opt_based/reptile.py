@@ -0,0 +1,85 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-1]))
+from typing import *
+
+from pymel.config import DSConfig, TrainConfig
+from core import GradientTrainer
+from utils import EpisodicEvaluator
+from dataset.utils import single_task_detach, episode_tasks
+
+import torch
+from torch import nn
+
+
+class Reptile(GradientTrainer):
+    """Reptile: every task is adapted with plain first-order steps and the
+    weights are moved towards the mean of the adapted weights.
+
+    There is no query backward pass. Each task runs ``inner_epoch`` in-place
+    steps of ``InnerLoop.fit`` on one flat copy of the weights, so memory
+    stays at a single model copy whatever the number of inner steps. The
+    adapted copies are summed into the flat gradient buffer, which is
+    turned into ``theta - mean(phi)`` in place; a meta optimizer step with
+    ``meta_opt="sgd"`` is then exactly the Reptile interpolation
+    ``theta + meta_lr * (mean(phi) - theta)``. The reported meta loss is
+    the query loss of the adapted weights.
+
+    Examples::
+        >>> trainer = Reptile(ds_cfg, tr_cfg, model=CNN_Mnist((1, 28, 28), 10), gpus=[0],
+        ...                   meta_opt="sgd", meta_lr=0.1, sp_opt="adam", sp_lr=0.001, inner_epoch=50)
+        >>> trainer.single_train()
+    """
+    method = "reptile"
+
+    def __init__(self, ds_cfg: DSConfig, tr_cfg: TrainConfig,
+                 model: nn.Module = None, gpus: List[int] = ...,
+                 meta_opt: str = "sgd",
+                 meta_lr: float = 0.1,
+                 meta_wd: float = 0.0,
+                 sp_opt: str = "sgd",
+                 sp_lr: float = 0.01,
+                 sp_wd: float = 0.0,
+                 criterion: torch.nn.Module = nn.CrossEntropyLoss(),
+                 outer_epoch: int = 100,
+                 inner_epoch: int = 10,
+                 episodic_eval: EpisodicEvaluator = None
+                 ) -> None:
+        super().__init__(ds_cfg, tr_cfg, model, gpus,
+                         meta_opt=meta_opt, meta_lr=meta_lr, meta_wd=meta_wd,
+                         sp_opt=sp_opt, sp_lr=sp_lr, sp_wd=sp_wd, criterion=criterion,
+                         outer_epoch=outer_epoch, inner_epoch=inner_epoch, episodic_eval=episodic_eval)
+
+    def meta_batch(self, inner_loop, data_dict, task_pool=None):
+        return self.reptile_step(inner_loop, data_dict)
+
+    def reptile_step(self, inner_loop, data_dict):
+        # adapts the tasks of the meta-batch one by one and turns the flat
+        # gradient buffer into the Reptile direction theta - mean(phi)
+        weights = inner_loop.flat.data
+        phi_sum = inner_loop.flat.grad
+        tasks = episode_tasks(data_dict)
+
+        metaloss = 0.0
+        for task in tasks:
+            with self.profiler.phase("detach"):
+                sp_x, sp_y, qr_x, qr_y = single_task_detach(
+                    batch_dict=data_dict,
+                    k_shot=self.ds_cfg.get_k_shot(),
+                    k_query=self.ds_cfg.get_k_query(),
+                    task=task
+                )
+
+            with self.profiler.phase("adapt"):
+                fast = inner_loop.fit(weights, sp_x, sp_y)
+
+            with self.profiler.phase("query"):
+                with torch.no_grad():
+                    metaloss += inner_loop.loss(fast, qr_x, qr_y).item()
+
+            with self.profiler.phase("accumulate"):
+                phi_sum.add_(fast)
+
+        with self.profiler.phase("interpolate"):
+            phi_sum.div_(-len(tasks)).add_(weights)
+
+        return metaloss
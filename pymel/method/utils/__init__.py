@@ -1,2 +1,10 @@
 from .avgmeter import AverageMeter
-from .checkpoint import ModelCheckPoint
\ No newline at end of file
+from .checkpoint import ModelCheckPoint, save_sharded, load_sharded
+from .flat_params import FlatParams
+from .inner_loop import InnerLoop, fopt_mapping
+from .evaluator import Evaluator
+from .episodic_eval import EpisodicEvaluator
+from .task_pool import TaskPool
+from .profiler import PhaseProfiler
+from .distance import prototypes, squared_euclidean, cosine_distance, dist_mapping
+from .embedding_cache import EmbeddingCache
\ No newline at end of file
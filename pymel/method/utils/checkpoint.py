@@ -1,17 +1,125 @@
 from typing import Any
 from typing import *
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import os
+import shutil
 import numpy as np
 import torch
 from torch import nn
 
 
+def cpu_snapshot(obj: Any) -> Any:
+    """Recursively copies every tensor of a (nested) state dict to cpu."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    elif isinstance(obj, dict):
+        return {key : cpu_snapshot(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(cpu_snapshot(value) for value in obj)
+    return obj
+
+def atomic_save(obj: Any, path: str) -> None:
+    """``torch.save`` into a temporary file renamed over ``path``, readers never see a partial file."""
+    torch.save(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+class TensorRef:
+    """Placeholder left in the checkpoint metadata for a tensor stored in a shard."""
+    def __init__(self, shard: int, key: str) -> None:
+        self.shard = shard
+        self.key = key
+
+def save_sharded(state: Dict[str, Any], ckpt_dir: str, shard_size: int = 2**26) -> None:
+    """Writes ``state`` as ``meta.pt`` plus tensor shards of about ``shard_size`` bytes.
+
+    The directory is built next to ``ckpt_dir`` and swapped in with renames,
+    an interrupted save leaves the previous checkpoint loadable.
+    """
+    shards = [{}]
+    shard_bytes = [0]
+
+    def _split(obj):
+        if isinstance(obj, torch.Tensor):
+            nbytes = obj.numel() * obj.element_size()
+            if obj.untyped_storage().nbytes() != nbytes:
+                # torch.save writes whole storages, views are compacted first
+                obj = obj.clone()
+            if shard_bytes[-1] > 0 and shard_bytes[-1] + nbytes > shard_size:
+                shards.append({})
+                shard_bytes.append(0)
+            key = str(len(shards[-1]))
+            shards[-1][key] = obj
+            shard_bytes[-1] += nbytes
+            return TensorRef(len(shards) - 1, key)
+        elif isinstance(obj, dict):
+            return {key : _split(value) for key, value in obj.items()}
+        elif isinstance(obj, (list, tuple)):
+            return type(obj)(_split(value) for value in obj)
+        return obj
+
+    meta = _split(state)
+
+    tmp_dir, old_dir = ckpt_dir + ".tmp", ckpt_dir + ".old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for idx, shard in enumerate(shards):
+        torch.save(shard, tmp_dir + f"/shard_{idx:04d}.pt")
+    torch.save({"num_shard" : len(shards), "state" : meta}, tmp_dir + "/meta.pt")
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(ckpt_dir):
+        os.replace(ckpt_dir, old_dir)
+    os.replace(tmp_dir, ckpt_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def load_sharded(ckpt_dir: str, mmap: bool = True) -> Dict[str, Any]:
+    """Loads a ``save_sharded`` checkpoint, shards are memory-mapped instead of read."""
+    if not os.path.exists(ckpt_dir + "/meta.pt") and os.path.exists(ckpt_dir + ".old/meta.pt"):
+        ckpt_dir = ckpt_dir + ".old"
+    if not os.path.exists(ckpt_dir + "/meta.pt"):
+        raise FileNotFoundError(f"PyMel GPT: no checkpoint found at {ckpt_dir}")
+
+    meta = torch.load(ckpt_dir + "/meta.pt", weights_only=False)
+    shards = [
+        torch.load(ckpt_dir + f"/shard_{idx:04d}.pt", mmap=mmap, map_location="cpu", weights_only=True)
+        for idx in range(meta["num_shard"])
+    ]
+
+    def _join(obj):
+        if isinstance(obj, TensorRef):
+            return shards[obj.shard][obj.key]
+        elif isinstance(obj, dict):
+            return {key : _join(value) for key, value in obj.items()}
+        elif isinstance(obj, (list, tuple)):
+            return type(obj)(_join(value) for value in obj)
+        return obj
+
+    return _join(meta["state"])
+
+
+
 class ModelCheckPoint:
-    def __init__(self, 
+    """Saves the best and/or last training state.
+
+    The best state goes to ``best.{ext}``. The last state goes to
+    ``last.{ext}``, or with ``keep_last > 1`` to ``last_{epoch}.{ext}``
+    files of which only the newest ``keep_last`` are kept.
+
+    With ``async_save`` the state dicts are snapshotted to cpu on the
+    calling thread and written by a background thread, so training only
+    waits for disk I/O when the previous write is still in flight. Call
+    ``flush`` before reading the files or exiting.
+    """
+    def __init__(self,
                  save_dir:str = None,
                  extension:str = "pt",
                  save_last: bool = False,
-                 save_best: bool = True) -> None:
-        
+                 save_best: bool = True,
+                 async_save: bool = False,
+                 keep_last: int = 1) -> None:
+
         if save_dir is None:
             raise ValueError(f"save_dir cannot be None")
         elif not isinstance(save_dir, str):
@@ -19,7 +127,7 @@ class ModelCheckPoint:
                 but found {type(save_dir)} instead")
         else:
             self.sv = save_dir
-            
+
         if extension is None:
             raise ValueError(f"extension cannot be None")
         elif not isinstance(extension, str):
@@ -30,64 +138,139 @@ class ModelCheckPoint:
                 but found {extension} instead")
         else:
             self.ext = extension
-            
-        for saven, save_type in zip(["save_last", "save_best"], [save_last, save_best]):
+
+        for saven, save_type in zip(
+            ["save_last", "save_best", "async_save"],
+            [save_last, save_best, async_save]
+        ):
             if not isinstance(save_type, bool):
                 raise TypeError(f"{saven} must be a boolean, \
                     but found {type(save_type)} instead")
-        
+
+        if not isinstance(keep_last, int):
+            raise TypeError(f"keep_last must be an int, \
+                but found {type(keep_last)} instead")
+        elif keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, \
+                but found {keep_last} instead")
+
         self.sv_best = save_best
         self.sv_last = save_last
-        
+        self.async_save = async_save
+        self.keep_last = keep_last
+
         self.old_loss = 1e26
         self.old_acc = 0
-    
-    def __call__(self, 
-                 model: nn.Module, 
-                 loss: List[float] or Dict[str, float] = None, 
-                 acc: List[float] or Dict[str, float] = None, 
-                 optimizer: torch.optim = None, 
+
+        self.last_paths = deque()
+        self._executor = None
+        self._future = None
+
+    def __getstate__(self):
+        # the writer thread cannot cross process boundaries (mp.spawn)
+        self.flush()
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_future"] = None
+        return state
+
+    def set_save_dir(self, save_dir: str) -> None:
+        self.flush()
+        self.sv = save_dir
+
+    def last_path(self, epoch: int) -> str:
+        if self.keep_last == 1:
+            return self.sv + f"/last.{self.ext}"
+        return self.sv + f"/last_{epoch}.{self.ext}"
+
+    def write(self, state: Dict[str, Any], save_best: bool, save_last: bool) -> None:
+        if save_best:
+            atomic_save(state, self.sv + f"/best.{self.ext}")
+        if save_last:
+            path = self.last_path(state["epoch"])
+            atomic_save(state, path)
+
+            if path not in self.last_paths:
+                self.last_paths.append(path)
+            while len(self.last_paths) > self.keep_last:
+                stale = self.last_paths.popleft()
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Runs ``fn(*args)`` on the writer thread, or inline without ``async_save``."""
+        if not self.async_save:
+            fn(*args)
+            return
+
+        self.flush()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = self._executor.submit(fn, *args)
+
+    def save_resume(self, state: Dict[str, Any]) -> None:
+        """Saves a resumable training state as a sharded checkpoint in ``{save_dir}/resume``."""
+        if self.async_save:
+            state = cpu_snapshot(state)
+        self.submit(save_sharded, state, self.sv + "/resume")
+
+    def flush(self) -> None:
+        """Blocks until the in-flight write (if any) is on disk, re-raising its error."""
+        if self._future is not None:
+            future, self._future = self._future, None
+            future.result()
+
+    wait = flush
+
+    def close(self) -> None:
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __call__(self,
+                 model: nn.Module,
+                 loss: List[float] or Dict[str, float] = None,
+                 acc: List[float] or Dict[str, float] = None,
+                 optimizer: torch.optim = None,
                  epoch: int = None,
                  *args: Any, **kwds: Any) -> Any:
-        if not isinstance(loss, list):
-            raise TypeError(f"loss must be a list, but found {type(loss)}, instead")
-        if not isinstance(acc, list):
-            raise TypeError(f"acc must be a list, but found {type(acc)}, instead")
-        
         for metric_name, metric_data in zip(["loss", "acc"], [loss, acc]):
-            if metric_data is not None:
-                metric_val_lst = list(metric_data.values) if isinstance(metric_data, dict) else metric_data
-                if np.sum(
-                    np.array([
-                        isinstance(x, int) or isinstance(x, float) or isinstance(x) 
-                        for x in metric_val_lst
-                    ])
-                ) > 0:
-                    raise ValueError(f"There are some elements that is not support type\
-                        (int, float) in metric {metric_name} list")
-                    
-        loss_val_lst = list(loss.values) if isinstance(loss, dict) else loss
-        acc_val_lst = list(acc.values) if isinstance(acc, dict) else acc
+            if not isinstance(metric_data, (list, dict)):
+                raise TypeError(f"{metric_name} must be a list or a dict, \
+                    but found {type(metric_data)}, instead")
+
+            metric_val_lst = list(metric_data.values()) if isinstance(metric_data, dict) else metric_data
+            if not all(isinstance(x, (int, float)) for x in metric_val_lst):
+                raise ValueError(f"There are some elements that is not support type\
+                    (int, float) in metric {metric_name} list")
+
+        loss_val_lst = list(loss.values()) if isinstance(loss, dict) else loss
+        acc_val_lst = list(acc.values()) if isinstance(acc, dict) else acc
         mean_loss = np.mean(np.array(loss_val_lst)).item()
         mean_acc = np.mean(np.array(acc_val_lst)).item()
-        
-        if self.sv_best:
-            if mean_loss < self.old_loss and mean_acc < self.old_acc:
-                self.old_loss = mean_loss
-                self.old_acc = mean_acc
-            
-                torch.save({
-                    'epoch': epoch,
-                    'model_state_dict': model.state_dict(),
-                    'optimizer_state_dict': optimizer.state_dict(),
-                    'loss': loss,
-                    'acc' : acc
-                }, self.sv + f"/best.{self.ext}")
-        if self.sv_last:
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'loss': loss,
-                'acc' : acc
-            }, self.sv + f"/best.{self.ext}")
\ No newline at end of file
+
+        # higher accuracy wins, the loss breaks ties
+        save_best = self.sv_best and (
+            mean_acc > self.old_acc or (mean_acc == self.old_acc and mean_loss < self.old_loss)
+        )
+        if save_best:
+            self.old_loss = mean_loss
+            self.old_acc = mean_acc
+
+        if not (save_best or self.sv_last):
+            return
+
+        state = {
+            'epoch': epoch,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict() if optimizer is not None else None,
+            'loss': loss,
+            'acc' : acc
+        }
+
+        # the snapshot is taken before waiting so that the caller can keep
+        # mutating the weights, at most one write is in flight
+        if self.async_save:
+            state = cpu_snapshot(state)
+        self.submit(self.write, state, save_best, self.sv_last)
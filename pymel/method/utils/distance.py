@@ -0,0 +1,33 @@
+from typing import *
+import torch
+from torch.nn import functional as F
+
+
+def prototypes(support: torch.Tensor, labels: torch.Tensor, n_way: int) -> torch.Tensor:
+    """Class means of a batch of support embeddings with a single scatter.
+
+    ``support`` is ``(*, n_support, D)`` and ``labels`` the matching
+    ``(*, n_support)`` int64 labels in ``0..n_way-1`` (or ``(n_support,)``,
+    shared by every episode). Returns the ``(*, n_way, D)`` prototypes.
+    """
+    index = labels.expand(support.shape[:-1])[..., None].expand_as(support)
+    out = support.new_zeros(*support.shape[:-2], n_way, support.shape[-1])
+    return out.scatter_reduce(-2, index, support, reduce="mean", include_self=False)
+
+def squared_euclidean(query: torch.Tensor, protos: torch.Tensor) -> torch.Tensor:
+    """``(*, Q, D)`` x ``(*, W, D)`` -> ``(*, Q, W)`` squared euclidean distances.
+
+    Expanded as ``|q|^2 - 2 q.p + |p|^2`` so the whole meta-batch costs one
+    batched matmul instead of materializing ``(*, Q, W, D)`` differences.
+    """
+    sq = query.pow(2).sum(-1, keepdim=True) + protos.pow(2).sum(-1).unsqueeze(-2)
+    return (sq - 2 * query @ protos.transpose(-1, -2)).clamp_min(0)
+
+def cosine_distance(query: torch.Tensor, protos: torch.Tensor) -> torch.Tensor:
+    """``(*, Q, D)`` x ``(*, W, D)`` -> ``(*, Q, W)`` cosine distances ``1 - cos``."""
+    return 1 - F.normalize(query, dim=-1) @ F.normalize(protos, dim=-1).transpose(-1, -2)
+
+dist_mapping = {
+    'euclidean' : squared_euclidean,
+    'cosine' : cosine_distance
+}
@@ -0,0 +1,102 @@
+from typing import *
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+
+class EmbeddingCache:
+    """Embeddings of a whole ``maml=False`` dataset, recomputed only when the model changes.
+
+    One pass over ``dataset`` fills a contiguous ``(N, D)`` matrix (float16
+    by default) whose row ``i`` is the embedding of sample ``i``, so
+    evaluation episodes given as row-index tables become a gather and a
+    distance computation. The cache is keyed by the model's version: the
+    identity of the model and the in-place version counters of all its
+    parameters and buffers, which every optimizer step and
+    ``load_state_dict`` bump. Within an evaluation pass the embeddings are
+    computed once however many episodes are scored.
+
+    With ``memmap_path`` the matrix lives in a memory-mapped ``.npy`` file
+    instead of memory.
+
+    Examples::
+        >>> emb_cache = EmbeddingCache(test_ds, batch_size=1000)
+        >>> emb = emb_cache(model, device)            # (N, D), embedded once per model version
+        >>> episode_emb = emb_cache.lookup(episodes)   # (*episodes.shape, D) float32
+    """
+    def __init__(self,
+                 dataset: Dataset = None,
+                 batch_size: int = 1000,
+                 num_worker: int = 0,
+                 pin_memory: bool = False,
+                 dtype: torch.dtype = torch.float16,
+                 memmap_path: str = None) -> None:
+        for name, var in zip(["batch_size", "num_worker"], [batch_size, num_worker]):
+            if not isinstance(var, int):
+                raise TypeError(f"PyMel GPT: {name} must be an int, \
+                    but found {type(var)} instead")
+
+        self.ds = dataset
+        self.bs = batch_size
+        self.wk = num_worker
+        self.pm = pin_memory
+        self.dtype = dtype
+        self.memmap_path = memmap_path
+        self.version = None
+        self.emb = None
+        self.builds = 0
+
+    def model_version(self, model: nn.Module) -> Tuple[int]:
+        return (id(model),) + tuple(
+            t._version for t in list(model.parameters()) + list(model.buffers())
+        )
+
+    def build(self, model: nn.Module, device: torch.device) -> torch.Tensor:
+        test_dl = DataLoader(dataset=self.ds, batch_size=self.bs, num_workers=self.wk, pin_memory=self.pm)
+
+        was_training = model.training
+        model.eval()
+
+        emb, offset = None, 0
+        with torch.no_grad():
+            for test_imgs, _ in test_dl:
+                out = model(test_imgs.to(device, non_blocking=True)).flatten(1).to(self.dtype)
+
+                if emb is None:
+                    shape = (len(self.ds), out.shape[1])
+                    if self.memmap_path is not None:
+                        emb = torch.from_numpy(np.lib.format.open_memmap(
+                            self.memmap_path, mode="w+",
+                            dtype=torch.empty((), dtype=self.dtype).numpy().dtype, shape=shape
+                        ))
+                    else:
+                        emb = torch.empty(shape, dtype=self.dtype, device=device)
+
+                emb[offset:offset + len(out)] = out.to(emb.device)
+                offset += len(out)
+
+        model.train(was_training)
+        self.builds += 1
+        return emb
+
+    def __call__(self, model: nn.Module, device: torch.device) -> torch.Tensor:
+        """Returns the ``(N, D)`` embedding matrix of ``model``, rebuilding it if the model changed."""
+        version = self.model_version(model)
+        if self.emb is None or version != self.version:
+            self.emb = None
+            self.emb = self.build(model, device)
+            self.version = version
+        return self.emb
+
+    def lookup(self, index: torch.Tensor, device: torch.device = None) -> torch.Tensor:
+        """float32 embeddings of the row indices ``index``, shape ``index.shape + (D,)``."""
+        device = self.emb.device if device is None else device
+        return self.emb[index.to(self.emb.device)].to(device=device, dtype=torch.float32)
+
+    def __len__(self) -> int:
+        return 0 if self.emb is None else len(self.emb)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(size={len(self)}, dtype={self.dtype}, " \
+            f"memmap_path={self.memmap_path}, builds={self.builds})"
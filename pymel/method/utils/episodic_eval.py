@@ -0,0 +1,141 @@
+import os, sys
+sys.path.append("/".join(os.path.dirname(__file__).split("/")[:-2]))
+from typing import *
+import math
+import torch
+import torch.multiprocessing as mp
+
+from dataset.utils import EpisodicSampler, EpisodeCollate
+
+# set right before the pool forks so that workers inherit the evaluator, the
+# dataset and the model instead of receiving pickled copies
+_POOL_STATE = None
+
+
+def _pool_init():
+    torch.set_num_threads(1)
+
+def _pool_run(chunk):
+    evaluator, inner_loop, device = _POOL_STATE
+    return evaluator.run_episodes(inner_loop, chunk, device)
+
+
+class EpisodicEvaluator:
+    """Few-shot evaluation over thousands of sampled test episodes.
+
+    Every episode is an N-way task whose classes are relabelled ``0..N-1``.
+    The model is adapted on the support set with the trainer's
+    ``InnerLoop`` and scored on the query set. ``episode_batch`` episodes
+    are adapted together with ``InnerLoop.adapt_batch`` and chunks of
+    episodes can additionally be spread over ``num_proc`` forked processes.
+
+    The sampled episode index table is saved to ``cache_path`` and reused,
+    so repeated evaluations see exactly the same episodes.
+
+    Examples::
+        >>> ep_eval = EpisodicEvaluator(test_ds, n_way=5, n_episode=2000, seed=0)
+        >>> acc, ci95 = ep_eval(inner_loop, device)
+    """
+    def __init__(self,
+                 dataset = None,
+                 n_way: int = 5,
+                 k_shot: int = None,
+                 k_query: int = None,
+                 n_episode: int = 1000,
+                 episode_batch: int = 10,
+                 seed: int = 0,
+                 cache_path: str = None,
+                 num_proc: int = 0) -> None:
+        for name, var in zip(
+            ["n_way", "n_episode", "episode_batch", "seed", "num_proc"],
+            [n_way, n_episode, episode_batch, seed, num_proc]
+        ):
+            if not isinstance(var, int):
+                raise TypeError(f"PyMel GPT: {name} must be an int, \
+                    but found {type(var)} instead")
+
+        self.ds = dataset
+        self.nw = n_way
+        self.ks = dataset.ks if k_shot is None else k_shot
+        self.kq = dataset.kq if k_query is None else k_query
+        self.ne = n_episode
+        self.eb = episode_batch
+        self.seed = seed
+        self.cache_path = cache_path
+        self.num_proc = num_proc
+        self.collate = EpisodeCollate()
+        self._episodes = None
+
+    def episodes(self) -> torch.Tensor:
+        """Returns the ``(n_episode, n_way, k_shot + k_query)`` episode index table."""
+        if self._episodes is not None:
+            return self._episodes
+
+        key = {
+            "n_way" : self.nw, "k_shot" : self.ks, "k_query" : self.kq,
+            "n_episode" : self.ne, "seed" : self.seed
+        }
+        if self.cache_path is not None and os.path.exists(self.cache_path):
+            cache = torch.load(self.cache_path)
+            if cache["key"] == key:
+                self._episodes = cache["episodes"]
+                return self._episodes
+
+        sampler = EpisodicSampler(
+            self.ds, n_way=self.nw, k_shot=self.ks, k_query=self.kq,
+            n_episode=self.ne, seed=self.seed
+        )
+        self._episodes = torch.stack(list(sampler))
+
+        if self.cache_path is not None:
+            torch.save({"key" : key, "episodes" : self._episodes}, self.cache_path + ".tmp")
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+
+        return self._episodes
+
+    def run_episodes(self, inner_loop, episodes: torch.Tensor, device: torch.device) -> torch.Tensor:
+        """Adapts and scores a chunk of episodes, returns the per-episode accuracies."""
+        params = inner_loop.flat.data.detach()
+        way = torch.arange(self.nw, device=device)
+        sp_y = way.repeat_interleave(self.ks)
+        qr_y = way.repeat_interleave(self.kq)
+
+        accs = []
+        for start in range(0, len(episodes), self.eb):
+            batch = episodes[start:start + self.eb]
+            x = torch.stack([self.collate(self.ds[episode])[0] for episode in batch]).to(device)
+
+            sp_x = x[:, :, :self.ks].flatten(1, 2)
+            qr_x = x[:, :, self.ks:].flatten(1, 2)
+            _, qr_logits = inner_loop.adapt_batch(
+                params, sp_x, sp_y.expand(len(batch), -1), qr_x, qr_y.expand(len(batch), -1)
+            )
+            accs.append(qr_logits.detach().argmax(-1).eq(qr_y).float().mean(-1))
+
+        return torch.cat(accs).cpu()
+
+    def __call__(self, inner_loop, device: torch.device) -> Tuple[float]:
+        """Returns the mean query accuracy in % and the half-width of its 95% CI."""
+        global _POOL_STATE
+
+        episodes = self.episodes()
+        was_training = inner_loop.model.training
+        inner_loop.model.eval()
+
+        if self.num_proc > 0 and device.type == "cpu":
+            chunk_size = math.ceil(len(episodes) / self.num_proc)
+            chunks = [episodes[i:i + chunk_size] for i in range(0, len(episodes), chunk_size)]
+            _POOL_STATE = (self, inner_loop, device)
+            try:
+                with mp.get_context("fork").Pool(self.num_proc, initializer=_pool_init) as pool:
+                    accs = torch.cat(pool.map(_pool_run, chunks))
+            finally:
+                _POOL_STATE = None
+        else:
+            accs = self.run_episodes(inner_loop, episodes, device)
+
+        inner_loop.model.train(was_training)
+
+        mean = accs.mean().item()
+        ci95 = 1.96 * accs.std().item() / math.sqrt(len(accs)) if len(accs) > 1 else 0.0
+        return 100 * mean, 100 * ci95
@@ -0,0 +1,71 @@
+from typing import *
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+
+class Evaluator:
+    """Batched classification evaluation with on-device accumulators.
+
+    Loss and correct counts are summed into device tensors and read back
+    once per call, so a pass over the test set costs one synchronization
+    instead of two ``.item()`` calls per batch.
+
+    Examples::
+        >>> evaluator = Evaluator(nn.CrossEntropyLoss(), batch_size=1000)
+        >>> test_loss, test_acc = evaluator(model, test_ds, device)
+    """
+    def __init__(self,
+                 criterion: nn.Module,
+                 batch_size: int = 1000,
+                 num_worker: int = 0,
+                 pin_memory: bool = False,
+                 inference_mode: bool = True) -> None:
+        if not isinstance(batch_size, int):
+            raise TypeError(f"PyMel GPT: batch_size must be an int, \
+                but found {type(batch_size)} instead")
+
+        self.crit = criterion
+        self.bs = batch_size
+        self.wk = num_worker
+        self.pm = pin_memory
+        self.im = inference_mode
+        self.loaders = {}
+
+    def loader(self, dataset: Dataset) -> DataLoader:
+        if id(dataset) not in self.loaders:
+            self.loaders[id(dataset)] = DataLoader(
+                dataset=dataset,
+                batch_size=self.bs,
+                num_workers=self.wk,
+                pin_memory=self.pm,
+            )
+        return self.loaders[id(dataset)]
+
+    def __call__(self,
+                 model: nn.Module,
+                 data: Dataset or DataLoader,
+                 device: torch.device) -> Tuple[float]:
+        """Returns ``(mean loss, accuracy in %)`` of ``model`` over ``data``."""
+        test_dl = data if isinstance(data, DataLoader) else self.loader(data)
+
+        was_training = model.training
+        model.eval()
+
+        loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        correct = torch.zeros((), dtype=torch.int64, device=device)
+        total = 0
+        with torch.inference_mode() if self.im else torch.no_grad():
+            for test_imgs, test_labels in test_dl:
+                test_imgs = test_imgs.to(device, non_blocking=True)
+                test_labels = test_labels.to(device, non_blocking=True)
+                test_logits = model(test_imgs)
+
+                loss_sum += self.crit(test_logits, test_labels) * test_labels.size(0)
+                correct += test_logits.argmax(1).eq(test_labels).sum()
+                total += test_labels.size(0)
+
+        model.train(was_training)
+
+        loss_sum, correct = torch.stack([loss_sum, correct.to(loss_sum.dtype)]).tolist()
+        return loss_sum / max(total, 1), 100 * correct / max(total, 1)
@@ -0,0 +1,99 @@
+from typing import *
+import torch
+from torch import nn
+
+
+class FlatParams:
+    """All parameters of a model packed into one contiguous ``(numel,)`` buffer.
+
+    The parameters are re-pointed to views of ``data``, so the buffer always
+    holds the current weights (optimizer steps and ``load_state_dict`` write
+    through the views) and whole-model updates such as an interpolation or a
+    per-parameter learning-rate step are single vector ops on it.
+    ``unflatten`` turns any ``(numel,)`` tensor, e.g. fast weights, back into
+    the ``{name: view}`` dict taken by ``torch.func.functional_call`` and
+    ``set_grad`` binds a flat gradient to the parameters' ``.grad``.
+
+    ``zero_grad`` does the same for the persistent flat gradient buffer
+    ``grad``: accumulating a task's meta-gradient is then a single ``add_``
+    and averaging, clipping or an all-reduce act on one tensor. Use it in
+    place of ``optimizer.zero_grad``, which would unbind the views.
+
+    The model must already live on its final device, moving it afterwards
+    re-allocates the parameters and unbinds them from the buffer.
+
+    Examples::
+        >>> flat = FlatParams(model)
+        >>> out = functional_call(model, flat.unflatten(flat.data - lr * grad), (x,))
+        >>> flat.zero_grad()
+        >>> flat.grad.add_(task_grad)  # (numel,), every p.grad is a view of flat.grad
+        >>> optimizer.step()
+    """
+    def __init__(self, model: nn.Module) -> None:
+        named = list(model.named_parameters())
+        if len(named) == 0:
+            raise ValueError(f"PyMel GPT: the model has no parameters to flatten")
+
+        self.names = [name for name, _ in named]
+        self.params = [param for _, param in named]
+        self.shapes = [param.shape for param in self.params]
+        self.numels = [param.numel() for param in self.params]
+        self.numel = sum(self.numels)
+        self.grad = None
+
+        base = self.params[0]
+        for name, param in named:
+            if param.dtype != base.dtype or param.device != base.device:
+                raise ValueError(f"PyMel GPT: all parameters must share one dtype and device, \
+                    but found {name} on {param.device} ({param.dtype}) instead of {base.device} ({base.dtype})")
+
+        if self.is_flat():
+            # already views of one buffer (an earlier FlatParams or
+            # ``vector_to_parameters``), the buffer is reused as is
+            self.data = base.detach().new_empty(0).set_(base.untyped_storage(), 0, (self.numel,))
+        else:
+            self.data = torch.cat([param.detach().reshape(-1) for param in self.params])
+            for param, view in zip(self.params, self.views(self.data)):
+                param.data = view
+
+    def is_flat(self) -> bool:
+        """True if the parameters are, in order, contiguous views covering one storage."""
+        storage = self.params[0].untyped_storage()
+        offset = 0
+        for param, numel in zip(self.params, self.numels):
+            if param.untyped_storage().data_ptr() != storage.data_ptr() \
+                    or param.storage_offset() != offset or not param.is_contiguous():
+                return False
+            offset += numel
+        return storage.nbytes() == self.numel * self.params[0].element_size()
+
+    def views(self, flat: torch.Tensor) -> List[torch.Tensor]:
+        """Per-parameter views of a ``(numel,)`` tensor, differentiable and vmap-friendly."""
+        return [t.view(shape) for t, shape in zip(flat.split(self.numels), self.shapes)]
+
+    def unflatten(self, flat: torch.Tensor) -> Dict[str, torch.Tensor]:
+        return dict(zip(self.names, self.views(flat)))
+
+    def flatten(self, tensors: Iterable[torch.Tensor]) -> torch.Tensor:
+        return torch.cat([t.reshape(-1) for t in tensors])
+
+    def set_grad(self, flat_grad: torch.Tensor) -> None:
+        """Points every ``param.grad`` at its slice of ``flat_grad``, no copy is made."""
+        for param, grad in zip(self.params, self.views(flat_grad)):
+            param.grad = grad
+
+    def zero_grad(self) -> torch.Tensor:
+        """Zeroes the flat ``grad`` buffer, allocated on first use, and binds every ``param.grad`` to it."""
+        if self.grad is None:
+            self.grad = torch.zeros_like(self.data)
+        else:
+            self.grad.zero_()
+        self.set_grad(self.grad)
+        return self.grad
+
+    def __len__(self) -> int:
+        return self.numel
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(#param={len(self.params)}, numel={self.numel}, " \
+            f"dtype={self.data.dtype}, device={self.data.device})"
@@ -0,0 +1,264 @@
+from typing import *
+import torch
+from torch import nn
+from torch.func import functional_call, grad, vmap
+from torch.utils.checkpoint import checkpoint
+
+from .flat_params import FlatParams
+
+
+def sgd_update(params: torch.Tensor,
+               grads: torch.Tensor,
+               state: Dict[str, Any],
+               step: int,
+               weight_decay: float = 0.0,
+               inplace: bool = False,
+               **kwargs) -> torch.Tensor:
+    """Update direction of ``torch.optim.SGD`` without momentum, the step is ``params - lr * direction``.
+
+    ``params`` and ``grads`` are flat ``(numel,)`` buffers. With ``inplace``
+    ``grads`` is reused as the output buffer.
+    """
+    if weight_decay == 0:
+        return grads
+    return grads.add_(params, alpha=weight_decay) if inplace else grads + weight_decay * params
+
+def adam_update(params: torch.Tensor,
+                grads: torch.Tensor,
+                state: Dict[str, Any],
+                step: int,
+                weight_decay: float = 0.0,
+                betas: Tuple[float] = (0.9, 0.999),
+                eps: float = 1e-8,
+                inplace: bool = False,
+                **kwargs) -> torch.Tensor:
+    """Update direction of ``torch.optim.Adam``, moments are kept in ``state``.
+
+    With ``inplace`` the moments are updated in place, which is only valid
+    when no graph runs through them.
+    """
+    beta1, beta2 = betas
+    bias_c1 = 1 - beta1 ** step
+    bias_c2 = 1 - beta2 ** step
+    g = sgd_update(params, grads, state, step, weight_decay=weight_decay, inplace=inplace)
+
+    if inplace:
+        exp_avg = state.setdefault("exp_avg", torch.zeros_like(g)).lerp_(g, 1 - beta1)
+        exp_avg_sq = state.setdefault("exp_avg_sq", torch.zeros_like(g)).mul_(beta2).addcmul_(g, g, value=1 - beta2)
+        denom = exp_avg_sq.sqrt().div_(bias_c2 ** 0.5).add_(eps)
+        return (exp_avg / bias_c1).div_(denom)
+
+    exp_avg = state.get("exp_avg", torch.zeros_like(g))
+    exp_avg_sq = state.get("exp_avg_sq", torch.zeros_like(g))
+    exp_avg = beta1 * exp_avg + (1 - beta1) * g
+    exp_avg_sq = beta2 * exp_avg_sq + (1 - beta2) * g * g
+    state["exp_avg"] = exp_avg
+    state["exp_avg_sq"] = exp_avg_sq
+
+    # sqrt has an infinite derivative at 0 (dead units), which turns the
+    # second-order meta-gradient into nan, so zeros bypass the sqrt
+    nonzero = exp_avg_sq > 0
+    exp_avg_sqrt = torch.where(
+        nonzero, torch.where(nonzero, exp_avg_sq, torch.ones_like(exp_avg_sq)).sqrt(), torch.zeros_like(exp_avg_sq)
+    )
+    denom = exp_avg_sqrt / (bias_c2 ** 0.5) + eps
+    return exp_avg / bias_c1 / denom
+
+fopt_mapping = {
+    'sgd' : sgd_update,
+    'adam' : adam_update
+}
+
+
+class InnerLoop:
+    """Functional task adaptation for gradient-based meta-learners.
+
+    Fast weights are single flat ``(numel,)`` tensors laid out like the
+    model's ``FlatParams`` buffer and evaluated with
+    ``torch.func.functional_call``, so adapting a task neither copies the
+    model nor builds an optimizer, and every inner update is a handful of
+    vector ops over the whole model. With ``first_order`` the inner
+    gradients are detached and the meta-gradient is the query gradient
+    w.r.t. the adapted weights, otherwise the whole adaptation stays
+    differentiable.
+
+    ``lr`` is either a float or a learnable ``(numel,)`` tensor of
+    per-parameter learning rates (Meta-SGD), which also receives the
+    meta-gradient. First-order adaptation with a float ``lr`` runs fully
+    in place on one copy of the weights, so its memory does not grow with
+    ``steps`` and ``fit`` can afford hundreds of inner steps (Reptile).
+
+    Examples::
+        >>> inner = InnerLoop(model, nn.CrossEntropyLoss(), opt="adam", lr=0.01, steps=1)
+        >>> params = inner.init_params()
+        >>> fast = inner.adapt(params, sp_x, sp_y)
+        >>> qr_loss = inner.loss(fast, qr_x, qr_y)
+        >>> grads, = torch.autograd.grad(qr_loss, params)  # (numel,)
+    
+    With ``grad_checkpoint`` the activations of every inner step are
+    recomputed during the meta backward pass instead of being kept alive,
+    so second-order memory no longer grows with the number of inner steps.
+    
+    ``adapt_batch`` adapts a whole meta-batch of tasks at once with
+    ``torch.func.vmap``, turning the per-task forward and backward passes
+    into single batched kernels.
+    """
+    def __init__(self,
+                 model: nn.Module,
+                 criterion: nn.Module,
+                 opt: str = "sgd",
+                 lr: float or torch.Tensor = 0.01,
+                 weight_decay: float = 0.0,
+                 steps: int = 1,
+                 first_order: bool = True,
+                 grad_checkpoint: bool = False) -> None:
+        if opt not in fopt_mapping:
+            raise ValueError(f"PyMel GPT: opt must be one of {list(fopt_mapping.keys())}, \
+                but found {opt} instead")
+
+        self.model = model
+        self.flat = FlatParams(model)
+
+        if isinstance(lr, torch.Tensor) and lr.shape != (self.flat.numel,):
+            raise ValueError(f"PyMel GPT: a per-parameter lr must have shape ({self.flat.numel},), \
+                but found {tuple(lr.shape)} instead")
+
+        self.crit = criterion
+        self.opt = opt
+        self.lr = lr
+        self.wd = weight_decay
+        self.steps = steps
+        self.fo = first_order
+        self.gc = grad_checkpoint
+        self.inplace = first_order and not isinstance(lr, torch.Tensor)
+
+    def init_params(self) -> torch.Tensor:
+        """Returns a leaf sharing memory with the model weights that tracks its own gradient."""
+        return self.flat.data.detach().requires_grad_()
+
+    def forward(self, params: torch.Tensor, x: torch.Tensor) -> torch.Tensor:
+        return functional_call(self.model, self.flat.unflatten(params), (x,), strict=False)
+
+    def loss(self, params: torch.Tensor, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        return self.crit(self.forward(params, x), y)
+
+    def step(self,
+             params: torch.Tensor,
+             x: torch.Tensor,
+             y: torch.Tensor,
+             state: Dict[str, Any],
+             step: int) -> torch.Tensor:
+        grads, = torch.autograd.grad(self.loss(params, x, y), params, create_graph=not self.fo)
+        if self.fo:
+            # the direction is a constant, so the fast weights keep an
+            # identity jacobian w.r.t. the initial weights and only a
+            # learnable lr receives a gradient through the update
+            with torch.no_grad():
+                direction = fopt_mapping[self.opt](params, grads, state, step, weight_decay=self.wd)
+        else:
+            direction = fopt_mapping[self.opt](params, grads, state, step, weight_decay=self.wd)
+        return params - self.lr * direction
+
+    def inplace_step(self,
+                     params: torch.Tensor,
+                     x: torch.Tensor,
+                     y: torch.Tensor,
+                     state: Dict[str, Any],
+                     step: int) -> torch.Tensor:
+        grads, = torch.autograd.grad(self.loss(params, x, y), params)
+        with torch.no_grad():
+            params.sub_(
+                fopt_mapping[self.opt](params, grads, state, step, weight_decay=self.wd, inplace=True),
+                alpha=self.lr
+            )
+        return params
+
+    def checkpoint_step(self,
+                        params: torch.Tensor,
+                        x: torch.Tensor,
+                        y: torch.Tensor,
+                        state: Dict[str, Any],
+                        step: int) -> Tuple[torch.Tensor, Dict[str, Any]]:
+        state_names = list(state.keys())
+        new_state_names = []
+        
+        def _step(params, *tensors):
+            new_state = dict(zip(state_names, tensors))
+            new_params = self.step(params, x, y, new_state, step)
+            new_state_names[:] = list(new_state.keys())
+            return (new_params,) + tuple(new_state.values())
+        
+        tensors = checkpoint(_step, params, *state.values(), use_reentrant=False)
+        return tensors[0], dict(zip(new_state_names, tensors[1:]))
+
+    def fit(self, params: torch.Tensor, x: torch.Tensor, y: torch.Tensor, steps: int = None) -> torch.Tensor:
+        """Adapts a detached copy of ``params`` in place for ``steps`` steps and returns it.
+
+        Nothing but the copy and the optimizer state is kept across steps,
+        the result carries no graph.
+        """
+        if not self.inplace:
+            raise ValueError(f"PyMel GPT: in-place adaptation needs a first-order inner loop with a float lr")
+
+        fast = params.detach().clone().requires_grad_()
+        state = {}
+        for step in range(1, (self.steps if steps is None else steps) + 1):
+            self.inplace_step(fast, x, y, state, step)
+        return fast.detach()
+
+    def adapt(self, params: torch.Tensor, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        if self.inplace:
+            # the adapted weights re-enter the graph as a constant offset,
+            # the query gradient w.r.t. params is the first-order meta-gradient
+            fast = self.fit(params, x, y)
+            with torch.no_grad():
+                delta = fast.sub_(params)
+            return params + delta
+
+        state = {}
+        for step in range(1, self.steps + 1):
+            if self.gc:
+                params, state = self.checkpoint_step(params, x, y, state, step)
+            else:
+                params = self.step(params, x, y, state, step)
+        return params
+
+    def task_step(self,
+                  params: torch.Tensor,
+                  x: torch.Tensor,
+                  y: torch.Tensor,
+                  state: Dict[str, Any],
+                  step: int) -> torch.Tensor:
+        # torch.func counterpart of ``step`` which can run under vmap
+        grads = grad(self.loss)(params, x, y)
+        direction = fopt_mapping[self.opt](params, grads, state, step, weight_decay=self.wd)
+        if self.fo:
+            direction = direction.detach()
+        return params - self.lr * direction
+
+    def adapt_task(self,
+                   params: torch.Tensor,
+                   sp_x: torch.Tensor,
+                   sp_y: torch.Tensor,
+                   qr_x: torch.Tensor,
+                   qr_y: torch.Tensor) -> Tuple[torch.Tensor]:
+        state = {}
+        for step in range(1, self.steps + 1):
+            params = self.task_step(params, sp_x, sp_y, state, step)
+        qr_logits = self.forward(params, qr_x)
+        return self.crit(qr_logits, qr_y), qr_logits
+
+    def adapt_batch(self,
+                    params: torch.Tensor,
+                    sp_x: torch.Tensor,
+                    sp_y: torch.Tensor,
+                    qr_x: torch.Tensor,
+                    qr_y: torch.Tensor) -> Tuple[torch.Tensor]:
+        """Adapts ``T`` tasks at once and evaluates them on their query sets.
+
+        ``sp_x``/``qr_x`` have shape ``(T, k, C, H, W)`` and ``sp_y``/``qr_y``
+        shape ``(T, k)``. Returns the per-task query losses ``(T,)`` and the
+        query logits ``(T, k_query, #class)``; the gradient of
+        ``qr_losses.sum()`` w.r.t. ``params`` is the summed meta-gradient.
+        """
+        return vmap(self.adapt_task, in_dims=(None, 0, 0, 0, 0))(params, sp_x, sp_y, qr_x, qr_y)
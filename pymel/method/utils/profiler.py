@@ -0,0 +1,120 @@
+from typing import *
+from contextlib import contextmanager, nullcontext
+import csv
+import json
+import time
+import torch
+from torch.profiler import record_function
+
+from .avgmeter import AverageMeter
+
+
+class PhaseProfiler:
+    """Wall-clock timing of the named phases of a training step.
+
+    Every phase is aggregated in its own ``AverageMeter``. With
+    ``record_ranges`` the phases are also emitted as ``torch.profiler``
+    ranges so they show up in a trace. CUDA is synchronized around each
+    phase when ``cuda_sync`` is set, otherwise asynchronous kernels would
+    be billed to whichever phase happens to wait for them. A disabled
+    profiler hands out a shared no-op context.
+
+    Examples::
+        >>> profiler = PhaseProfiler()
+        >>> for data in profiler.iterate(train_dl, "data"):
+        ...     with profiler.phase("adapt"):
+        ...         fast_params = inner_loop.adapt(params, sp_x, sp_y)
+        >>> profiler.export(exp_dir)
+    """
+    def __init__(self,
+                 enabled: bool = True,
+                 record_ranges: bool = False,
+                 cuda_sync: bool = torch.cuda.is_available()) -> None:
+        for name, var in zip(
+            ["enabled", "record_ranges", "cuda_sync"],
+            [enabled, record_ranges, cuda_sync]
+        ):
+            if not isinstance(var, bool):
+                raise TypeError(f"PyMel GPT: {name} must be a boolean, \
+                    but found {type(var)} instead")
+
+        self.enabled = enabled
+        self.record_ranges = record_ranges
+        self.cuda_sync = cuda_sync
+        self.meters = {}
+        self._null = nullcontext()
+
+    def reset(self) -> None:
+        self.meters = {}
+
+    def update(self, name: str, seconds: float) -> None:
+        if name not in self.meters:
+            self.meters[name] = AverageMeter()
+        self.meters[name].update(seconds)
+
+    @contextmanager
+    def _phase(self, name: str):
+        with record_function(name) if self.record_ranges else self._null:
+            if self.cuda_sync:
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                if self.cuda_sync:
+                    torch.cuda.synchronize()
+                self.update(name, time.perf_counter() - start)
+
+    def phase(self, name: str):
+        """Context manager timing the enclosed block as ``name``."""
+        if not self.enabled:
+            return self._null
+        return self._phase(name)
+
+    def iterate(self, iterable: Iterable, name: str = "data") -> Iterator:
+        """Yields from ``iterable`` while timing every ``next`` call as ``name``."""
+        if not self.enabled:
+            yield from iterable
+            return
+
+        iterator = iter(iterable)
+        while True:
+            with record_function(name) if self.record_ranges else self._null:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                self.update(name, time.perf_counter() - start)
+            yield item
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        total = sum(meter.sum for meter in self.meters.values())
+        return {
+            name : {
+                "count" : meter.count,
+                "avg_ms" : 1000 * meter.avg,
+                "total_s" : meter.sum,
+                "share" : meter.sum / total if total > 0 else 0.0
+            } for name, meter in self.meters.items()
+        }
+
+    def export(self, save_dir: str, name: str = "profile") -> Dict[str, Dict[str, float]]:
+        """Writes the summary to ``{save_dir}/{name}.json`` and ``{save_dir}/{name}.csv``."""
+        summary = self.summary()
+
+        with open(save_dir + f"/{name}.json", "w") as f:
+            json.dump(summary, f, indent=4)
+
+        with open(save_dir + f"/{name}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["phase", "count", "avg_ms", "total_s", "share"])
+            for phase, stats in summary.items():
+                writer.writerow([phase] + [stats[key] for key in ["count", "avg_ms", "total_s", "share"]])
+
+        return summary
+
+    def __repr__(self) -> str:
+        return " - ".join(
+            f"{name}: {stats['avg_ms']:.2f}ms" for name, stats in self.summary().items()
+        )
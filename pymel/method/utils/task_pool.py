@@ -0,0 +1,105 @@
+from typing import *
+import math
+import os
+import torch
+import torch.multiprocessing as mp
+
+# set while the pool is alive, forked workers reach the inner loop (and
+# through it the shared-memory model) without it ever being pickled
+_POOL_STATE = None
+
+
+def _pool_init(num_threads):
+    torch.set_num_threads(num_threads)
+
+def _pool_run(chunk):
+    inner_loop = _POOL_STATE
+    params = inner_loop.init_params()
+
+    loss_sum = 0.0
+    grads_sum = None
+    for sp_x, sp_y, qr_x, qr_y in chunk:
+        fast_params = inner_loop.adapt(params, sp_x, sp_y)
+        qr_loss = inner_loop.loss(fast_params, qr_x, qr_y)
+        loss_sum += qr_loss.item()
+        task_grad, = torch.autograd.grad(qr_loss, params)
+
+        if grads_sum is None:
+            grads_sum = task_grad
+        else:
+            grads_sum += task_grad
+
+    return loss_sum, grads_sum
+
+
+class TaskPool:
+    """Persistent CPU process pool that adapts the tasks of a meta-batch in parallel.
+
+    The model parameters are moved to shared memory once, so in-place
+    meta-optimizer updates are visible to every worker without resending
+    weights. Each call splits the tasks into ``num_proc`` chunks, every
+    worker adapts its chunk with the trainer's ``InnerLoop`` and sends back
+    only the summed flat query gradient, which is added to the inner loop's
+    flat gradient buffer ``inner_loop.flat.grad``. Only first-order inner
+    loops are supported since the graph cannot cross process boundaries.
+
+    Examples::
+        >>> pool = TaskPool(inner_loop, num_proc=8)
+        >>> inner_loop.flat.zero_grad()
+        >>> metaloss = pool(tasks)  # tasks: [(sp_x, sp_y, qr_x, qr_y), ...]
+        >>> meta_optimizer.step()
+        >>> pool.close()
+    """
+    def __init__(self,
+                 inner_loop,
+                 num_proc: int = os.cpu_count(),
+                 num_threads: int = None) -> None:
+        global _POOL_STATE
+
+        if not isinstance(num_proc, int) or num_proc < 1:
+            raise ValueError(f"PyMel GPT: num_proc must be a positive int, \
+                but found {num_proc} instead")
+
+        if not inner_loop.fo:
+            raise ValueError(f"PyMel GPT: TaskPool only supports first-order inner loops")
+
+        if next(inner_loop.model.parameters()).device.type != "cpu":
+            raise ValueError(f"PyMel GPT: TaskPool only runs models on cpu")
+
+        self.inner_loop = inner_loop
+        self.num_proc = num_proc
+        self.num_threads = max(1, os.cpu_count() // num_proc) if num_threads is None else num_threads
+
+        inner_loop.model.share_memory()
+        _POOL_STATE = inner_loop
+        self.pool = mp.get_context("fork").Pool(
+            num_proc, initializer=_pool_init, initargs=(self.num_threads,)
+        )
+
+    def __call__(self, tasks: List[Tuple[torch.Tensor]]) -> float:
+        """Adapts ``tasks``, accumulates their meta-gradient and returns the summed query loss."""
+        chunk_size = math.ceil(len(tasks) / self.num_proc)
+        chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+        if self.inner_loop.flat.grad is None:
+            self.inner_loop.flat.zero_grad()
+
+        metaloss = 0.0
+        for loss_sum, grads_sum in self.pool.map(_pool_run, chunks):
+            metaloss += loss_sum
+            self.inner_loop.flat.grad.add_(grads_sum)
+
+        return metaloss
+
+    def close(self) -> None:
+        global _POOL_STATE
+
+        self.pool.close()
+        self.pool.join()
+        _POOL_STATE = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,44 @@
+import unittest
+from pymel.bench import compare
+from pymel.bench.suite import result
+
+
+class CompareTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.baseline = {"results" : {
+            "getitem/mnist" : result(2.0, "ms"),
+            "detach/batched" : result(1.0, "ms"),
+            "loader/mnist/w0" : result(100.0, "batch/s", higher_is_better=True),
+            "fsmaml/loop" : result(10.0, "step/s", higher_is_better=True),
+            "setup/mnist" : result(5.0, "ms")
+        }}
+        self.report = {"results" : {
+            "getitem/mnist" : result(1.0, "ms"),
+            "detach/batched" : result(1.5, "ms"),
+            "loader/mnist/w0" : result(200.0, "batch/s", higher_is_better=True),
+            "fsmaml/loop" : result(8.0, "step/s", higher_is_better=True),
+            "fsmaml/vmap" : result(20.0, "step/s", higher_is_better=True)
+        }}
+
+    def test_ratio(self):
+        comparison = compare(self.report, self.baseline)
+
+        # only the metrics present in both reports are compared
+        self.assertEqual(set(comparison), {"getitem/mnist", "detach/batched", "loader/mnist/w0", "fsmaml/loop"})
+        self.assertEqual(comparison["getitem/mnist"], {"value" : 1.0, "baseline" : 2.0, "ratio" : 0.5, "regression" : False})
+        self.assertEqual(comparison["loader/mnist/w0"]["ratio"], 2.0)
+        self.assertAlmostEqual(comparison["fsmaml/loop"]["ratio"], 0.8)
+
+    def test_regression(self):
+        comparison = compare(self.report, self.baseline)
+        self.assertEqual(
+            {name : stats["regression"] for name, stats in comparison.items()},
+            {"getitem/mnist" : False, "detach/batched" : True, "loader/mnist/w0" : False, "fsmaml/loop" : True}
+        )
+
+        # a slowdown within the tolerance is not flagged
+        loose = compare(self.report, self.baseline, tolerance=0.6)
+        self.assertFalse(any(stats["regression"] for stats in loose.values()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,17 @@
+import os
 import unittest
 import random
-from pymel.dataset import MamlMnist, MamlKMnist
+import tempfile
+import torch
+from torchvision import transforms
+from pymel.dataset import MamlMnist, MamlKMnist, SyntheticMamlDataset
+from pymel.dataset.utils import EpisodeCollate, episode_tasks, single_task_detach, detach, LRUCache
+from pymel.dataset.utils import EpisodicSampler, TensorCache, BatchCompose, BatchToTensor, BatchNormalize, \
+    BatchRandomHorizontalFlip, BatchRandomCrop
+from PIL import Image
+from pymel.method.utils import ModelCheckPoint, save_sharded, load_sharded
+from pymel.bench.data import write_omniglot, BenchOmniglot
+import numpy as np
 
 
 class CVDSTest(unittest.TestCase):
@@ -36,5 +47,352 @@ class CVDSTest(unittest.TestCase):
             
             self.assertEqual(tuple(sample_img.shape), self.data[dataset]["imgs"])
 
+
+class SyntheticDSTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cfg = {
+            "n_class" : 7,
+            "n_sample" : 23,
+            "img_shape" : (3, 12, 12),
+            "k_shot" : 2,
+            "k_query" : 3
+        }
+        torch.manual_seed(0)
+        self.ml = SyntheticMamlDataset(**self.cfg)
+        torch.manual_seed(0)
+        self.lazy = SyntheticMamlDataset(lazy=True, **self.cfg)
+        self.nml = SyntheticMamlDataset(maml=False, **self.cfg)
+    
+    def test_return(self):
+        ml_sample = self.ml[random.randint(0, len(self.ml) - 1)]
+        
+        self.assertIsInstance(ml_sample, dict)
+        self.assertEqual(len(list(ml_sample.keys())), self.cfg["n_class"])
+        self.assertEqual(len(self.ml) % (self.cfg["k_shot"] + self.cfg["k_query"]), 0)
+        
+        sample_img = ml_sample[random.randint(0, self.cfg["n_class"] - 1)]
+        
+        self.assertEqual(tuple(sample_img.shape), self.cfg["img_shape"])
+        self.assertEqual(sample_img.dtype, torch.uint8)
+    
+    def test_lazy(self):
+        self.assertIsNone(self.lazy.data)
+        
+        index = random.randint(0, len(self.ml) - 1)
+        for _cls in range(self.cfg["n_class"]):
+            self.assertTrue(torch.equal(self.ml[index][_cls], self.lazy[index][_cls]))
+    
+    def test_epoch(self):
+        # every epoch covers every sample of every class, in a new order
+        first = self.ml.idx_ds
+        self.ml.set_epoch(1)
+        second = self.ml.idx_ds
+        
+        self.assertEqual(tuple(first.shape), (self.cfg["n_class"], len(self.ml)))
+        self.assertFalse(torch.equal(first, second))
+        for _cls in range(self.cfg["n_class"]):
+            for table in (first, second):
+                self.assertTrue(torch.equal(
+                    table[_cls, :self.cfg["n_sample"]].sort().values, self.ml.cls_idx[self.ml.cls_off[_cls]:self.ml.cls_off[_cls + 1]].sort().values
+                ))
+        
+        self.ml.set_epoch(0)
+        self.assertTrue(torch.equal(first, self.ml.idx_ds))
+    
+    def test_episode(self):
+        sampler = EpisodicSampler(self.ml, n_way=3, seed=0)
+        episode = self.ml[next(iter(sampler))]
+        
+        self.assertEqual(len(episode), 3)
+        for _cls, imgs in episode.items():
+            self.assertEqual(
+                tuple(imgs.shape), (self.cfg["k_shot"] + self.cfg["k_query"],) + self.cfg["img_shape"]
+            )
+    
+    def test_classification(self):
+        self.assertEqual(len(self.nml), self.cfg["n_class"] * self.cfg["n_sample"])
+        
+        index = random.randint(0, len(self.nml) - 1)
+        img, target = self.nml[index]
+        
+        self.assertEqual(target, index // self.cfg["n_sample"])
+        self.assertTrue(torch.equal(img, self.ml.data[index]))
+
+class TensorCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.raw = torch.randint(0, 256, (50, 1, 12, 12), dtype=torch.uint8)
+        self.transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.5,), (0.5,))])
+    
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+    
+    def test_cache(self):
+        cache = TensorCache(self.transform, dtype=torch.float32)
+        path = os.path.join(self.tmp.name, f"{cache.signature}.npy")
+        cache.open(path, len(self.raw), lambda rows: self.raw[rows], mode="L", chunk_size=16)
+        
+        index = torch.tensor([[3, 7], [49, 0]])
+        expected = self.raw[index].float().div(255).sub(0.5).div(0.5)
+        self.assertEqual(len(cache), len(self.raw))
+        self.assertTrue(torch.allclose(cache(index), expected, atol=1e-6))
+        
+        # a different transform is stored under a different signature
+        other = TensorCache(transforms.Compose([transforms.ToTensor()]), dtype=torch.float32)
+        self.assertNotEqual(cache.signature, other.signature)
+    
+    def test_rest(self):
+        flip = transforms.Compose(self.transform.transforms + [transforms.RandomHorizontalFlip(p=1.0)])
+        cache = TensorCache(flip, dtype=torch.float32)
+        cache.open(os.path.join(self.tmp.name, f"{cache.signature}.npy"), len(self.raw), lambda rows: self.raw[rows], mode="L")
+        
+        self.assertEqual(len(cache.rest), 1)
+        self.assertTrue(torch.allclose(
+            cache(torch.tensor([4])), self.raw[[4]].float().div(255).sub(0.5).div(0.5).flip(-1), atol=1e-6
+        ))
+    
+    def test_stale(self):
+        cache = TensorCache(self.transform, dtype=torch.float32)
+        path = os.path.join(self.tmp.name, f"{cache.signature}.npy")
+        expected = self.raw.float().div(255).sub(0.5).div(0.5)
+        
+        # same row count, other sample shape or dtype: rebuilt, not reused
+        for stale in [np.zeros((50, 1, 6, 6), dtype=np.float32), np.zeros((50, 1, 12, 12), dtype=np.float16)]:
+            np.save(path, stale)
+            cache.open(path, len(self.raw), lambda rows: self.raw[rows], mode="L")
+            self.assertEqual(cache.data.shape, (50, 1, 12, 12))
+            self.assertEqual(cache.data.dtype, np.float32)
+            self.assertTrue(torch.allclose(cache(torch.arange(50)), expected, atol=1e-6))
+        self.assertEqual([f for f in os.listdir(self.tmp.name) if f.endswith(".tmp")], [])
+
+class EpisodeCollateTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.classes, self.k_shot, self.k_query = [7, 2, 5], 2, 3
+        # sample value encodes (class, index) so that the layout can be checked
+        self.batch = [
+            {_cls : torch.full((1, 4, 4), _cls * 100 + idx, dtype=torch.float32) for _cls in self.classes}
+            for idx in range(self.k_shot + self.k_query)
+        ]
+    
+    def test_layout(self):
+        for batch in [self.batch, {_cls : torch.stack([s[_cls] for s in self.batch]) for _cls in self.classes}]:
+            x, y = EpisodeCollate()(batch)
+            self.assertEqual(tuple(x.shape), (3, self.k_shot + self.k_query, 1, 4, 4))
+            self.assertEqual(y.tolist(), self.classes)
+            self.assertEqual(episode_tasks((x, y)), self.classes)
+            
+            for pos, _cls in enumerate(self.classes):
+                self.assertEqual(x[pos, :, 0, 0, 0].tolist(), [_cls * 100 + idx for idx in range(5)])
+    
+    def test_batch_transform(self):
+        x, _ = EpisodeCollate(batch_transform=lambda x: x * 2)(self.batch)
+        self.assertEqual(x[1, 3, 0, 0, 0].item(), 2 * 203)
+    
+    def test_detach_views(self):
+        episode = EpisodeCollate()(self.batch)
+        x, y = episode
+        
+        support, query = detach(episode, self.k_shot, self.k_query)
+        self.assertEqual(tuple(support.shape[:2]), (3, self.k_shot))
+        self.assertEqual(tuple(query.shape[:2]), (3, self.k_query))
+        
+        for pos, task in enumerate(self.classes):
+            sp_x, sp_y, qr_x, qr_y = single_task_detach(episode, self.k_shot, self.k_query, task)
+            
+            # support / query sets are slices of the collated tensor, not copies
+            self.assertEqual(sp_x.data_ptr(), x[pos].data_ptr())
+            self.assertEqual(qr_x.data_ptr(), x[pos, self.k_shot].data_ptr())
+            self.assertEqual(sp_x[:, 0, 0, 0].tolist(), [task * 100 + idx for idx in range(self.k_shot)])
+            self.assertEqual(qr_x[:, 0, 0, 0].tolist(), [task * 100 + idx for idx in range(self.k_shot, 5)])
+            self.assertEqual(sp_y.tolist(), [task] * self.k_shot)
+            self.assertEqual(qr_y.tolist(), [task] * self.k_query)
+
+class BatchTransformTest(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.gray = torch.randint(0, 256, (2, 3, 1, 12, 12), dtype=torch.uint8)
+        self.rgb = torch.randint(0, 256, (4, 3, 8, 8), dtype=torch.uint8)
+    
+    def test_to_tensor_normalize(self):
+        for imgs, mode, mean, std in [
+            (self.gray, "L", (0.1307,), (0.3081,)),
+            (self.rgb, "RGB", (0.49, 0.48, 0.45), (0.25, 0.24, 0.26))
+        ]:
+            batch = BatchCompose([BatchToTensor(), BatchNormalize(mean, std)])
+            sample = transforms.Compose([transforms.ToTensor(), transforms.Normalize(mean, std)])
+            
+            expected = torch.stack([
+                sample(Image.fromarray(img.permute(1, 2, 0).squeeze(-1).numpy(), mode=mode))
+                for img in imgs.reshape(-1, *imgs.shape[-3:])
+            ]).view(*imgs.shape)
+            self.assertTrue(torch.equal(batch(imgs), expected))
+    
+    def test_flip(self):
+        x = BatchToTensor()(self.rgb)
+        self.assertTrue(torch.equal(BatchRandomHorizontalFlip(p=1.0)(x), x.flip(-1)))
+        self.assertTrue(torch.equal(BatchRandomHorizontalFlip(p=0.0)(x), x))
+        
+        torch.manual_seed(1)
+        out = BatchRandomHorizontalFlip(p=0.5)(x)
+        flipped = [torch.equal(o, img.flip(-1)) for o, img in zip(out, x)]
+        for o, img, flip in zip(out, x, flipped):
+            self.assertTrue(flip or torch.equal(o, img))
+        self.assertTrue(any(flipped) and not all(flipped))
+    
+    def test_crop(self):
+        x = BatchToTensor()(self.gray)
+        torch.manual_seed(2)
+        out = BatchRandomCrop(6)(x)
+        self.assertEqual(tuple(out.shape), (2, 3, 1, 6, 6))
+        
+        # every crop is a 6x6 window of its own image
+        for o, img in zip(out.reshape(-1, 1, 6, 6), x.reshape(-1, 1, 12, 12)):
+            self.assertTrue(any(
+                torch.equal(o, img[:, top:top + 6, left:left + 6]) for top in range(7) for left in range(7)
+            ))
+        
+        padded = BatchRandomCrop(12, padding=2, fill=-1.0)(x)
+        self.assertEqual(tuple(padded.shape), tuple(x.shape))
+        self.assertTrue(bool(((padded >= 0) & (padded <= 1) | (padded == -1)).all()))
+
+class LRUCacheTest(unittest.TestCase):
+    def test_eviction(self):
+        # every value is 400 bytes, the budget holds three of them
+        cache = LRUCache(max_bytes=1200)
+        for key in "abc":
+            cache.put(key, torch.zeros(100))
+        self.assertEqual(cache.nbytes, 1200)
+        
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("d", torch.zeros(100))
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        
+        # re-putting a key replaces it without evicting anything
+        cache.put("c", torch.ones(100))
+        self.assertEqual(list(cache.entries), ["a", "d", "c"])
+        
+        # values above the budget are returned but never stored
+        big = torch.zeros(400)
+        self.assertIs(cache.put("big", big), big)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNone(cache.get("big"))
+        
+        cache.put("e", torch.zeros(200))
+        self.assertEqual(list(cache.entries), ["c", "e"])
+        self.assertEqual(cache.nbytes, 1200)
+        
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (1, 2, 3))
+        self.assertEqual(stats["entries"], 2)
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3)
+
+class OmniglotCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        write_omniglot(self.tmp.name, n_alphabet=2, n_character=3, n_image=6)
+    
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+    
+    def test_stale_cache(self):
+        ds = BenchOmniglot(root=self.tmp.name, k_shot=2, k_query=2)
+        data_path, index_path = ds.__cache_paths__()
+        expected = np.array(ds.data)
+        del ds
+        
+        # same row count, other image size: must be rebuilt, not reused
+        np.save(data_path, np.zeros((len(expected), 28, 28), dtype=np.uint8))
+        ds = BenchOmniglot(root=self.tmp.name, k_shot=2, k_query=2)
+        self.assertEqual(ds.data.shape, expected.shape)
+        self.assertTrue(np.array_equal(ds.data, expected))
+        self.assertEqual([f for f in os.listdir(self.tmp.name) if f.endswith(".tmp")], [])
+    
+    def test_lazy(self):
+        datasets = []
+        for lazy in [False, True]:
+            torch.manual_seed(0)
+            datasets.append(BenchOmniglot(
+                root=self.tmp.name, k_shot=2, k_query=2, transform=transforms.ToTensor(), lazy=lazy, cache_bytes=2**20
+            ))
+        eager, lazy = datasets
+        self.assertIsNone(lazy.data)
+        
+        for epoch in range(2):
+            eager.set_epoch(epoch)
+            lazy.set_epoch(epoch)
+            for index in range(len(eager)):
+                eager_sample, lazy_sample = eager[index], lazy[index]
+                self.assertEqual(list(eager_sample.keys()), list(lazy_sample.keys()))
+                for _cls in eager_sample:
+                    self.assertTrue(torch.equal(eager_sample[_cls], lazy_sample[_cls]))
+        
+        sampler = EpisodicSampler(eager, n_way=3, k_shot=2, k_query=2, n_episode=4, seed=0)
+        for episode in sampler:
+            eager_episode, lazy_episode = eager[episode], lazy[episode]
+            for _cls in eager_episode:
+                self.assertTrue(torch.equal(eager_episode[_cls], lazy_episode[_cls]))
+        
+        # the second epoch and the episodes only revisit decoded images
+        self.assertEqual(lazy.cache.misses, lazy.cache.stats()["entries"])
+        self.assertGreater(lazy.cache.hits, 0)
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = torch.nn.Linear(4, 3)
+    
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+    
+    def test_sharded(self):
+        weight = torch.randn(64, 64)
+        state = {
+            "epoch" : 3,
+            "model" : {"weight" : weight, "row" : weight[5]},
+            "rng" : (torch.arange(10), [1.5, "a"])
+        }
+        ckpt_dir = os.path.join(self.tmp.name, "resume")
+        save_sharded(state, ckpt_dir, shard_size=2**12)
+        
+        loaded = load_sharded(ckpt_dir)
+        self.assertGreater(len([f for f in os.listdir(ckpt_dir) if f.startswith("shard_")]), 1)
+        self.assertEqual(loaded["epoch"], 3)
+        self.assertTrue(torch.equal(loaded["model"]["weight"], weight))
+        self.assertTrue(torch.equal(loaded["model"]["row"], weight[5]))
+        self.assertTrue(torch.equal(loaded["rng"][0], torch.arange(10)))
+        self.assertEqual(loaded["rng"][1], [1.5, "a"])
+        
+        # a save interrupted between the two renames leaves only the .old copy
+        os.replace(ckpt_dir, ckpt_dir + ".old")
+        self.assertTrue(torch.equal(load_sharded(ckpt_dir)["model"]["weight"], weight))
+        
+        with self.assertRaises(FileNotFoundError):
+            load_sharded(os.path.join(self.tmp.name, "missing"))
+    
+    def test_keep_last(self):
+        checker = ModelCheckPoint(save_dir=self.tmp.name, save_last=True, save_best=False, keep_last=2)
+        for epoch in range(4):
+            checker(self.model, loss=[1.0], acc=[0.5], epoch=epoch)
+        
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["last_2.pt", "last_3.pt"])
+        self.assertEqual(list(checker.last_paths), [self.tmp.name + "/last_2.pt", self.tmp.name + "/last_3.pt"])
+    
+    def test_async_save(self):
+        checker = ModelCheckPoint(save_dir=self.tmp.name, save_best=True, async_save=True)
+        weight = self.model.weight.detach().clone()
+        checker(self.model, loss=[1.0], acc=[0.5], epoch=0)
+        checker.save_resume({"epoch" : 1, "model" : self.model.state_dict()})
+        
+        # the snapshot is taken at call time, later updates are not saved
+        with torch.no_grad():
+            self.model.weight.add_(1.0)
+        checker.flush()
+        
+        best = torch.load(self.tmp.name + "/best.pt", weights_only=False)
+        self.assertEqual(best["epoch"], 0)
+        self.assertTrue(torch.equal(best["model_state_dict"]["weight"], weight))
+        self.assertTrue(torch.equal(load_sharded(self.tmp.name + "/resume")["model"]["weight"], weight))
+        checker.close()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,595 @@
+import copy
+import csv
+import json
+import math
+import os
+import socket
+import tempfile
+import unittest
+import torch
+from torch import nn
+from torch.func import functional_call
+from torch.utils.data import DataLoader
+from pymel.config import DSConfigV2, TrainConfig
+from pymel.method.gradient_based import FSMAML
+from pymel.method.opt_based import Reptile, MetaSGD
+from pymel.method.metric_based import ProtoNet
+from pymel.method.model_based import SNAIL, SequenceLearner, pad_episodes
+from pymel.method.utils import InnerLoop, FlatParams, EpisodicEvaluator, PhaseProfiler, EmbeddingCache, prototypes, squared_euclidean, cosine_distance
+from pymel.dataset import SyntheticMamlDataset
+from pymel.dataset.utils import BatchCompose, BatchToTensor, EpisodeCollate, single_task_detach, episode_tasks
+
+
+class InnerLoopTest(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.model = nn.Sequential(nn.Linear(8, 16), nn.Tanh(), nn.Linear(16, 4))
+        self.crit = nn.CrossEntropyLoss()
+        self.sp_x = torch.randn(3, 10, 8)
+        self.sp_y = torch.randint(0, 4, (3, 10))
+        self.qr_x = torch.randn(3, 6, 8)
+        self.qr_y = torch.randint(0, 4, (3, 6))
+
+    def meta_grad(self, inner_loop, task=0):
+        params = inner_loop.init_params()
+        fast = inner_loop.adapt(params, self.sp_x[task], self.sp_y[task])
+        qr_loss = inner_loop.loss(fast, self.qr_x[task], self.qr_y[task])
+        task_grad, = torch.autograd.grad(qr_loss, params)
+        return qr_loss, task_grad
+
+    def test_adam_fit(self):
+        ref_model = copy.deepcopy(self.model)
+        inner_loop = InnerLoop(self.model, self.crit, opt="adam", lr=0.01, weight_decay=1e-3, steps=5)
+        fast = inner_loop.fit(inner_loop.flat.data, self.sp_x[0], self.sp_y[0])
+
+        optimizer = torch.optim.Adam(ref_model.parameters(), lr=0.01, weight_decay=1e-3)
+        for _ in range(5):
+            optimizer.zero_grad()
+            self.crit(ref_model(self.sp_x[0]), self.sp_y[0]).backward()
+            optimizer.step()
+        expected = torch.cat([p.detach().reshape(-1) for p in ref_model.parameters()])
+
+        self.assertTrue(torch.allclose(fast, expected, rtol=0, atol=6e-8))
+        # fit works on a copy, the model weights are untouched
+        self.assertFalse(torch.equal(inner_loop.flat.data, expected))
+
+    def test_second_order_sgd(self):
+        inner_loop = InnerLoop(self.model, self.crit, opt="sgd", lr=0.1, steps=3, first_order=False)
+        qr_loss, task_grad = self.meta_grad(inner_loop)
+
+        leaves = {name : p.detach().clone().requires_grad_() for name, p in self.model.named_parameters()}
+        fast = dict(leaves)
+        for _ in range(3):
+            loss = self.crit(functional_call(self.model, fast, (self.sp_x[0],)), self.sp_y[0])
+            grads = torch.autograd.grad(loss, list(fast.values()), create_graph=True)
+            fast = {name : p - 0.1 * g for (name, p), g in zip(fast.items(), grads)}
+        expected_loss = self.crit(functional_call(self.model, fast, (self.qr_x[0],)), self.qr_y[0])
+        expected = torch.autograd.grad(expected_loss, list(leaves.values()))
+
+        self.assertTrue(torch.equal(qr_loss, expected_loss))
+        self.assertTrue(torch.equal(task_grad, torch.cat([g.reshape(-1) for g in expected])))
+
+    def test_grad_checkpoint(self):
+        for opt in ["sgd", "adam"]:
+            plain = InnerLoop(self.model, self.crit, opt=opt, lr=0.01, steps=3, first_order=False)
+            ckpt = InnerLoop(self.model, self.crit, opt=opt, lr=0.01, steps=3, first_order=False, grad_checkpoint=True)
+
+            plain_loss, plain_grad = self.meta_grad(plain)
+            ckpt_loss, ckpt_grad = self.meta_grad(ckpt)
+            self.assertTrue(torch.equal(plain_loss, ckpt_loss))
+            self.assertTrue(torch.equal(plain_grad, ckpt_grad))
+
+    def test_vmap(self):
+        for first_order in [True, False]:
+            inner_loop = InnerLoop(self.model, self.crit, opt="adam", lr=0.01, steps=2, first_order=first_order)
+
+            params = inner_loop.init_params()
+            qr_losses, qr_logits = inner_loop.adapt_batch(params, self.sp_x, self.sp_y, self.qr_x, self.qr_y)
+            batch_grad, = torch.autograd.grad(qr_losses.sum(), params)
+            self.assertEqual(tuple(qr_logits.shape), (3, 6, 4))
+
+            loop_losses, loop_grad = [], torch.zeros_like(batch_grad)
+            for task in range(3):
+                qr_loss, task_grad = self.meta_grad(inner_loop, task)
+                loop_losses.append(qr_loss)
+                loop_grad += task_grad
+
+            self.assertTrue(torch.allclose(qr_losses, torch.stack(loop_losses), atol=1e-6))
+            self.assertTrue(torch.allclose(batch_grad, loop_grad, atol=1e-6))
+
+def first_batch(trainer):
+    train_ds = trainer.ds_cfg.train_ds
+    return next(iter(DataLoader(train_ds, batch_size=train_ds.ks + train_ds.kq, collate_fn=EpisodeCollate())))
+
+def task_split(trainer, batch):
+    return [
+        single_task_detach(batch, trainer.ds_cfg.get_k_shot(), trainer.ds_cfg.get_k_query(), task)
+        for task in episode_tasks(batch)
+    ]
+
+def flatten(params):
+    return torch.cat([p.detach().reshape(-1) for p in params])
+
+def unflatten(model, flat):
+    # named views of a flat vector laid out like model.parameters()
+    params, offset = {}, 0
+    for name, p in model.named_parameters():
+        params[name] = flat[offset:offset + p.numel()].view_as(p)
+        offset += p.numel()
+    return params
+
+class ReptileTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def test_direction(self):
+        torch.manual_seed(0)
+        ds_cfg, tr_cfg = synthetic_cfg(self.tmp.name)
+        model = nn.Sequential(nn.Flatten(), nn.Linear(16, 8), nn.Tanh(), nn.Linear(8, 4))
+        trainer = Reptile(ds_cfg, tr_cfg, model=model, gpus=[0], sp_lr=0.1, inner_epoch=3)
+        batch = first_batch(trainer)
+        
+        # every task fitted on its own copy with torch.optim.SGD
+        phis = []
+        for sp_x, sp_y, _, _ in task_split(trainer, batch):
+            task_model = copy.deepcopy(model)
+            optimizer = torch.optim.SGD(task_model.parameters(), lr=0.1)
+            for _ in range(3):
+                optimizer.zero_grad()
+                trainer.crit(task_model(sp_x), sp_y).backward()
+                optimizer.step()
+            phis.append(flatten(task_model.parameters()))
+        theta = flatten(model.parameters())
+        
+        inner_loop = trainer.build_inner_loop(model)
+        trainer.zero_grad(inner_loop)
+        trainer.meta_batch(inner_loop, batch)
+        
+        direction = theta - torch.stack(phis).mean(0)
+        self.assertTrue(torch.allclose(inner_loop.flat.grad, direction, atol=1e-6))
+        self.assertTrue(torch.equal(inner_loop.flat.data, theta))
+        
+        # an sgd meta step is the Reptile interpolation
+        torch.optim.SGD(model.parameters(), lr=0.1).step()
+        self.assertTrue(torch.allclose(inner_loop.flat.data, theta - 0.1 * direction, atol=1e-6))
+
+class MetaSGDTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def test_learned_lr(self):
+        torch.manual_seed(0)
+        ds_cfg, tr_cfg = synthetic_cfg(self.tmp.name)
+        model = nn.Sequential(nn.Flatten(), nn.Linear(16, 8), nn.Tanh(), nn.Linear(8, 4))
+        trainer = MetaSGD(ds_cfg, tr_cfg, model=model, gpus=[0], meta_opt="adam", sp_lr=0.05)
+        learner = trainer.model
+        # distinct rates, so that a mixed-up layout would show
+        with torch.no_grad():
+            learner.lr.uniform_(0.01, 0.1)
+        batch = first_batch(trainer)
+        tasks = task_split(trainer, batch)
+        
+        inner_loop = trainer.build_inner_loop(learner)
+        theta = flatten(model.parameters())
+        lr = learner.lr.detach().clone()
+        
+        # the adapted weights are theta - lr * g
+        sp_x, sp_y, _, _ = tasks[0]
+        leaf = theta.clone().requires_grad_()
+        g, = torch.autograd.grad(trainer.crit(functional_call(model, unflatten(model, leaf), (sp_x,)), sp_y), leaf)
+        fast = inner_loop.adapt(inner_loop.init_params(), sp_x, sp_y)
+        self.assertTrue(torch.allclose(fast, theta - lr * g, atol=1e-6))
+        
+        # the lr vector gets the summed meta-gradient of the query losses
+        expected = torch.zeros_like(lr)
+        for sp_x, sp_y, qr_x, qr_y in tasks:
+            leaf = theta.clone().requires_grad_()
+            lr_leaf = lr.clone().requires_grad_()
+            g, = torch.autograd.grad(
+                trainer.crit(functional_call(model, unflatten(model, leaf), (sp_x,)), sp_y), leaf, create_graph=True
+            )
+            qr_loss = trainer.crit(functional_call(model, unflatten(model, leaf - lr_leaf * g), (qr_x,)), qr_y)
+            expected += torch.autograd.grad(qr_loss, lr_leaf)[0]
+        
+        trainer.zero_grad(inner_loop)
+        trainer.meta_batch(inner_loop, batch)
+        self.assertGreater(learner.lr.grad.abs().sum().item(), 0)
+        self.assertTrue(torch.allclose(learner.lr.grad, expected, atol=1e-6))
+
+class EpisodicEvaluatorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.ds = SyntheticMamlDataset(
+            n_class=6, n_sample=20, img_shape=(1, 4, 4), k_shot=2, k_query=3, batch_transform=BatchToTensor()
+        )
+        model = nn.Sequential(nn.Flatten(), nn.Linear(16, 3))
+        self.inner_loop = InnerLoop(model, nn.CrossEntropyLoss(), opt="sgd", lr=0.1, steps=1)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def evaluator(self, **kwargs):
+        return EpisodicEvaluator(self.ds, n_way=3, n_episode=12, episode_batch=5, seed=3, **kwargs)
+    
+    def test_same_episodes(self):
+        ep_eval = self.evaluator()
+        seen = []
+        run_episodes = ep_eval.run_episodes
+        def record(inner_loop, episodes, device):
+            seen.append(episodes.clone())
+            return run_episodes(inner_loop, episodes, device)
+        ep_eval.run_episodes = record
+        
+        first = ep_eval(self.inner_loop, torch.device("cpu"))
+        second = ep_eval(self.inner_loop, torch.device("cpu"))
+        self.assertEqual(tuple(seen[0].shape), (12, 3, 5))
+        self.assertTrue(torch.equal(seen[0], seen[1]))
+        self.assertEqual(first, second)
+        
+        # a new evaluator reloads the cached episode table instead of resampling
+        cache_path = os.path.join(self.tmp.name, "episodes.pt")
+        cached = self.evaluator(cache_path=cache_path).episodes()
+        torch.manual_seed(1)
+        self.assertTrue(torch.equal(self.evaluator(cache_path=cache_path).episodes(), cached))
+        self.assertTrue(torch.equal(cached, seen[0]))
+    
+    def test_confidence_interval(self):
+        accs = torch.tensor([1.0, 0.8, 0.6, 0.6, 1.0, 0.4, 0.8, 0.2, 0.6, 1.0, 0.8, 0.6])
+        ep_eval = self.evaluator()
+        ep_eval.run_episodes = lambda inner_loop, episodes, device: accs
+        
+        acc, ci95 = ep_eval(self.inner_loop, torch.device("cpu"))
+        self.assertAlmostEqual(acc, 100 * accs.mean().item(), places=4)
+        self.assertAlmostEqual(ci95, 100 * 1.96 * accs.std().item() / math.sqrt(len(accs)), places=4)
+
+def synthetic_cfg(save_dir, n_sample=4, profile=False):
+    """Configs of a 4-class synthetic task set, one meta-batch per epoch by default."""
+    train_ds = SyntheticMamlDataset(
+        n_class=4, n_sample=n_sample, img_shape=(1, 4, 4), k_shot=2, k_query=3, batch_transform=BatchCompose([BatchToTensor()])
+    )
+    test_ds = SyntheticMamlDataset(
+        n_class=4, n_sample=n_sample, img_shape=(1, 4, 4), maml=False, seed=1, batch_transform=BatchCompose([BatchToTensor()])
+    )
+    ds_cfg = DSConfigV2(train_dataset=train_ds, test_dataset=test_ds, num_worker=0, pin_memory=False)
+    tr_cfg = TrainConfig(checkpoint=True, logging=True, save_dir=save_dir, save_best=False, resume_every=1, profile=profile)
+    return ds_cfg, tr_cfg
+
+def synthetic_fsmaml(save_dir, n_sample=4, profile=False, **kwargs):
+    torch.manual_seed(0)
+    ds_cfg, tr_cfg = synthetic_cfg(save_dir, n_sample, profile)
+    model = nn.Sequential(nn.Flatten(), nn.Linear(16, 8), nn.Tanh(), nn.Linear(8, 4))
+    return FSMAML(
+        ds_cfg=ds_cfg, tr_cfg=tr_cfg, model=model, gpus=[0], meta_opt="sgd", sp_opt="sgd",
+        meta_lr=0.1, sp_lr=0.1, outer_epoch=1, **kwargs
+    )
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def save_dir(self, name):
+        path = os.path.join(self.tmp.name, name)
+        os.mkdir(path)
+        return path
+    
+    def test_task_sampler(self):
+        trainer = synthetic_fsmaml(self.save_dir("sampler"), n_sample=10)
+        train_ds = trainer.ds_cfg.train_ds
+        
+        shards = [torch.cat(trainer.task_sampler(rank, 2)) for rank in range(2)]
+        ranks = [set(shard.reshape(-1).tolist()) for shard in shards]
+        self.assertEqual(len(ranks[0] & ranks[1]), 0)
+        self.assertEqual(ranks[0] | ranks[1], set(train_ds.idx_ds.reshape(-1).tolist()))
+        
+        # a rank only loads the classes it owns
+        for rank, shard in enumerate(shards):
+            self.assertEqual(set(train_ds.cls_tgt[shard].reshape(-1).tolist()), {rank, rank + 2})
+    
+    def test_gloo_matches_single(self):
+        single = synthetic_fsmaml(self.save_dir("single"))
+        single.single_train()
+        
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            port = sock.getsockname()[1]
+        distributed = synthetic_fsmaml(self.save_dir("gloo"))
+        distributed.train(port=port, world_size=2, backend="gloo")
+        
+        # rank 0 saved the end-of-epoch resume state of the replicas
+        self.assertEqual(distributed.resume(distributed.tr_cfg.exp_dir), (1, 0))
+        single.resume(single.tr_cfg.exp_dir)
+        single_state, dist_state = single.resume_state["model"], distributed.resume_state["model"]
+        # the spawned ranks train copies, the parent's model keeps the initial weights
+        for name, weight in single_state.items():
+            self.assertFalse(torch.equal(weight, distributed.model.state_dict()[name]))
+            self.assertTrue(torch.allclose(weight, dist_state[name], atol=1e-6))
+
+class TaskPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def test_pool_matches_loop(self):
+        results = []
+        for num_proc in [0, 2]:
+            trainer = synthetic_fsmaml(self.tmp.name, n_sample=10, num_proc=num_proc)
+            train_ds = trainer.ds_cfg.train_ds
+            batch = next(iter(DataLoader(train_ds, batch_size=train_ds.ks + train_ds.kq, collate_fn=EpisodeCollate())))
+            
+            inner_loop = trainer.build_inner_loop(trainer.model)
+            trainer.zero_grad(inner_loop)
+            with trainer.make_task_pool(inner_loop, torch.device("cpu")) as task_pool:
+                self.assertEqual(type(task_pool).__name__, "TaskPool" if num_proc > 0 else "NoneType")
+                metaloss = trainer.meta_batch(inner_loop, batch, task_pool)
+            results.append((metaloss, inner_loop.flat.grad.clone()))
+        
+        (loop_loss, loop_grad), (pool_loss, pool_grad) = results
+        self.assertNotEqual(loop_loss, 0.0)
+        self.assertAlmostEqual(pool_loss, loop_loss, places=5)
+        self.assertTrue(torch.allclose(pool_grad, loop_grad, atol=1e-6))
+
+class PhaseProfilerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+    
+    def test_export(self):
+        profiler = PhaseProfiler(cuda_sync=False)
+        for _ in profiler.iterate(range(3), "data"):
+            with profiler.phase("adapt"):
+                pass
+            for _ in range(2):
+                with profiler.phase("meta_step"):
+                    pass
+        
+        summary = profiler.export(self.tmp.name, "phases")
+        with open(os.path.join(self.tmp.name, "phases.json")) as f:
+            exported = json.load(f)
+        with open(os.path.join(self.tmp.name, "phases.csv")) as f:
+            rows = list(csv.DictReader(f))
+        
+        self.assertEqual(exported, summary)
+        self.assertEqual({name : stats["count"] for name, stats in exported.items()}, {"data" : 3, "adapt" : 3, "meta_step" : 6})
+        for stats in exported.values():
+            self.assertEqual(set(stats), {"count", "avg_ms", "total_s", "share"})
+        self.assertAlmostEqual(sum(stats["share"] for stats in exported.values()), 1.0)
+        self.assertEqual([row["phase"] for row in rows], ["data", "adapt", "meta_step"])
+    
+    def test_disabled(self):
+        profiler = PhaseProfiler(enabled=False, cuda_sync=False)
+        self.assertEqual(list(profiler.iterate(range(3))), [0, 1, 2])
+        with profiler.phase("adapt"):
+            pass
+        self.assertEqual(profiler.meters, {})
+    
+    def test_trainer_profile(self):
+        trainer = synthetic_fsmaml(self.tmp.name, n_sample=9, profile=True)
+        trainer.single_train()
+        
+        with open(trainer.tr_cfg.exp_dir + "/profile.json") as f:
+            exported = json.load(f)
+        # two meta-batches of four tasks
+        self.assertEqual({name : stats["count"] for name, stats in exported.items()}, {
+            "data" : 2, "to_device" : 2, "detach" : 8, "adapt" : 8,
+            "query_backward" : 8, "accumulate" : 8, "meta_step" : 2
+        })
+
+class DistanceTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # two episodes of four 2-d support embeddings
+        self.support = torch.tensor([
+            [[0., 0.], [2., 2.], [4., 0.], [4., 4.]],
+            [[1., 1.], [3., 3.], [0., 4.], [2., 6.]]
+        ])
+    
+    def test_prototypes(self):
+        labels = torch.tensor([[1, 0, 1, 0], [0, 0, 1, 1]])
+        self.assertTrue(torch.equal(prototypes(self.support, labels, 2), torch.tensor([
+            [[3., 3.], [2., 0.]],
+            [[2., 2.], [1., 5.]]
+        ])))
+        
+        # labels shared by every episode
+        shared = prototypes(self.support, torch.tensor([0, 0, 1, 1]), 2)
+        self.assertTrue(torch.equal(shared, torch.tensor([
+            [[1., 1.], [4., 2.]],
+            [[2., 2.], [1., 5.]]
+        ])))
+    
+    def test_distances(self):
+        torch.manual_seed(0)
+        query, protos = torch.randn(2, 6, 8), torch.randn(2, 3, 8)
+        self.assertTrue(torch.allclose(squared_euclidean(query, protos), torch.cdist(query, protos).pow(2), atol=1e-5))
+        self.assertTrue(torch.allclose(
+            cosine_distance(query, protos),
+            1 - torch.nn.functional.cosine_similarity(query[:, :, None], protos[:, None], dim=-1), atol=1e-6
+        ))
+    
+    def test_nearest_prototype(self):
+        ds_cfg, tr_cfg = synthetic_cfg(self.tmp.name)
+        trainer = ProtoNet(ds_cfg, tr_cfg, model=nn.Flatten(), gpus=[0], meta_opt="adam", n_way=3, temperature=0.5)
+        
+        # one 3-way episode, 2 support + 1 query per class; support means
+        # are (0, 0), (10, 0) and (0, 10), the queries sit next to other classes
+        emb = torch.tensor([[
+            [[-1., 0.], [1., 0.], [0., 9.]],
+            [[10., -1.], [10., 1.], [1., 0.]],
+            [[0., 9.], [0., 11.], [9., 1.]]
+        ]])
+        logits = trainer.embedding_logits(emb, k_shot=2)
+        
+        protos = torch.tensor([[0., 0.], [10., 0.], [0., 10.]])
+        self.assertEqual(tuple(logits.shape), (1, 3, 3))
+        self.assertTrue(torch.allclose(logits[0], -torch.cdist(emb[0, :, 2], protos).pow(2) / 0.5, atol=1e-4))
+        self.assertEqual(logits.argmax(-1).tolist(), [[2, 0, 1]])
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.ds = SyntheticMamlDataset(
+            n_class=3, n_sample=7, img_shape=(1, 4, 4), maml=False, batch_transform=BatchCompose([BatchToTensor()])
+        )
+        self.model = nn.Sequential(nn.Flatten(), nn.Linear(16, 5))
+        self.x = torch.stack([self.ds[idx][0] for idx in range(len(self.ds))])
+    
+    def test_version(self):
+        cache = EmbeddingCache(self.ds, batch_size=8, dtype=torch.float32)
+        device = torch.device("cpu")
+        
+        emb = cache(self.model, device)
+        self.assertEqual(tuple(emb.shape), (21, 5))
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(emb, self.model(self.x), atol=1e-6))
+        
+        # an unchanged model reuses the embeddings
+        self.assertIs(cache(self.model, device), emb)
+        self.assertEqual(cache.builds, 1)
+        index = torch.tensor([[4, 20], [0, 4]])
+        self.assertTrue(torch.equal(cache.lookup(index), emb[index]))
+        
+        # an optimizer step bumps the parameter versions and forces a rebuild
+        optimizer = torch.optim.SGD(self.model.parameters(), lr=0.1)
+        self.model(self.x).sum().backward()
+        optimizer.step()
+        rebuilt = cache(self.model, device)
+        self.assertEqual(cache.builds, 2)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(rebuilt, self.model(self.x), atol=1e-6))
+        self.assertFalse(torch.allclose(rebuilt, emb))
+        
+        self.model.load_state_dict(copy.deepcopy(self.model.state_dict()))
+        cache(self.model, device)
+        self.assertEqual(cache.builds, 3)
+
+class SNAILTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        torch.manual_seed(0)
+        self.learner = SequenceLearner(nn.Sequential(nn.Flatten(), nn.Linear(16, 8)), embed_dim=8, max_way=4, n_head=2)
+        # label embeddings start at zero, make them matter
+        nn.init.normal_(self.learner.label_emb.weight)
+        self.learner.eval()
+    
+    def test_pad_episodes(self):
+        # value encodes (episode, class, sample) so that the packing can be checked
+        episodes = [
+            torch.tensor([[100 * ep + 10 * way + idx for idx in range(n_sample)] for way in range(n_way)]).float().view(n_way, n_sample, 1)
+            for ep, (n_way, n_sample) in enumerate([(2, 3), (3, 4)])
+        ]
+        sp_x, sp_y, qr_x, qr_y, sp_valid, qr_valid = pad_episodes(episodes, k_shot=2)
+        
+        self.assertEqual(tuple(sp_x.shape), (2, 6, 1))
+        self.assertEqual(tuple(qr_x.shape), (2, 6, 1))
+        self.assertEqual(sp_x[..., 0].tolist(), [[0, 1, 10, 11, 0, 0], [100, 101, 110, 111, 120, 121]])
+        self.assertEqual(qr_x[..., 0].tolist(), [[2, 12, 0, 0, 0, 0], [102, 103, 112, 113, 122, 123]])
+        self.assertEqual(sp_y.tolist(), [[0, 0, 1, 1, 0, 0], [0, 0, 1, 1, 2, 2]])
+        self.assertEqual(qr_y.tolist(), [[0, 1, 0, 0, 0, 0], [0, 0, 1, 1, 2, 2]])
+        self.assertEqual(sp_valid.tolist(), [[True] * 4 + [False] * 2, [True] * 6])
+        self.assertEqual(qr_valid.tolist(), [[True] * 2 + [False] * 4, [True] * 6])
+    
+    def test_padding(self):
+        small, large = torch.randn(2, 3, 1, 4, 4), torch.randn(3, 4, 1, 4, 4)
+        with torch.no_grad():
+            sp_x, sp_y, qr_x, _, sp_valid, qr_valid = pad_episodes([small, large], k_shot=2)
+            packed = self.learner(sp_x, sp_y, qr_x, sp_valid, qr_valid)
+            
+            alone = pad_episodes([small], k_shot=2)
+            expected = self.learner(alone[0], alone[1], alone[2])
+        
+        # padding neither leaks into the real tokens nor gets a label
+        self.assertEqual(tuple(packed.shape), (2, 6, 4))
+        self.assertTrue(torch.allclose(packed[0, :2], expected[0], atol=1e-5))
+        self.assertTrue(bool(torch.isinf(packed[0, :2, 2:]).all()))
+    
+    def test_query_label(self):
+        ds_cfg, tr_cfg = synthetic_cfg(self.tmp.name)
+        trainer = SNAIL(ds_cfg, tr_cfg, model=self.learner, gpus=[0], meta_opt="adam", n_way=3)
+        
+        x = torch.randn(1, 3, 4, 1, 4, 4)
+        # the query labels are implied by the class row, swapping the first
+        # query of class 0 and of class 1 relabels both
+        relabelled = x.clone()
+        relabelled[0, 0, 2], relabelled[0, 1, 2] = x[0, 1, 2], x[0, 0, 2]
+        
+        # a query never sees the other queries, changing the last one only
+        # changes its own logits
+        changed = x.clone()
+        changed[0, 2, 3] += 1
+        
+        with torch.no_grad():
+            logits = trainer.episode_logits(self.learner, x, k_shot=2)
+            swapped = trainer.episode_logits(self.learner, relabelled, k_shot=2)
+            other = trainer.episode_logits(self.learner, changed, k_shot=2)
+        
+        self.assertEqual(tuple(logits.shape), (1, 6, 4))
+        self.assertTrue(torch.allclose(swapped[0, [2, 1, 0, 3, 4, 5]], logits[0], atol=1e-5))
+        self.assertTrue(torch.allclose(other[0, :5], logits[0, :5], atol=1e-5))
+        self.assertFalse(torch.allclose(other[0, 5], logits[0, 5], atol=1e-5))
+
+class FlatParamsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.model = nn.Sequential(nn.Linear(8, 16), nn.Tanh(), nn.Linear(16, 4))
+        self.x = torch.randn(5, 8)
+        self.weights = flatten(self.model.parameters())
+        self.flat = FlatParams(self.model)
+    
+    def assertViews(self, tensors, flat):
+        offset = 0
+        for t in tensors:
+            self.assertEqual(t.untyped_storage().data_ptr(), flat.untyped_storage().data_ptr())
+            self.assertEqual(t.storage_offset(), offset)
+            offset += t.numel()
+        self.assertEqual(offset, flat.numel())
+    
+    def test_views(self):
+        self.assertTrue(torch.equal(self.flat.data, self.weights))
+        self.assertViews(list(self.model.parameters()), self.flat.data)
+        self.assertTrue(self.flat.is_flat())
+        
+        grad = self.flat.zero_grad()
+        self.assertViews([p.grad for p in self.model.parameters()], grad)
+        
+        # a second FlatParams reuses the buffer instead of copying it
+        self.assertEqual(FlatParams(self.model).data.data_ptr(), self.flat.data.data_ptr())
+    
+    def test_inplace_update(self):
+        out = self.model(self.x)
+        self.flat.data.mul_(0.5)
+        for p, w in zip(self.model.parameters(), self.flat.views(self.weights)):
+            self.assertTrue(torch.equal(p, 0.5 * w))
+        self.assertFalse(torch.allclose(self.model(self.x), out))
+        
+        # optimizer steps and load_state_dict write through the views into the buffer
+        self.flat.zero_grad()
+        self.model(self.x).sum().backward()
+        torch.optim.SGD(self.model.parameters(), lr=0.1).step()
+        self.assertTrue(torch.equal(self.flat.data, flatten(self.model.parameters())))
+        
+        state = copy.deepcopy(self.model).state_dict()
+        self.flat.data.zero_()
+        self.model.load_state_dict(state)
+        self.assertTrue(torch.equal(self.flat.data, flatten(state.values())))
+    
+    def test_zero_grad(self):
+        grad = self.flat.zero_grad()
+        self.model(self.x).sum().backward()
+        self.assertGreater(grad.abs().sum().item(), 0)
+        self.assertTrue(torch.equal(grad, flatten(p.grad for p in self.model.parameters())))
+        
+        self.assertIs(self.flat.zero_grad(), grad)
+        for p in self.model.parameters():
+            self.assertEqual(p.grad.abs().sum().item(), 0)
+        self.assertViews([p.grad for p in self.model.parameters()], grad)
+        
+        # the next backward accumulates into the same buffer
+        self.model(self.x).sum().backward()
+        self.assertGreater(grad.abs().sum().item(), 0)
+
+if __name__ == '__main__':
+    unittest.main()